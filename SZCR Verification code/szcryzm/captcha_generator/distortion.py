@@ -0,0 +1,103 @@
+import threading
+import numpy as np
+from PIL import Image
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+
+class WaveDistortion:
+    """波浪扭曲引擎（按尺寸和参数缓存重映射网格，所有通道一次完成）"""
+
+    _grids = {}
+    _lock = threading.Lock()
+
+    def __init__(self, amplitude_x=1.5, period_x=12.0, amplitude_y=1.0, period_y=15.0):
+        """
+        初始化扭曲引擎
+        :param amplitude_x: 水平方向位移幅度（随行变化）
+        :param period_x: 水平方向位移周期
+        :param amplitude_y: 垂直方向位移幅度（随列变化）
+        :param period_y: 垂直方向位移周期
+        """
+        self.amplitude_x = amplitude_x
+        self.period_x = period_x
+        self.amplitude_y = amplitude_y
+        self.period_y = period_y
+
+    def get_grid(self, width, height):
+        """
+        获取重映射网格（每组(宽, 高, 幅度, 周期)只计算一次）
+        :param width: 图片宽度
+        :param height: 图片高度
+        :return: 网格字典
+        """
+        key = (width, height, self.amplitude_x, self.period_x, self.amplitude_y, self.period_y)
+        grid = self._grids.get(key)
+        if grid is None:
+            with self._lock:
+                grid = self._grids.get(key)
+                if grid is None:
+                    grid = self._build_grid(width, height)
+                    self._grids[key] = grid
+        return grid
+
+    def _build_grid(self, width, height):
+        """计算源坐标以及双线性插值的索引和权重"""
+        x, y = np.meshgrid(np.arange(width), np.arange(height))
+
+        map_x = np.clip(x + self.amplitude_x * np.sin(y / self.period_x), 0, width - 1).astype(np.float32)
+        map_y = np.clip(y + self.amplitude_y * np.cos(x / self.period_y), 0, height - 1).astype(np.float32)
+
+        grid = {'map_x': map_x, 'map_y': map_y}
+
+        if cv2 is None:
+            # 没有OpenCV时预先算好四邻域的平铺索引和权重，运行时只做一次gather
+            x0 = np.floor(map_x).astype(np.intp)
+            y0 = np.floor(map_y).astype(np.intp)
+            x1 = np.minimum(x0 + 1, width - 1)
+            y1 = np.minimum(y0 + 1, height - 1)
+            fx = (map_x - x0).ravel()
+            fy = (map_y - y0).ravel()
+
+            grid['indices'] = np.stack([
+                (y0 * width + x0).ravel(),
+                (y0 * width + x1).ravel(),
+                (y1 * width + x0).ravel(),
+                (y1 * width + x1).ravel(),
+            ])
+            grid['weights'] = np.stack([
+                (1 - fx) * (1 - fy),
+                fx * (1 - fy),
+                (1 - fx) * fy,
+                fx * fy,
+            ]).astype(np.float32)[:, :, None]
+
+        return grid
+
+    def apply(self, image):
+        """
+        应用波浪扭曲
+        :param image: PIL图像或numpy数组
+        :return: 与输入同类型的扭曲结果
+        """
+        is_pil = isinstance(image, Image.Image)
+        img_array = np.asarray(image)
+        rows, cols = img_array.shape[:2]
+        grid = self.get_grid(cols, rows)
+
+        if cv2 is not None:
+            # OpenCV一次调用完成所有通道的双线性重映射
+            distorted = cv2.remap(img_array, grid['map_x'], grid['map_y'], cv2.INTER_LINEAR)
+        else:
+            # 向量化gather：四个邻点同时取值后按权重求和
+            flat = img_array.reshape(rows * cols, -1)
+            samples = flat[grid['indices']].astype(np.float32)
+            samples *= grid['weights']
+            distorted = samples.sum(axis=0)
+            distorted += 0.5
+            distorted = distorted.astype(np.uint8).reshape(img_array.shape)
+
+        return Image.fromarray(distorted) if is_pil else distorted
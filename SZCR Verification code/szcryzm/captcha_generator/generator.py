@@ -1,20 +1,48 @@
 import random
 import string
-from PIL import Image, ImageDraw, ImageFont, ImageFilter
+from PIL import Image, ImageColor, ImageDraw, ImageFont, ImageFilter
 import numpy as np
 import os
 
+from captcha_generator.distortion import WaveDistortion
+from captcha_generator.glyph_cache import GlyphCache
+from captcha_generator import noise
+
+
+def check_seed(seed):
+    """
+    检查批次种子（None或非负整数，SeedSequence不接受负数）
+    :param seed: 随机种子
+    :raises ValueError: 种子无效
+    """
+    if seed is not None and (isinstance(seed, bool) or not isinstance(seed, (int, np.integer)) or seed < 0):
+        raise ValueError(f"随机种子必须是非负整数: {seed!r}")
+
 
 class CaptchaGenerator:
-    def __init__(self, width=200, height=80):
+    def __init__(self, width=200, height=80, seed=None, noise_points=100, noise_lines=3):
         """
         初始化验证码生成器
         :param width: 图片宽度
         :param height: 图片高度
+        :param seed: 随机种子（None表示随机）
+        :param noise_points: 中等难度验证码的噪点数量
+        :param noise_lines: 中等难度验证码的干扰线数量
         """
         self.width = width
         self.height = height
+        self.noise_points = noise_points
+        self.noise_lines = noise_lines
+        # 生成器独立的随机数流（便于复现和多进程并行）
+        self.rng = random.Random(seed)
+        # 噪声层使用的numpy随机数流（一次生成全部坐标）
+        self.np_rng = np.random.default_rng(seed)
         self.font_path = self._get_font_path()
+        self.font_size = 40
+        # 字体与字形缓存（同一字体的生成器共享）
+        self.glyph_cache = GlyphCache.shared(self.font_path)
+        # 波浪扭曲引擎（减小扭曲幅度，重映射网格按尺寸缓存）
+        self.wave_distortion = WaveDistortion(amplitude_x=1.5, period_x=12.0, amplitude_y=1.0, period_y=15.0)
 
     def _get_font_path(self):
         """获取字体文件路径"""
@@ -33,158 +61,111 @@ class CaptchaGenerator:
         # 如果没有找到字体，使用默认字体
         return None
 
-    def generate_simple_captcha(self, length=4):
+    def generate_simple_captcha(self, length=4, mode='RGB'):
         """
         生成简单验证码（纯文本，无干扰）
         :param length: 验证码长度
+        :param mode: 图像模式（'RGB'彩色或'L'灰度）
         :return: (验证码文本, PIL图像对象)
         """
         # 生成随机文本（大写字母+数字）
         chars = string.ascii_uppercase + string.digits
-        text = ''.join(random.choice(chars) for _ in range(length))
+        text = ''.join(self.rng.choice(chars) for _ in range(length))
 
         # 创建图片
-        image = Image.new('RGB', (self.width, self.height), color='white')
-        draw = ImageDraw.Draw(image)
-
-        # 使用字体
-        try:
-            font = ImageFont.truetype(self.font_path, 40) if self.font_path else ImageFont.load_default()
-        except (OSError, IOError, AttributeError):
-            font = ImageFont.load_default()
+        image = Image.new(mode, (self.width, self.height), color='white')
 
-        # 计算文本位置（使用textbbox替代已弃用的textsize）
-        try:
-            bbox = draw.textbbox((0, 0), text, font=font)
-            text_width = bbox[2] - bbox[0]
-            text_height = bbox[3] - bbox[1]
-        except AttributeError:
-            # 兼容旧版本PIL
-            text_width, text_height = draw.textsize(text, font=font)
+        # 计算文本位置（使用缓存字形的边界框）
+        bbox = self.glyph_cache.text_bbox(text, self.font_size)
+        text_width = bbox[2] - bbox[0]
+        text_height = bbox[3] - bbox[1]
         x = (self.width - text_width) / 2
         y = (self.height - text_height) / 2
 
-        # 绘制文本
-        draw.text((x, y), text, font=font, fill='black')
+        # 绘制文本（粘贴预渲染字形）
+        self.glyph_cache.draw_text(image, (x, y), text, self.font_size, 'black')
 
         return text, image
 
-    def generate_medium_captcha(self, length=5):
+    def generate_medium_captcha(self, length=5, mode='RGB'):
         """
         生成中等难度验证码（有噪点和干扰线）
         :param length: 验证码长度
+        :param mode: 图像模式（'RGB'彩色或'L'灰度）
         :return: (验证码文本, PIL图像对象)
         """
         # 生成随机文本
         chars = string.ascii_uppercase + string.digits
-        text = ''.join(random.choice(chars) for _ in range(length))
+        text = ''.join(self.rng.choice(chars) for _ in range(length))
 
         # 创建图片
-        image = Image.new('RGB', (self.width, self.height), color='white')
-        draw = ImageDraw.Draw(image)
-
-        # 使用字体
-        try:
-            font = ImageFont.truetype(self.font_path, 40) if self.font_path else ImageFont.load_default()
-        except (OSError, IOError, AttributeError):
-            font = ImageFont.load_default()
+        image = Image.new(mode, (self.width, self.height), color='white')
 
-        # 计算文本位置（使用textbbox替代已弃用的textsize）
-        try:
-            bbox = draw.textbbox((0, 0), text, font=font)
-            text_width = bbox[2] - bbox[0]
-            text_height = bbox[3] - bbox[1]
-        except AttributeError:
-            # 兼容旧版本PIL
-            text_width, text_height = draw.textsize(text, font=font)
+        # 计算文本位置（使用缓存字形的边界框）
+        bbox = self.glyph_cache.text_bbox(text, self.font_size)
+        text_width = bbox[2] - bbox[0]
+        text_height = bbox[3] - bbox[1]
         x = (self.width - text_width) / 2
         y = (self.height - text_height) / 2
 
         # 绘制文本（随机颜色）
         colors = ['black', 'darkblue', 'darkgreen', 'darkred']
-        draw.text((x, y), text, font=font, fill=random.choice(colors))
-
-        # 添加干扰线
-        for _ in range(3):
-            x1 = random.randint(0, self.width)
-            y1 = random.randint(0, self.height)
-            x2 = random.randint(0, self.width)
-            y2 = random.randint(0, self.height)
-            draw.line([(x1, y1), (x2, y2)], fill='gray', width=1)
-
-        # 添加噪点
-        for _ in range(100):
-            x = random.randint(0, self.width - 1)
-            y = random.randint(0, self.height - 1)
-            draw.point((x, y), fill='gray')
+        self.glyph_cache.draw_text(image, (x, y), text, self.font_size, self.rng.choice(colors))
 
-        return text, image
+        # 在像素缓冲区上一次性绘制干扰线和噪点
+        pixels = np.array(image)
+        gray = ImageColor.getcolor('gray', mode)
+        noise.add_lines(pixels, self.np_rng, self.noise_lines, gray)
+        noise.add_points(pixels, self.np_rng, self.noise_points, gray)
 
-    def generate_hard_captcha(self, length=5):
+        return text, Image.fromarray(pixels, mode)
+
+    def generate_hard_captcha(self, length=5, mode='RGB'):
         """
         生成高难度验证码（扭曲、旋转、复杂背景）
         :param length: 验证码长度
+        :param mode: 图像模式（'RGB'彩色或'L'灰度）
         :return: (验证码文本, PIL图像对象)
         """
         # 生成随机文本
         chars = string.ascii_uppercase + string.digits
-        text = ''.join(random.choice(chars) for _ in range(length))
+        text = ''.join(self.rng.choice(chars) for _ in range(length))
 
         # 创建图片
-        image = Image.new('RGB', (self.width, self.height), color='white')
-        draw = ImageDraw.Draw(image)
-
-        # 使用字体
-        try:
-            font = ImageFont.truetype(self.font_path, 40) if self.font_path else ImageFont.load_default()
-        except (OSError, IOError, AttributeError):
-            font = ImageFont.load_default()
+        image = Image.new(mode, (self.width, self.height), color='white')
 
         # 绘制每个字符，添加轻微旋转和小幅位置偏移（避免遮挡）
         # 为了防止字符互相遮挡，这里适当增加间距并控制旋转角度
         char_width = self.width // (length + 1)
+        # 单个字符区域（适中字符区域以提高可读性并减少重叠）
+        char_box = (max(char_width, 40), self.height)
         for i, char in enumerate(text):
-            # 创建单个字符图像（适中字符区域以提高可读性并减少重叠）
-            char_size = max(char_width, 40)
-            char_image = Image.new('RGB', (char_size, self.height), color='white')
-            char_draw = ImageDraw.Draw(char_image)
-
-            # 计算字符在字符图像中的位置
-            try:
-                bbox = char_draw.textbbox((0, 0), char, font=font)
-                char_text_width = bbox[2] - bbox[0]
-                char_text_height = bbox[3] - bbox[1]
-            except AttributeError:
-                # 兼容旧版本PIL
-                char_text_width, char_text_height = char_draw.textsize(char, font=font)
-            
-            char_x = (char_size - char_text_width) / 2
-            char_y = (self.height - char_text_height) / 2
-
             # 随机颜色（使用更深的颜色以提高可读性）
-            color = (random.randint(50, 100), random.randint(50, 100), random.randint(50, 100))
-            char_draw.text((char_x, char_y), char, font=font, fill=color)
+            color = (self.rng.randint(50, 100), self.rng.randint(50, 100), self.rng.randint(50, 100))
+            if mode == 'L':
+                color = (color[0] * 299 + color[1] * 587 + color[2] * 114) // 1000
 
             # 随机旋转（进一步减小角度范围，避免视觉遮挡感）
-            angle = random.randint(-8, 8)
-            rotated_char = char_image.rotate(angle, expand=1, fillcolor='white')
+            # 角度只有17种取值，直接取图集中预旋转好的字形遮罩
+            angle = self.rng.randint(-8, 8)
+            rotated_mask = self.glyph_cache.get_rotated_mask(char, self.font_size, angle, char_box)
 
             # 计算位置（考虑旋转后的尺寸）
-            rotated_width, rotated_height = rotated_char.size
+            rotated_width, rotated_height = rotated_mask.size
             # 基于索引计算大致中心位置，避免字符互相压在一起
             x_center = (i + 1) * char_width
             x = int(x_center - rotated_width / 2)
             # 垂直方向仅做很小的随机偏移，不再大幅上下漂移
-            y = int((self.height - rotated_height) / 2 + random.randint(-3, 3))
+            y = int((self.height - rotated_height) / 2 + self.rng.randint(-3, 3))
             # 确保不超出边界
             x = max(0, min(x, self.width - rotated_width))
             y = max(0, min(y, self.height - rotated_height))
 
-            # 粘贴到主图像
-            image.paste(rotated_char, (x, y), rotated_char if rotated_char.mode == 'RGBA' else None)
+            # 以遮罩着色粘贴到主图像
+            image.paste(color, (x, y), rotated_mask)
 
         # 取消遮挡效果（不再添加复杂背景）
-        # self._add_complex_background(draw)  # 已禁用遮挡效果
+        # self._add_complex_background(pixels)  # 已禁用遮挡效果
 
         # 轻微波浪扭曲（降低幅度，保留“困难感”但不至于看不清）
         image = self._apply_wave_distortion(image)
@@ -195,91 +176,125 @@ class CaptchaGenerator:
         return text, image
 
     def _apply_wave_distortion(self, image):
-        """应用波浪扭曲效果"""
-        # 转换为numpy数组
-        img_array = np.array(image)
-        rows, cols = img_array.shape[:2]
-        is_rgb = len(img_array.shape) == 3
-
-        # 创建坐标网格
-        x, y = np.meshgrid(np.arange(cols), np.arange(rows))
+        """应用波浪扭曲效果（网格已缓存，所有通道一次重映射）"""
+        return self.wave_distortion.apply(image)
 
-        # 应用波浪扭曲（减小扭曲幅度）
-        wave_x = x + 1.5 * np.sin(y / 12.0)
-        wave_y = y + 1 * np.cos(x / 15.0)
+    def _random_colors(self, count, low, high, mode):
+        """为每个噪声元素生成随机浅色（灰度模式下为单通道）"""
+        shape = (count,) if mode == 'L' else (count, 3)
+        return self.np_rng.integers(low, high + 1, shape)
 
-        # 确保坐标在有效范围内
-        wave_x = np.clip(wave_x, 0, cols - 1).astype(np.float32)
-        wave_y = np.clip(wave_y, 0, rows - 1).astype(np.float32)
-
-        # 使用双线性插值进行重映射
-        try:
-            from scipy.ndimage import map_coordinates
-            # 使用scipy进行插值（如果可用）
-            if is_rgb:
-                distorted = np.zeros_like(img_array)
-                for i in range(img_array.shape[2]):
-                    distorted[:, :, i] = map_coordinates(img_array[:, :, i], [wave_y, wave_x], order=1, mode='reflect')
-            else:
-                distorted = map_coordinates(img_array, [wave_y, wave_x], order=1, mode='reflect')
-            return Image.fromarray(distorted.astype(np.uint8))
-        except ImportError:
-            # 如果没有scipy，使用简单的最近邻插值方法
-            distorted_array = np.zeros_like(img_array)
-            for i in range(rows):
-                for j in range(cols):
-                    src_x = int(np.clip(wave_x[i, j], 0, cols - 1))
-                    src_y = int(np.clip(wave_y[i, j], 0, rows - 1))
-                    if is_rgb:
-                        distorted_array[i, j] = img_array[src_y, src_x]
-                    else:
-                        distorted_array[i, j] = img_array[src_y, src_x]
-            return Image.fromarray(distorted_array.astype(np.uint8))
-
-    def _add_complex_background(self, draw):
-        """添加复杂背景（减少干扰以提高可读性）"""
+    def _add_complex_background(self, pixels, mode='RGB'):
+        """添加复杂背景（减少干扰以提高可读性），直接修改像素数组"""
         # 添加干扰线（减少数量和降低对比度）
-        for _ in range(3):
-            x1 = random.randint(0, self.width)
-            y1 = random.randint(0, self.height)
-            x2 = random.randint(0, self.width)
-            y2 = random.randint(0, self.height)
-            color = (random.randint(200, 240), random.randint(200, 240), random.randint(200, 240))
-            draw.line([(x1, y1), (x2, y2)], fill=color, width=1)
+        noise.add_lines(pixels, self.np_rng, 3, self._random_colors(3, 200, 240, mode))
 
         # 添加随机噪点（减少数量）
-        for _ in range(50):
-            x = random.randint(0, self.width - 1)
-            y = random.randint(0, self.height - 1)
-            color = (random.randint(200, 240), random.randint(200, 240), random.randint(200, 240))
-            draw.point((x, y), fill=color)
+        noise.add_points(pixels, self.np_rng, 50, self._random_colors(50, 200, 240, mode))
 
         # 添加随机圆形（减少数量和降低对比度）
-        for _ in range(5):
-            x = random.randint(0, self.width)
-            y = random.randint(0, self.height)
-            radius = random.randint(5, 15)
-            color = (random.randint(220, 250), random.randint(220, 250), random.randint(220, 250))
-            draw.ellipse([x, y, x + radius, y + radius], fill=color, outline=color)
-
-    def batch_generate(self, count=10, difficulty='medium', length=5):
+        noise.add_ellipses(pixels, self.np_rng, 5, 5, 15, self._random_colors(5, 220, 250, mode))
+
+    def generate(self, difficulty='medium', length=5, mode='RGB'):
+        """
+        按难度生成验证码
+        :param difficulty: 难度级别
+        :param length: 验证码长度
+        :param mode: 图像模式（'RGB'彩色或'L'灰度）
+        :return: (验证码文本, PIL图像对象)
+        """
+        if difficulty == 'simple':
+            return self.generate_simple_captcha(length, mode)
+        elif difficulty == 'hard':
+            return self.generate_hard_captcha(length, mode)
+        else:
+            return self.generate_medium_captcha(length, mode)
+
+    def generate_seeded(self, seed, index, difficulty='medium', length=5, mode='RGB'):
+        """
+        生成批次中第index个验证码，随机流只由(seed, index)决定
+        :param seed: 批次基础种子
+        :param index: 批次内索引
+        :param difficulty: 难度级别
+        :param length: 验证码长度
+        :param mode: 图像模式（'RGB'彩色或'L'灰度）
+        :return: (验证码文本, PIL图像对象)
+        """
+        check_seed(seed)
+        # 临时切换到(seed, index)派生的随机流，结束后恢复，不影响后续的随机生成
+        state = self.rng.getstate()
+        np_rng = self.np_rng
+        seed_sequence = np.random.SeedSequence([seed, index])
+        self.rng.seed(int(seed_sequence.generate_state(1, np.uint64)[0]))
+        self.np_rng = np.random.default_rng(seed_sequence)
+        try:
+            return self.generate(difficulty, length, mode)
+        finally:
+            self.rng.setstate(state)
+            self.np_rng = np_rng
+
+    def batch_generate(self, count=10, difficulty='medium', length=5, seed=None, workers=1, ordered=True,
+                       mode='RGB'):
         """
         批量生成验证码
         :param count: 生成数量
         :param difficulty: 难度级别
         :param length: 验证码长度
+        :param seed: 基础随机种子（指定后结果可逐字节复现，与进程数无关）
+        :param workers: 并行进程数（1表示当前进程串行，None表示CPU核心数）
+        :param ordered: 并行时是否按顺序返回
+        :param mode: 图像模式（'RGB'彩色或'L'灰度）
         :return: 生成器，每次返回(文本, 图像)
         """
+        # 在返回生成器之前检查种子，无效时调用方立即得到ValueError，而不是在生成过程中出错
+        check_seed(seed)
+        return self._batch_generate(count, difficulty, length, seed, workers, ordered, mode)
+
+    def _batch_generate(self, count, difficulty, length, seed, workers, ordered, mode):
+        """批量生成的生成器实现（参数见batch_generate）"""
+        if workers != 1:
+            from captcha_generator.parallel import parallel_batch_generate
+            yield from parallel_batch_generate(self, count, difficulty, length, seed=seed,
+                                               workers=workers, ordered=ordered, mode=mode)
+            return
+
         for i in range(count):
-            if difficulty == 'simple':
-                text, image = self.generate_simple_captcha(length)
-            elif difficulty == 'hard':
-                text, image = self.generate_hard_captcha(length)
+            if seed is not None:
+                text, image = self.generate_seeded(seed, i, difficulty, length, mode)
             else:
-                text, image = self.generate_medium_captcha(length)
+                text, image = self.generate(difficulty, length, mode)
 
             yield text, image
 
+    def generate_array_batch(self, count=10, difficulty='medium', length=5, color=False, seed=None, workers=1,
+                             out=None):
+        """
+        批量生成验证码并直接写入预分配的uint8数组（用于训练和评估）
+        灰度模式直接以'L'模式绘制，省去逐张RGB转灰度和np.array转换
+        :param count: 生成数量
+        :param difficulty: 难度级别
+        :param length: 验证码长度
+        :param color: True返回(N, H, W, 3)彩色数组，False返回(N, H, W)灰度数组
+        :param seed: 基础随机种子
+        :param workers: 并行进程数（含义同batch_generate）
+        :param out: 可选的预分配数组（例如np.memmap），形状和类型必须匹配
+        :return: (图像数组, 标签数组)
+        """
+        shape = (count, self.height, self.width, 3) if color else (count, self.height, self.width)
+        if out is None:
+            out = np.empty(shape, dtype=np.uint8)
+        elif out.shape != shape or out.dtype != np.uint8:
+            raise ValueError(f"输出数组应为uint8{shape}，实际为{out.dtype}{out.shape}")
+
+        labels = np.empty(count, dtype=f'<U{length}')
+        batch = self.batch_generate(count, difficulty, length, seed=seed, workers=workers,
+                                    mode='RGB' if color else 'L')
+        for i, (text, image) in enumerate(batch):
+            out[i] = image
+            labels[i] = text
+
+        return out, labels
+
     def save_captcha(self, image, filename, folder='data/captchas'):
         """
         保存验证码图片
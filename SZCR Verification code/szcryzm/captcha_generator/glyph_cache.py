@@ -0,0 +1,169 @@
+import string
+import threading
+from collections import namedtuple
+from PIL import Image, ImageDraw, ImageFont
+
+
+# 单个字形：alpha遮罩、相对绘制原点的偏移、前进宽度
+Glyph = namedtuple('Glyph', ['mask', 'offset_x', 'offset_y', 'advance'])
+
+
+class GlyphCache:
+    """字体与字形缓存（每种字号只加载一次字体并预渲染全部字符）"""
+
+    CHARACTERS = string.ascii_uppercase + string.digits
+
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, font_path):
+        """
+        初始化字形缓存
+        :param font_path: TrueType字体路径（None表示使用默认字体）
+        """
+        self.font_path = font_path
+        self._fonts = {}
+        self._glyphs = {}
+        self._rotated = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, font_path):
+        """
+        获取进程内共享的字形缓存（同一字体的所有生成器共用一份）
+        :param font_path: 字体路径
+        :return: GlyphCache实例
+        """
+        with cls._shared_lock:
+            cache = cls._shared.get(font_path)
+            if cache is None:
+                cache = cls(font_path)
+                cls._shared[font_path] = cache
+            return cache
+
+    def get_font(self, size):
+        """
+        获取指定字号的字体（只加载一次）
+        :param size: 字号
+        :return: PIL字体对象
+        """
+        font = self._fonts.get(size)
+        if font is None:
+            try:
+                font = ImageFont.truetype(self.font_path, size) if self.font_path else ImageFont.load_default()
+            except (OSError, IOError, AttributeError):
+                font = ImageFont.load_default()
+            self._fonts[size] = font
+        return font
+
+    def get_glyphs(self, size):
+        """
+        获取指定字号的全部字形，首次调用时预渲染A-Z、0-9
+        字形遮罩与颜色无关，粘贴时再着色，因此每个字号只需一份
+        :param size: 字号
+        :return: {字符: Glyph}
+        """
+        glyphs = self._glyphs.get(size)
+        if glyphs is None:
+            with self._lock:
+                glyphs = self._glyphs.get(size)
+                if glyphs is None:
+                    font = self.get_font(size)
+                    glyphs = {char: self._render_glyph(char, font) for char in self.CHARACTERS}
+                    self._glyphs[size] = glyphs
+        return glyphs
+
+    def _render_glyph(self, char, font):
+        """渲染单个字符为裁剪后的alpha遮罩"""
+        left, top, right, bottom = font.getbbox(char)
+        try:
+            advance = font.getlength(char)
+        except AttributeError:
+            advance = right
+
+        canvas = Image.new('L', (max(right, 1), max(bottom, 1)), 0)
+        ImageDraw.Draw(canvas).text((0, 0), char, font=font, fill=255)
+        mask = canvas.crop((left, top, max(right, left + 1), max(bottom, top + 1)))
+
+        return Glyph(mask, left, top, advance)
+
+    def get_glyph(self, char, size):
+        """
+        获取单个字形（不在预渲染字符集中的字符按需渲染）
+        :param char: 字符
+        :param size: 字号
+        :return: Glyph
+        """
+        glyphs = self.get_glyphs(size)
+        glyph = glyphs.get(char)
+        if glyph is None:
+            glyph = self._render_glyph(char, self.get_font(size))
+            glyphs[char] = glyph
+        return glyph
+
+    def get_rotated_mask(self, char, size, angle, box):
+        """
+        获取预旋转的字形遮罩（精灵图集，按需构建后常驻内存）
+        字形先居中绘制在box大小的画布上，再以expand=1旋转，与逐字符绘制后旋转的结果一致
+        :param char: 字符
+        :param size: 字号
+        :param angle: 旋转角度（整数）
+        :param box: 字符画布尺寸 (宽, 高)
+        :return: 旋转后的alpha遮罩（尺寸即旋转后的字符图像尺寸）
+        """
+        key = (char, size, angle, box)
+        mask = self._rotated.get(key)
+        if mask is None:
+            left, top, right, bottom = self.text_bbox(char, size)
+            x = (box[0] - (right - left)) / 2
+            y = (box[1] - (bottom - top)) / 2
+
+            canvas = Image.new('L', box, 0)
+            self.draw_text(canvas, (x, y), char, size, 255)
+            mask = canvas.rotate(angle, expand=1, fillcolor=0)
+            self._rotated[key] = mask
+        return mask
+
+    def _layout(self, text, size):
+        """计算每个字形相对绘制原点的位置"""
+        placements = []
+        pen = 0.0
+        for char in text:
+            glyph = self.get_glyph(char, size)
+            placements.append((glyph, int(round(pen)) + glyph.offset_x, glyph.offset_y))
+            pen += glyph.advance
+        return placements
+
+    def text_bbox(self, text, size):
+        """
+        计算文本墨迹边界框（相对绘制原点，等价于draw.textbbox((0, 0), ...)）
+        :param text: 文本
+        :param size: 字号
+        :return: (left, top, right, bottom)
+        """
+        placements = self._layout(text, size)
+        if not placements:
+            return 0, 0, 0, 0
+
+        left = min(x for _, x, _ in placements)
+        top = min(y for _, _, y in placements)
+        right = max(x + glyph.mask.width for glyph, x, _ in placements)
+        bottom = max(y + glyph.mask.height for glyph, _, y in placements)
+        return left, top, right, bottom
+
+    def draw_text(self, image, xy, text, size, fill):
+        """
+        用缓存的字形在图像上绘制文本（等价于draw.text(xy, text, ...)）
+        :param image: 目标PIL图像
+        :param xy: 绘制原点
+        :param text: 文本
+        :param size: 字号
+        :param fill: 颜色（颜色名或元组）
+        """
+        if image.mode == 'L' and isinstance(fill, tuple):
+            # 灰度图像上按ITU-R 601亮度公式把RGB颜色转换为灰度值
+            r, g, b = fill[:3]
+            fill = (r * 299 + g * 587 + b * 114) // 1000
+        x0, y0 = int(round(xy[0])), int(round(xy[1]))
+        for glyph, x, y in self._layout(text, size):
+            image.paste(fill, (x0 + x, y0 + y), glyph.mask)
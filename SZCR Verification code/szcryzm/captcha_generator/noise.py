@@ -0,0 +1,100 @@
+import numpy as np
+
+
+def scatter(pixels, xs, ys, color):
+    """
+    把坐标点一次性写入像素缓冲区（超出画布的点被丢弃）
+    :param pixels: (H, W)或(H, W, C)的uint8数组，原地修改
+    :param xs: x坐标数组
+    :param ys: y坐标数组
+    :param color: 单一颜色，或与坐标一一对应的颜色数组
+    """
+    height, width = pixels.shape[:2]
+    inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+    color = np.asarray(color, dtype=np.uint8)
+    if color.ndim > (pixels.ndim - 2):
+        color = color[inside]
+    pixels[ys[inside], xs[inside]] = color
+
+
+def add_points(pixels, rng, count, color):
+    """
+    添加随机噪点（一次生成所有坐标）
+    :param pixels: 像素数组，原地修改
+    :param rng: numpy随机数生成器
+    :param count: 噪点数量
+    :param color: 颜色（单一颜色或每个点一个颜色）
+    """
+    if count <= 0:
+        return
+    height, width = pixels.shape[:2]
+    xs = rng.integers(0, width, count)
+    ys = rng.integers(0, height, count)
+    scatter(pixels, xs, ys, color)
+
+
+def add_lines(pixels, rng, count, color):
+    """
+    添加随机干扰线（所有线段的采样点一次生成并写入）
+    :param pixels: 像素数组，原地修改
+    :param rng: numpy随机数生成器
+    :param count: 线条数量
+    :param color: 颜色（单一颜色或每条线一个颜色）
+    """
+    if count <= 0:
+        return
+    height, width = pixels.shape[:2]
+    # 端点范围与原先draw.line一致（包含画布宽高，越界部分被裁掉）
+    x1 = rng.integers(0, width + 1, count)
+    y1 = rng.integers(0, height + 1, count)
+    x2 = rng.integers(0, width + 1, count)
+    y2 = rng.integers(0, height + 1, count)
+
+    # 每条线按长轴逐像素采样
+    steps = np.maximum(np.abs(x2 - x1), np.abs(y2 - y1)) + 1
+    line_index = np.repeat(np.arange(count), steps)
+    offsets = np.arange(steps.sum()) - np.repeat(np.cumsum(steps) - steps, steps)
+    t = offsets / np.maximum(steps - 1, 1)[line_index]
+
+    xs = np.rint(x1[line_index] + t * (x2 - x1)[line_index]).astype(np.intp)
+    ys = np.rint(y1[line_index] + t * (y2 - y1)[line_index]).astype(np.intp)
+
+    color = np.asarray(color, dtype=np.uint8)
+    if color.ndim > (pixels.ndim - 2):
+        color = color[line_index]
+    scatter(pixels, xs, ys, color)
+
+
+def add_ellipses(pixels, rng, count, min_size, max_size, color):
+    """
+    添加随机实心圆（所有圆的覆盖区域一次计算，后画的覆盖先画的）
+    :param pixels: 像素数组，原地修改
+    :param rng: numpy随机数生成器
+    :param count: 圆的数量
+    :param min_size: 最小直径
+    :param max_size: 最大直径
+    :param color: 颜色（单一颜色或每个圆一个颜色）
+    """
+    if count <= 0:
+        return
+    height, width = pixels.shape[:2]
+    x = rng.integers(0, width + 1, count)
+    y = rng.integers(0, height + 1, count)
+    size = rng.integers(min_size, max_size + 1, count)
+
+    # 与draw.ellipse([x, y, x + size, y + size])相同的外接框
+    cx = (x + size / 2)[:, None, None]
+    cy = (y + size / 2)[:, None, None]
+    radius = (size / 2 + 0.5)[:, None, None]
+    rows, cols = np.ogrid[:height, :width]
+    inside = (cols - cx) ** 2 + (rows - cy) ** 2 <= radius ** 2
+
+    covered = inside.any(axis=0)
+    # 每个像素取最后一个覆盖它的圆
+    last = count - 1 - np.argmax(inside[::-1], axis=0)
+
+    color = np.asarray(color, dtype=np.uint8)
+    if color.ndim > (pixels.ndim - 2):
+        pixels[covered] = color[last[covered]]
+    else:
+        pixels[covered] = color
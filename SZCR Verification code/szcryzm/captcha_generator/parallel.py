@@ -0,0 +1,90 @@
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+
+# 少于该数量时直接串行生成（进程池启动开销不划算）
+MIN_PARALLEL_COUNT = 64
+
+# 工作进程的启动方式：调用方（如Web服务）往往还有其他线程在运行（验证码池补充线程、数据集监视线程等），
+# fork时这些线程持有的锁会被复制到子进程中且永远不会释放，因此统一使用spawn启动全新的解释器
+MP_CONTEXT = multiprocessing.get_context('spawn')
+
+# 工作进程内的生成器实例（由 _init_worker 创建）
+_worker_generator = None
+
+
+def _init_worker(width, height, noise_points, noise_lines):
+    """工作进程初始化：每个进程创建一个生成器，字形缓存和扭曲网格在进程内复用"""
+    global _worker_generator
+    from captcha_generator.generator import CaptchaGenerator
+    _worker_generator = CaptchaGenerator(width, height, noise_points=noise_points, noise_lines=noise_lines)
+
+
+def _generate_chunk(difficulty, length, seed, start, stop, mode):
+    """在工作进程中生成索引区间 [start, stop) 的验证码"""
+    return [
+        _worker_generator.generate_seeded(seed, index, difficulty, length, mode)
+        for index in range(start, stop)
+    ]
+
+
+def parallel_batch_generate(generator, count=10, difficulty='medium', length=5, seed=None,
+                            workers=None, ordered=True, chunk_size=32, max_pending=None, mode='RGB'):
+    """
+    使用进程池并行批量生成验证码
+    每个验证码的随机流只由 (seed, 索引) 决定，与进程数和分块方式无关，
+    因此相同seed的结果逐字节可复现
+    :param generator: 提供尺寸参数的CaptchaGenerator（数量较少时直接用它串行生成）
+    :param count: 生成数量
+    :param difficulty: 难度级别
+    :param length: 验证码长度
+    :param seed: 基础随机种子（None表示随机）
+    :param workers: 进程数（None表示CPU核心数）
+    :param ordered: 是否按索引顺序返回结果
+    :param chunk_size: 每个任务包含的验证码数量
+    :param max_pending: 同时在途的最大任务数（限制内存占用，默认进程数的2倍）
+    :param mode: 图像模式（'RGB'彩色或'L'灰度）
+    :return: 生成器，每次返回(文本, 图像)
+    """
+    if seed is None:
+        seed = generator.rng.getrandbits(64)
+
+    workers = workers or os.cpu_count() or 1
+
+    if workers <= 1 or count < MIN_PARALLEL_COUNT:
+        for index in range(count):
+            yield generator.generate_seeded(seed, index, difficulty, length, mode)
+        return
+
+    max_pending = max_pending or workers * 2
+    chunks = ((start, min(start + chunk_size, count)) for start in range(0, count, chunk_size))
+
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=MP_CONTEXT, initializer=_init_worker,
+                                   initargs=(generator.width, generator.height,
+                                             generator.noise_points, generator.noise_lines))
+    try:
+        if ordered:
+            pending = deque()
+            for start, stop in chunks:
+                pending.append(executor.submit(_generate_chunk, difficulty, length, seed, start, stop, mode))
+                if len(pending) >= max_pending:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+        else:
+            pending = set()
+            for start, stop in chunks:
+                pending.add(executor.submit(_generate_chunk, difficulty, length, seed, start, stop, mode))
+                if len(pending) >= max_pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield from future.result()
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+    finally:
+        # 调用方提前停止迭代时取消尚未开始的任务
+        executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,172 @@
+import threading
+from collections import deque
+
+from captcha_generator.generator import CaptchaGenerator
+from utils.encoder import ImageEncoder
+
+
+class CaptchaPool:
+    """预生成验证码池（按难度和长度分组，后台线程补充并编码）"""
+
+    DIFFICULTIES = ('simple', 'medium', 'hard')
+
+    def __init__(self, low_water=20, high_water=100, workers=1, presets=None, max_length=10,
+                 generator_factory=CaptchaGenerator, encoder=None):
+        """
+        初始化验证码池
+        :param low_water: 低水位，某个分组剩余数量低于该值时开始补充
+        :param high_water: 高水位，补充到该数量为止
+        :param workers: 后台补充线程数
+        :param presets: 启动时预先填充的(难度, 长度)列表
+        :param max_length: 允许入池的最大验证码长度（更长的请求直接现场生成）
+        :param generator_factory: 创建生成器的工厂（每个补充线程各自一个）
+        :param encoder: 图像编码器（默认PNG）
+        """
+        if not 0 <= low_water < high_water:
+            raise ValueError(f"水位设置无效: low_water={low_water}, high_water={high_water}")
+
+        self.low_water = low_water
+        self.high_water = high_water
+        self.workers = workers
+        self.presets = list(presets or [])
+        self.max_length = max_length
+        self.generator_factory = generator_factory
+        self.encoder = encoder or ImageEncoder()
+
+        self._queues = {}
+        self._refilling = set()
+        self._condition = threading.Condition()
+        self._threads = []
+        self._running = False
+        # 请求线程缺货时现场生成所用的生成器
+        self._local = threading.local()
+
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+
+    def start(self):
+        """启动后台补充线程（重复调用无副作用）"""
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+            for difficulty, length in self.presets:
+                self._register(difficulty, length)
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._refill_loop, name=f"captcha-pool-{i}")
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+            self._condition.notify_all()
+
+    def stop(self):
+        """停止后台补充线程"""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _poolable(self, difficulty, length):
+        return difficulty in self.DIFFICULTIES and 0 < length <= self.max_length
+
+    def _register(self, difficulty, length):
+        """登记一个分组（调用方需持有锁）"""
+        key = (difficulty, length)
+        if key not in self._queues:
+            self._queues[key] = deque()
+        return self._queues[key]
+
+    def get(self, difficulty='medium', length=5):
+        """
+        取出一个验证码；池中有货时只做出队，缺货时现场生成
+        :param difficulty: 难度级别
+        :param length: 验证码长度
+        :return: (验证码文本, 编码后的图像字节)
+        """
+        if not self._running:
+            self.start()
+
+        if not self._poolable(difficulty, length):
+            with self._condition:
+                self.misses += 1
+            return self._render(self._local_generator(), difficulty, length)
+
+        with self._condition:
+            queue = self._register(difficulty, length)
+            item = queue.popleft() if queue else None
+            if item is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+            if len(queue) < self.low_water:
+                self._condition.notify()
+
+        if item is None:
+            item = self._render(self._local_generator(), difficulty, length)
+        return item
+
+    def _local_generator(self):
+        generator = getattr(self._local, 'generator', None)
+        if generator is None:
+            generator = self.generator_factory()
+            self._local.generator = generator
+        return generator
+
+    def _render(self, generator, difficulty, length):
+        """生成验证码并编码"""
+        text, image = generator.generate(difficulty, length)
+        return text, self.encoder.encode(image)
+
+    def _next_refill_key(self):
+        """找出低于低水位且没有其他线程在补充的分组（调用方需持有锁）"""
+        for key, queue in self._queues.items():
+            if len(queue) < self.low_water and key not in self._refilling:
+                return key
+        return None
+
+    def _refill_loop(self):
+        """后台补充线程：把低于低水位的分组补充到高水位"""
+        generator = self.generator_factory()
+        while True:
+            with self._condition:
+                key = self._next_refill_key()
+                while self._running and key is None:
+                    self._condition.wait()
+                    key = self._next_refill_key()
+                if not self._running:
+                    return
+                self._refilling.add(key)
+                queue = self._queues[key]
+
+            try:
+                while self._running and len(queue) < self.high_water:
+                    item = self._render(generator, *key)
+                    with self._condition:
+                        queue.append(item)
+                        self.generated += 1
+            finally:
+                with self._condition:
+                    self._refilling.discard(key)
+
+    def stats(self):
+        """
+        获取池的统计信息（用于根据峰值流量调整水位）
+        :return: 统计字典
+        """
+        with self._condition:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total > 0 else 0,
+                'generated': self.generated,
+                'low_water': self.low_water,
+                'high_water': self.high_water,
+                'workers': self.workers,
+                'image_format': self.encoder.spec,
+                'sizes': {f"{difficulty}_{length}": len(queue)
+                          for (difficulty, length), queue in self._queues.items()}
+            }
@@ -0,0 +1,200 @@
+import os
+import re
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+
+from utils.archive import is_archive, iter_archive
+
+
+METHODS = ('tesseract', 'template', 'ml')
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.bmp')
+# 批量生成的文件名中带有标签，例如 captcha_001_N9R2Z.png
+LABEL_PATTERN = re.compile(r'captcha_\d+_([A-Z0-9]+)')
+
+# 单张识别结果：timings为{'load_ms', 'recognize_ms'}，label为已知标签（没有时为None），error为出错信息
+BatchResult = namedtuple('BatchResult', ['id', 'prediction', 'confidence', 'timings', 'label', 'error'])
+
+# 工作进程内的识别函数（由 _init_worker 创建）
+_worker_recognize = None
+
+
+def label_from_name(name):
+    """
+    从文件名中提取标签
+    :param name: 文件名或路径
+    :return: 标签，没有时返回None
+    """
+    match = LABEL_PATTERN.search(os.path.basename(name))
+    return match.group(1) if match else None
+
+
+def iter_batch_source(source):
+    """
+    把不同形式的输入统一为 (编号, 图像或路径, 标签)
+    :param source: 图像文件夹、分片归档文件夹，或由路径/PIL图像/数组/(编号, 图像[, 标签])组成的可迭代对象
+    :return: 生成器
+    """
+    if isinstance(source, (str, os.PathLike)):
+        if is_archive(source):
+            for name, label, image in iter_archive(source):
+                yield name, image, label
+        elif os.path.isdir(source):
+            for filename in sorted(os.listdir(source)):
+                if filename.lower().endswith(IMAGE_EXTENSIONS):
+                    yield filename, os.path.join(source, filename), label_from_name(filename)
+        else:
+            raise ValueError(f"不是图像文件夹或归档: {source}")
+        return
+
+    for index, item in enumerate(source):
+        if isinstance(item, (str, os.PathLike)):
+            yield os.path.basename(item), item, label_from_name(item)
+        elif isinstance(item, tuple):
+            yield item[0], item[1], item[2] if len(item) > 2 else None
+        else:
+            yield index, item, None
+
+
+def make_recognize(method, recognizer=None, template_folder='data/templates', difficulty=None):
+    """
+    创建单张识别函数
+    :param method: 识别方法 ('tesseract', 'template', 'ml')
+    :param recognizer: 识别器实例（ml方法必须提供已加载模型的MLCaptchaRecognizer）
+    :param template_folder: 模板文件夹
+    :param difficulty: 验证码难度（传给Tesseract识别）
+    :return: 函数，输入图像，返回(识别结果, 置信度或None)
+    """
+    if method not in METHODS:
+        raise ValueError(f"不支持的识别方法: {method}")
+
+    if method == 'ml':
+        if recognizer is None or recognizer.model is None:
+            raise ValueError("机器学习识别需要已加载模型的识别器")
+        return recognizer.predict_with_confidence
+
+    if recognizer is None:
+        from captcha_recognizer.traditional_recognizer import TraditionalCaptchaRecognizer
+        recognizer = TraditionalCaptchaRecognizer()
+
+    if method == 'template':
+        def recognize(image):
+            text, scores = recognizer.match_templates(image, template_folder)
+            return text, sum(scores) / len(scores)
+    else:
+        def recognize(image):
+            # Tesseract不提供置信度
+            return recognizer.recognize_with_tesseract(image, difficulty), None
+    return recognize
+
+
+def _recognize_one(recognize, item):
+    """加载并识别一张图像，出错时记录错误而不是中断整个批次"""
+    item_id, image, label = item
+    start = time.perf_counter()
+    loaded = None
+    prediction, confidence, error = '', None, None
+    try:
+        if isinstance(image, (str, os.PathLike)):
+            image = Image.open(image)
+            image.load()
+        loaded = time.perf_counter()
+        prediction, confidence = recognize(image)
+    except Exception as e:
+        error = str(e)
+    finished = time.perf_counter()
+    if loaded is None:
+        loaded = finished
+    timings = {'load_ms': (loaded - start) * 1000, 'recognize_ms': (finished - loaded) * 1000}
+    return BatchResult(item_id, prediction, confidence, timings, label, error)
+
+
+def _init_worker(method, recognizer, options):
+    """工作进程初始化：每个进程创建一次识别器（模板库、OCR引擎在进程内复用）"""
+    global _worker_recognize
+    _worker_recognize = make_recognize(method, recognizer, **options)
+
+
+def _recognize_chunk(items):
+    """在工作进程中识别一组图像"""
+    return [_recognize_one(_worker_recognize, item) for item in items]
+
+
+def _chunked(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def recognize_batch(source, method='template', recognizer=None, workers=1, chunk_size=8, max_pending=None,
+                    **options):
+    """
+    批量识别验证码，结果按输入顺序逐个返回
+    :param source: 图像文件夹、分片归档文件夹或图像/路径的可迭代对象
+    :param method: 识别方法 ('tesseract', 'template', 'ml')
+    :param recognizer: 识别器实例（ml方法必须提供；多进程时会复制到每个工作进程）
+    :param workers: 进程数（1为在当前进程串行识别，None为CPU核心数）
+    :param chunk_size: 每个任务包含的图像数量
+    :param max_pending: 同时在途的最大任务数（默认进程数的2倍）
+    :param options: 传给识别函数的参数（template_folder, difficulty）
+    :return: 生成器，每次返回BatchResult
+    """
+    items = iter_batch_source(source)
+    workers = workers or os.cpu_count() or 1
+
+    if workers <= 1:
+        recognize = make_recognize(method, recognizer, **options)
+        for item in items:
+            yield _recognize_one(recognize, item)
+        return
+
+    # 在主进程中先检查参数，避免每个工作进程初始化时各自报错
+    make_recognize(method, recognizer, **options)
+
+    max_pending = max_pending or workers * 2
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                   initargs=(method, recognizer, options))
+    try:
+        pending = deque()
+        for chunk in _chunked(items, chunk_size):
+            pending.append(executor.submit(_recognize_chunk, chunk))
+            if len(pending) >= max_pending:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+    finally:
+        # 调用方提前停止迭代时取消尚未开始的任务
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def summarize_batch(results):
+    """
+    汇总批量识别结果（有标签的结果自动计算准确率）
+    :param results: BatchResult的可迭代对象
+    :return: 统计字典
+    """
+    total = labelled = correct = errors = 0
+    recognize_ms = 0.0
+    for result in results:
+        total += 1
+        recognize_ms += result.timings['recognize_ms']
+        if result.error:
+            errors += 1
+        if result.label:
+            labelled += 1
+            if result.prediction.upper() == result.label.upper():
+                correct += 1
+    return {
+        'total': total,
+        'labelled': labelled,
+        'correct': correct,
+        'accuracy': correct / labelled if labelled > 0 else 0,
+        'errors': errors,
+        'avg_recognize_ms': recognize_ms / total if total > 0 else 0
+    }
@@ -0,0 +1,45 @@
+import time
+
+
+class Deadline:
+    """识别的截止时间（由时间预算换算而来，没有预算时永不过期）"""
+
+    def __init__(self, budget=None):
+        """
+        :param budget: 时间预算（秒），None表示不限制
+        """
+        self.budget = budget
+        self.expires_at = None if budget is None else time.monotonic() + budget
+
+    @classmethod
+    def of(cls, budget):
+        """
+        统一转换为Deadline（同一次识别的各阶段共用一个截止时间）
+        :param budget: 秒数、Deadline或None
+        :return: Deadline
+        """
+        return budget if isinstance(budget, cls) else cls(budget)
+
+    def remaining(self):
+        """
+        剩余时间
+        :return: 秒数（不小于0），不限制时返回None
+        """
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+
+class RecognitionResult(str):
+    """识别结果（普通字符串，附带是否因超出时间预算而提前结束的标记）"""
+
+    def __new__(cls, text='', timed_out=False):
+        result = super().__new__(cls, text)
+        result.timed_out = timed_out
+        return result
+
+    def __reduce__(self):
+        return (RecognitionResult, (str(self), self.timed_out))
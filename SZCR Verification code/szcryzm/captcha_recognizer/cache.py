@@ -0,0 +1,194 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+from PIL import Image
+
+
+def image_digest(image):
+    """
+    计算解码后像素的哈希（同一张验证码无论用哪种无损格式传输，解码后得到相同的结果）
+    :param image: 文件路径、PIL图像、numpy数组或PreprocessPipeline
+    :return: 十六进制摘要
+    """
+    image = getattr(image, 'image', image)
+    if isinstance(image, str):
+        image = Image.open(image)
+
+    digest = hashlib.blake2b(digest_size=16)
+    if isinstance(image, Image.Image):
+        digest.update(f"{image.mode}:{image.size}".encode())
+        digest.update(image.tobytes())
+    else:
+        array = np.ascontiguousarray(image)
+        digest.update(f"{array.dtype}:{array.shape}".encode())
+        digest.update(memoryview(array).cast('B'))
+    return digest.hexdigest()
+
+
+class RecognitionCache:
+    """识别结果缓存（按像素哈希+识别方法+配置索引，内存LRU，可选磁盘层）"""
+
+    def __init__(self, max_entries=1024, disk_folder=None):
+        """
+        初始化缓存
+        :param max_entries: 内存中最多保留的结果数
+        :param disk_folder: 磁盘缓存文件夹（None表示只使用内存）
+        """
+        self.max_entries = max_entries
+        self.disk_folder = disk_folder
+        if disk_folder:
+            os.makedirs(disk_folder, exist_ok=True)
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __getstate__(self):
+        # 复制到工作进程时只保留配置（锁不能序列化，内存层各进程独立，磁盘层共用）
+        return {'max_entries': self.max_entries, 'disk_folder': self.disk_folder}
+
+    def __setstate__(self, state):
+        self.__init__(state['max_entries'], state['disk_folder'])
+
+    @staticmethod
+    def make_key(image, method, config=()):
+        """
+        生成缓存键
+        :param image: 图像
+        :param method: 识别方法名
+        :param config: 影响识别结果的配置（模板库版本、模型标识、难度等）
+        :return: 缓存键
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(image_digest(image).encode())
+        digest.update(method.encode())
+        digest.update(repr(config).encode())
+        return digest.hexdigest()
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_folder, key[:2], f"{key}.json")
+
+    def get(self, key):
+        """
+        查询缓存（内存未命中时查磁盘，磁盘命中的结果放回内存）
+        :param key: 缓存键
+        :return: 缓存的结果，未命中时返回None
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+        value = None
+        if self.disk_folder:
+            try:
+                with open(self._disk_path(key), 'r', encoding='utf-8') as f:
+                    value = json.load(f)['value']
+            except (OSError, ValueError, KeyError):
+                value = None
+
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._store(key, value)
+        return value
+
+    def put(self, key, value):
+        """
+        保存结果（需要能被JSON序列化）
+        :param key: 缓存键
+        :param value: 识别结果
+        """
+        with self._lock:
+            self._store(key, value)
+
+        if self.disk_folder:
+            path = self._disk_path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({'value': value}, f, ensure_ascii=False)
+            os.replace(temp_path, path)
+
+    def _store(self, key, value):
+        """写入内存层并按LRU淘汰（调用方需持有锁）"""
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get_or_compute(self, key, compute, should_cache=bool):
+        """
+        命中时返回缓存结果，否则调用compute计算并保存（出错时不缓存）
+        :param key: 缓存键
+        :param compute: 无参数的计算函数
+        :param should_cache: 判断结果是否应该缓存的函数（例如超时得到的不完整结果不缓存）
+        :return: 结果
+        """
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            if should_cache(value):
+                self.put(key, value)
+        return value
+
+    def clear(self):
+        """清空内存层（磁盘层保留）"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        获取缓存统计
+        :return: 统计字典
+        """
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': (self.hits + self.disk_hits) / lookups if lookups > 0 else 0,
+                'disk_folder': self.disk_folder
+            }
+
+
+# 进程内共享的识别缓存（所有识别器实例和Web用户共用）
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_recognition_cache():
+    """获取共享的识别缓存"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = RecognitionCache()
+    return _cache
+
+
+def configure_recognition_cache(max_entries=1024, disk_folder=None):
+    """
+    重新配置共享的识别缓存
+    :param max_entries: 内存中最多保留的结果数
+    :param disk_folder: 磁盘缓存文件夹
+    :return: 新的RecognitionCache
+    """
+    global _cache
+    with _cache_lock:
+        _cache = RecognitionCache(max_entries, disk_folder)
+    return _cache
@@ -0,0 +1,218 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from captcha_recognizer.events import event_log
+
+
+DATASET_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+# 特征缓存文件名（保存在数据集根目录下）
+FEATURE_CACHE_NAME = '.feature_cache.npz'
+# 特征提取方式改变时增加该版本号，旧的特征缓存会被整体丢弃
+FEATURE_VERSION = 2
+
+
+class DatasetLoader:
+    """
+    训练数据集加载器
+    图像在线程池中解码（cv2解码时释放GIL），提取的特征按文件路径、大小和修改时间缓存到磁盘，
+    再次训练时只解码新增或修改过的样本
+    """
+
+    def __init__(self, extract_features, characters, workers=None, use_cache=True):
+        """
+        初始化加载器
+        :param extract_features: 特征提取函数（参数为灰度图像，返回一维特征向量）
+        :param characters: 字符集（数据集下每个字符一个文件夹）
+        :param workers: 解码线程数（None为CPU核心数）
+        :param use_cache: 是否使用特征缓存
+        """
+        self.extract_features = extract_features
+        self.characters = characters
+        self.workers = workers or os.cpu_count() or 1
+        self.use_cache = use_cache
+        # 最近一次加载的统计，以及与特征矩阵各行对应的(相对路径, 大小, 修改时间)
+        self.last_stats = {}
+        self.last_samples = []
+
+    def scan(self, dataset_path):
+        """
+        列出数据集中的样本
+        :param dataset_path: 数据集路径
+        :return: [(相对路径, 标签索引, 大小, 修改时间), ...]，按字符和文件名排序
+        """
+        samples = []
+        for index, char in enumerate(self.characters):
+            char_folder = os.path.join(dataset_path, char)
+            if not os.path.isdir(char_folder):
+                continue
+            with os.scandir(char_folder) as entries:
+                files = sorted((entry for entry in entries
+                                if entry.is_file() and entry.name.lower().endswith(DATASET_EXTENSIONS)),
+                               key=lambda entry: entry.name)
+            for entry in files:
+                stat = entry.stat()
+                samples.append((f"{char}/{entry.name}", index, stat.st_size, stat.st_mtime_ns))
+        return samples
+
+    def _read_cache(self, cache_path):
+        """
+        读取特征缓存
+        :return: ({(相对路径, 大小, 修改时间): 特征向量}, 已知无法解码的{(相对路径, 大小, 修改时间)})
+        """
+        try:
+            with np.load(cache_path, allow_pickle=False) as data:
+                if int(data['version']) != FEATURE_VERSION:
+                    return {}, set()
+                features = data['features']
+                cached = {(path, int(size), int(mtime)): features[i]
+                          for i, (path, size, mtime) in enumerate(zip(data['paths'], data['sizes'], data['mtimes']))}
+                failed = set()
+                if 'failed_paths' in data.files:
+                    failed = {(path, int(size), int(mtime)) for path, size, mtime
+                              in zip(data['failed_paths'], data['failed_sizes'], data['failed_mtimes'])}
+                return cached, failed
+        except (OSError, KeyError, ValueError):
+            return {}, set()
+
+    def _write_cache(self, cache_path, samples, features, labels, failed=()):
+        """原子地写入特征缓存（先写临时文件再替换），同时记录无法解码的文件，文件不变时不再重复解码"""
+        failed = sorted(failed)
+        temp_path = f"{cache_path}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as f:
+            np.savez(f,
+                     version=np.array(FEATURE_VERSION),
+                     paths=np.array([path for path, _, _, _ in samples], dtype=str),
+                     sizes=np.array([size for _, _, size, _ in samples], dtype=np.int64),
+                     mtimes=np.array([mtime for _, _, _, mtime in samples], dtype=np.int64),
+                     features=features,
+                     labels=labels,
+                     failed_paths=np.array([path for path, _, _ in failed], dtype=str),
+                     failed_sizes=np.array([size for _, size, _ in failed], dtype=np.int64),
+                     failed_mtimes=np.array([mtime for _, _, mtime in failed], dtype=np.int64))
+        os.replace(temp_path, cache_path)
+
+    def _decode(self, path):
+        """解码一张样本图像并提取特征（无法读取时返回None）"""
+        image = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            return None
+        return self.extract_features(image)
+
+    def load(self, dataset_path):
+        """
+        加载数据集
+        :param dataset_path: 数据集路径
+        :return: (特征矩阵, 标签数组)
+        """
+        start = time.perf_counter()
+        samples = self.scan(dataset_path)
+        total = len(samples)
+        cache_path = os.path.join(dataset_path, FEATURE_CACHE_NAME)
+        cached, known_failed = self._read_cache(cache_path) if self.use_cache else ({}, set())
+
+        rows = [cached.get((path, size, mtime)) for path, _, size, mtime in samples]
+        # 上次已经无法解码且没有变化的文件不再解码
+        missing = [i for i, (path, _, size, mtime) in enumerate(samples)
+                   if rows[i] is None and (path, size, mtime) not in known_failed]
+        if missing:
+            paths = [os.path.join(dataset_path, *samples[i][0].split('/')) for i in missing]
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(missing))) as executor:
+                for i, row in zip(missing, executor.map(self._decode, paths)):
+                    rows[i] = row
+
+        # 无法解码的图像跳过
+        failed = {(path, size, mtime) for (path, _, size, mtime), row in zip(samples, rows) if row is None}
+        unreadable = sorted(path for path, _, _ in failed)
+        if unreadable:
+            event_log.warning('dataset', error='无法读取的样本', files=unreadable[:10], count=len(unreadable))
+        kept = [i for i, row in enumerate(rows) if row is not None]
+        samples = [samples[i] for i in kept]
+        labels = np.array([label for _, label, _, _ in samples], dtype=np.int64)
+        features = np.array([rows[i] for i in kept]) if kept else np.empty((0, 0), dtype=np.float32)
+
+        # 有新增、修改或删除的样本（或无法解码的文件有变化）时更新缓存
+        changed = len(missing) > 0 or len(cached) != len(samples) or failed != known_failed
+        if self.use_cache and changed and samples:
+            self._write_cache(cache_path, samples, features, labels, failed)
+
+        self.last_samples = [(path, size, mtime) for path, _, size, mtime in samples]
+        self.last_stats = {
+            'samples': len(samples),
+            'decoded': len(missing),
+            'reused': total - len(missing),
+            'unreadable': len(unreadable),
+            'duration_ms': (time.perf_counter() - start) * 1000
+        }
+        event_log.info('dataset', path=dataset_path, **self.last_stats)
+        return features, labels
+
+
+class DatasetWatcher:
+    """后台监视数据集（定期轮询各字符文件夹），样本有变化时调用回调"""
+
+    def __init__(self, dataset_path, characters, callback, interval=30.0):
+        """
+        初始化监视器
+        :param dataset_path: 数据集路径
+        :param characters: 字符集
+        :param callback: 样本变化时调用的函数，参数为数据集路径
+        :param interval: 轮询间隔（秒）
+        """
+        self.dataset_path = dataset_path
+        self.callback = callback
+        self.interval = interval
+        self._loader = DatasetLoader(None, characters, use_cache=False)
+        self._stop = threading.Event()
+        self._thread = None
+        self._signature = None
+        self.triggers = 0
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """启动后台线程（以当前样本为基准，之后出现的变化才会触发回调）"""
+        if self.running:
+            return
+        self._signature = self._scan()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch_loop, name="dataset-watcher")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """停止后台线程"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._thread = None
+
+    def _scan(self):
+        if not os.path.isdir(self.dataset_path):
+            return ()
+        return tuple(self._loader.scan(self.dataset_path))
+
+    def check(self):
+        """
+        检查一次样本是否变化，有变化时调用回调
+        :return: 是否触发了回调
+        """
+        signature = self._scan()
+        if signature == self._signature:
+            return False
+        self._signature = signature
+        self.triggers += 1
+        event_log.info('dataset_watch', path=self.dataset_path, samples=len(signature))
+        self.callback(self.dataset_path)
+        return True
+
+    def _watch_loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                event_log.warning('dataset_watch', path=self.dataset_path, error=str(e))
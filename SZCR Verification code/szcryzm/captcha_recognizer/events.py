@@ -0,0 +1,104 @@
+import threading
+import time
+from collections import deque
+
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+LEVELS = {'debug': DEBUG, 'info': INFO, 'warning': WARNING}
+LEVEL_NAMES = {value: name for name, value in LEVELS.items()}
+
+
+class EventLog:
+    """
+    识别器的分级事件记录（默认关闭，关闭时每次调用只做一次比较）
+    开启后事件保存在环形缓冲区中，也可以同时交给其他输出（如print）
+    """
+
+    def __init__(self, level=None, capacity=1000):
+        """
+        初始化事件记录
+        :param level: 记录的最低级别（None表示关闭）
+        :param capacity: 环形缓冲区容量
+        """
+        self.level = level
+        self._events = deque(maxlen=capacity)
+        self._sinks = []
+        self._lock = threading.Lock()
+
+    def enable(self, level=INFO):
+        """
+        开启记录
+        :param level: 最低级别（DEBUG/INFO/WARNING，或'debug'/'info'/'warning'）
+        """
+        self.level = LEVELS[level] if isinstance(level, str) else level
+
+    def disable(self):
+        """关闭记录"""
+        self.level = None
+
+    def enabled_for(self, level):
+        """该级别的事件是否会被记录（记录前需要额外计算时先检查）"""
+        return self.level is not None and level >= self.level
+
+    def add_sink(self, sink):
+        """
+        添加事件输出
+        :param sink: 函数，参数为事件字典
+        """
+        with self._lock:
+            self._sinks.append(sink)
+
+    def emit(self, level, stage, **fields):
+        """
+        记录一个事件
+        :param level: 级别
+        :param stage: 阶段名称（如'psm'、'template_match'）
+        :param fields: 事件内容（策略、结果、得分、耗时等）
+        """
+        if self.level is None or level < self.level:
+            return
+        event = {'time': time.time(), 'level': LEVEL_NAMES.get(level, level), 'stage': stage,
+                 'thread': threading.current_thread().name}
+        event.update(fields)
+        with self._lock:
+            self._events.append(event)
+            sinks = list(self._sinks)
+        for sink in sinks:
+            sink(event)
+
+    def debug(self, stage, **fields):
+        self.emit(DEBUG, stage, **fields)
+
+    def info(self, stage, **fields):
+        self.emit(INFO, stage, **fields)
+
+    def warning(self, stage, **fields):
+        self.emit(WARNING, stage, **fields)
+
+    def events(self, stage=None, limit=None):
+        """
+        获取缓冲区中的事件
+        :param stage: 只返回该阶段的事件（可选）
+        :param limit: 最多返回最近的多少条（可选）
+        :return: 事件字典列表（按时间顺序）
+        """
+        with self._lock:
+            events = [event for event in self._events if stage is None or event['stage'] == stage]
+        return events[-limit:] if limit else events
+
+    def clear(self):
+        with self._lock:
+            self._events.clear()
+
+
+def print_event(event):
+    """把事件打印到标准输出（命令行调试时作为输出使用）"""
+    fields = ', '.join(f"{key}={value}" for key, value in event.items()
+                       if key not in ('time', 'level', 'stage', 'thread'))
+    print(f"[{event['level']}] {event['stage']}: {fields}")
+
+
+# 所有识别器共用的事件记录（默认关闭）
+event_log = EventLog()
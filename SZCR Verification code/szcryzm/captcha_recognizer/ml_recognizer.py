@@ -1,31 +1,80 @@
 import numpy as np
 import os
+import copy
+import pickle
+import threading
 from sklearn.neighbors import KNeighborsClassifier
 from sklearn.svm import SVC
 from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import SGDClassifier
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score
-import pickle
+import time
+import uuid
 import cv2
+from captcha_recognizer.preprocess import PreprocessPipeline
+from captcha_recognizer.cache import get_recognition_cache
+from captcha_recognizer.events import event_log, INFO
+from captcha_recognizer.budget import Deadline, RecognitionResult
+from captcha_recognizer.dataset import DatasetLoader
+from captcha_recognizer import model_store
+
+
+# 支持增量更新的模型类型（KNN直接加入新样本，SGD用partial_fit），其他类型增量更新时完整重新训练
+INCREMENTAL_MODEL_TYPES = ('knn', 'sgd')
+
+
+def training_state_path(model_path):
+    """模型训练状态文件的路径（已训练的样本和KNN的训练矩阵，与模型文件放在一起）"""
+    return f"{model_path}.state"
 
 
 class MLCaptchaRecognizer:
-    def __init__(self, model_type='knn'):
+    def __init__(self, model_type='knn', cache=None, use_cache=True):
         """
         初始化机器学习识别器
-        :param model_type: 模型类型 ('knn', 'svm', 'random_forest')
+        :param model_type: 模型类型 ('knn', 'svm', 'random_forest', 'sgd')
+        :param cache: 识别结果缓存（None表示使用进程内共享的缓存）
+        :param use_cache: 是否缓存识别结果
         """
         self.model_type = model_type
         self.model = None
+        # 模型标识（模型文件路径、修改时间和大小，未保存的模型为随机值），用作识别缓存的配置
+        self.model_version = None
+        self.cache = cache
+        self.use_cache = use_cache
+        # 字符分割流水线（第一次识别时创建并一直复用）
+        self._segmenter = None
+        # 最近一次加载数据集的统计（解码和复用缓存的样本数等）及各样本的(相对路径, 大小, 修改时间)
+        self.dataset_stats = {}
+        self.dataset_samples = []
+        # 当前模型已经训练过的样本（None表示未知，例如没有训练状态文件的旧模型）
+        self.trained_samples = None
+        # KNN模型fit时使用的特征和标签（增量更新时在其后追加新样本重新fit，其他模型类型为None）
+        self.train_features = None
+        self.train_labels = None
+        # 训练和增量更新互斥（识别不加锁，新模型训练完成后才替换self.model）
+        self._train_lock = threading.RLock()
         self.characters = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
         self.char_to_index = {char: i for i, char in enumerate(self.characters)}
         self.index_to_char = {i: char for i, char in enumerate(self.characters)}
 
+    def __getstate__(self):
+        # 复制到批量识别的工作进程时去掉锁和训练矩阵（工作进程只做识别）
+        state = self.__dict__.copy()
+        del state['_train_lock']
+        state['train_features'] = state['train_labels'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._train_lock = threading.RLock()
+
     def extract_features(self, image):
         """
         从图像中提取特征
         :param image: 灰度图像
-        :return: 特征向量
+        :return: float32特征向量
         """
         # 确保是灰度图
         if len(image.shape) == 3:
@@ -36,41 +85,91 @@ class MLCaptchaRecognizer:
         # 调整大小
         resized = cv2.resize(gray, (20, 20))
 
-        # 展平为特征向量
-        features = resized.flatten() / 255.0  # 归一化
+        # 展平为特征向量（float32：sklearn的距离计算直接在float32上进行，KNN模型的样本库也只占一半内存）
+        features = resized.ravel().astype(np.float32) / np.float32(255.0)  # 归一化
 
         return features
 
-    def load_dataset(self, dataset_path='data/dataset'):
+    def load_dataset(self, dataset_path='data/dataset', workers=None, use_cache=True):
         """
-        加载数据集
+        加载数据集（多线程解码，未变化的样本直接使用特征缓存）
         :param dataset_path: 数据集路径
+        :param workers: 解码线程数（None为CPU核心数）
+        :param use_cache: 是否使用数据集根目录下的特征缓存
         :return: 特征和标签
         """
-        features = []
-        labels = []
-
         if not os.path.exists(dataset_path):
             print(f"数据集路径不存在: {dataset_path}")
-            return np.array(features), np.array(labels)
+            return np.array([]), np.array([])
 
-        # 遍历所有子文件夹（每个文件夹对应一个字符）
-        for char in self.characters:
-            char_folder = os.path.join(dataset_path, char)
+        # 每个字符文件夹的标签为该字符在字符集中的索引
+        loader = DatasetLoader(self.extract_features, self.characters, workers, use_cache)
+        features, labels = loader.load(dataset_path)
+        self.dataset_stats = loader.last_stats
+        self.dataset_samples = loader.last_samples
+        return features, labels
 
-            if os.path.exists(char_folder):
-                for filename in os.listdir(char_folder):
-                    if filename.endswith('.png') or filename.endswith('.jpg'):
-                        # 加载图像
-                        img_path = os.path.join(char_folder, filename)
-                        img = cv2.imread(img_path, cv2.IMREAD_GRAYSCALE)
+    def _create_model(self):
+        """按模型类型创建未训练的模型"""
+        if self.model_type == 'knn':
+            return KNeighborsClassifier(n_neighbors=3)
+        elif self.model_type == 'svm':
+            return SVC(kernel='linear', probability=True)
+        elif self.model_type == 'random_forest':
+            return RandomForestClassifier(n_estimators=100)
+        elif self.model_type == 'sgd':
+            # 对数损失才能输出概率（置信度）
+            return SGDClassifier(loss='log_loss', random_state=42)
+        else:
+            raise ValueError(f"不支持的模型类型: {self.model_type}")
 
-                        # 提取特征
-                        feature = self.extract_features(img)
-                        features.append(feature)
-                        labels.append(self.char_to_index[char])
+    def _save_model(self, model_path=None):
+        """
+        保存模型（大数组单独保存为.npy文件，加载时内存映射）并更新模型标识
+        训练状态保存在单独的文件中，重新加载模型后增量更新仍然只处理新样本
+        :param model_path: 模型文件路径（默认data/models/<模型类型>_model.pkl）
+        """
+        if model_path is None:
+            model_dir = 'data/models'
+            os.makedirs(model_dir, exist_ok=True)
+            model_path = os.path.join(model_dir, f'{self.model_type}_model.pkl')
+        model_store.save_model(self.model, model_path)
+        self.model_version = self._file_version(model_path)
+        # 状态中记录模型文件的版本，模型文件之后被其他进程替换时不会误用这份状态
+        model_store.save_model({
+            'model_version': self.model_version,
+            'samples': sorted(self.trained_samples) if self.trained_samples is not None else None,
+            'features': self.train_features,
+            'labels': self.train_labels
+        }, training_state_path(model_path))
+        print(f"模型已保存到: {model_path}")
 
-        return np.array(features), np.array(labels)
+    def _set_training_state(self, samples, features=None, labels=None):
+        """
+        记录当前模型的训练状态
+        :param samples: 已训练的样本集合（None表示未知）
+        :param features: fit使用的特征矩阵（只有KNN保留）
+        :param labels: fit使用的标签
+        """
+        self.trained_samples = samples
+        keep = self.model_type == 'knn' and features is not None
+        self.train_features = features if keep else None
+        self.train_labels = labels if keep else None
+
+    def _load_training_state(self, model_path):
+        """读取与模型一起保存的训练状态（不存在或与模型文件版本不一致时视为未知，下次更新完整重新训练）"""
+        self._set_training_state(None)
+        state_path = training_state_path(model_path)
+        if not os.path.exists(state_path):
+            return
+        try:
+            state = model_store.load_model(state_path)
+        except (OSError, EOFError, pickle.UnpicklingError) as e:
+            event_log.warning('model_loaded', path=state_path, error=str(e))
+            return
+        if state.get('model_version') != self.model_version or state.get('samples') is None:
+            return
+        self._set_training_state(set(state['samples']), state['features'], state['labels'])
 
     def train(self, dataset_path='data/dataset', save_model=True):
         """
@@ -79,107 +178,305 @@ class MLCaptchaRecognizer:
         :param save_model: 是否保存模型
         :return: 训练准确率
         """
-        # 加载数据集
-        X, y = self.load_dataset(dataset_path)
+        with self._train_lock:
+            # 加载数据集
+            X, y = self.load_dataset(dataset_path)
 
-        if len(X) == 0:
-            print("没有找到训练数据")
-            return 0
+            if len(X) == 0:
+                print("没有找到训练数据")
+                return 0
 
-        # 划分训练集和测试集
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+            # 划分训练集和测试集
+            X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
 
-        # 创建模型
-        if self.model_type == 'knn':
-            self.model = KNeighborsClassifier(n_neighbors=3)
-        elif self.model_type == 'svm':
-            self.model = SVC(kernel='linear', probability=True)
-        elif self.model_type == 'random_forest':
-            self.model = RandomForestClassifier(n_estimators=100)
-        else:
-            raise ValueError(f"不支持的模型类型: {self.model_type}")
+            # 创建并训练模型（训练完成后再替换，训练期间的识别仍使用旧模型）
+            model = self._create_model()
+            model.fit(X_train, y_train)
+            self.model = model
+            self.model_version = uuid.uuid4().hex
+            self._set_training_state(set(self.dataset_samples), X_train, y_train)
 
-        # 训练模型
-        self.model.fit(X_train, y_train)
+            # 评估模型
+            y_pred = self.model.predict(X_test)
+            accuracy = accuracy_score(y_test, y_pred)
 
-        # 评估模型
-        y_pred = self.model.predict(X_test)
-        accuracy = accuracy_score(y_test, y_pred)
+            print(f"模型训练完成，测试集准确率: {accuracy:.2%}")
 
-        print(f"模型训练完成，测试集准确率: {accuracy:.2%}")
+            # 保存模型
+            if save_model:
+                self._save_model()
 
-        # 保存模型
-        if save_model:
-            model_dir = 'data/models'
-            os.makedirs(model_dir, exist_ok=True)
-            model_path = os.path.join(model_dir, f'{self.model_type}_model.pkl')
-            with open(model_path, 'wb') as f:
-                pickle.dump(self.model, f)
-            print(f"模型已保存到: {model_path}")
+            return accuracy
+
+    def update(self, dataset_path='data/dataset', save_model=True):
+        """
+        增量更新模型：只把数据集中新增的样本加入现有模型
+        KNN把新样本加入样本库，SGD对新样本调用partial_fit；
+        其他模型类型、没有可更新的模型、已训练的样本被修改或删除、出现模型没见过的字符时完整重新训练
+        :param dataset_path: 数据集路径
+        :param save_model: 是否保存模型
+        :return: {'mode': 'none'/'append'/'partial_fit'/'full', 'new_samples': 新样本数, 'accuracy': 完整训练时的准确率}
+        """
+        with self._train_lock:
+            X, y = self.load_dataset(dataset_path)
+            samples = self.dataset_samples
+            trained = self.trained_samples
+
+            if (self.model is None or trained is None or self.model_type not in INCREMENTAL_MODEL_TYPES
+                    or (self.model_type == 'knn' and self.train_features is None)
+                    or not trained.issubset(samples)):
+                return {'mode': 'full', 'new_samples': len(samples), 'accuracy': self.train(dataset_path, save_model)}
+
+            new = [i for i, sample in enumerate(samples) if sample not in trained]
+            if not new:
+                return {'mode': 'none', 'new_samples': 0}
+            X_new, y_new = X[new], y[new]
+            features = labels = None
+
+            if self.model_type == 'knn':
+                # KNN的训练就是保存样本：在保存的训练矩阵后追加新样本重新fit
+                features = np.vstack([self.train_features, X_new])
+                labels = np.concatenate([self.train_labels, y_new])
+                model = self._create_model()
+                model.fit(features, labels)
+                mode = 'append'
+            else:
+                if not np.isin(y_new, self.model.classes_).all():
+                    # partial_fit不能加入新的类别
+                    return {'mode': 'full', 'new_samples': len(samples),
+                            'accuracy': self.train(dataset_path, save_model)}
+                model = copy.deepcopy(self.model)
+                model.partial_fit(X_new, y_new)
+                mode = 'partial_fit'
 
-        return accuracy
+            self.model = model
+            self.model_version = uuid.uuid4().hex
+            self._set_training_state(trained | {samples[i] for i in new}, features, labels)
+            event_log.info('model_update', model_type=self.model_type, mode=mode, new_samples=len(new),
+                           samples=len(samples))
+            if save_model:
+                self._save_model()
+            return {'mode': mode, 'new_samples': len(new)}
 
     def load_model(self, model_path=None):
         """
         加载已训练的模型
+        同一进程内加载同一个模型文件的识别器共用一个模型对象，大数组以内存映射方式加载，多个进程共用同一份物理内存
         :param model_path: 模型文件路径
         """
         if model_path is None:
             model_path = f'data/models/{self.model_type}_model.pkl'
 
         if os.path.exists(model_path):
-            with open(model_path, 'rb') as f:
-                self.model = pickle.load(f)
-            print(f"模型已从 {model_path} 加载")
+            self.model = model_store.load_shared_model(model_path, self._compact_model)
+            self.model_version = self._file_version(model_path)
+            self._load_training_state(model_path)
+            event_log.info('model_loaded', path=model_path, model_type=self.model_type,
+                           trained_samples=len(self.trained_samples) if self.trained_samples is not None else None)
             return True
         else:
-            print(f"模型文件不存在: {model_path}")
+            event_log.warning('model_loaded', path=model_path, error='模型文件不存在')
             return False
 
-    def predict(self, image):
+    @staticmethod
+    def _compact_model(model):
+        """
+        把旧版本保存的float64 KNN样本库转换为float32（与当前的特征类型一致，内存减半）
+        :param model: 加载的模型
+        :return: 模型
+        """
+        fit_X = getattr(model, '_fit_X', None)
+        if isinstance(model, KNeighborsClassifier) and fit_X is not None and fit_X.dtype != np.float32:
+            # 重新fit以同时重建可能存在的树索引（KNN的fit只是保存样本）
+            model.fit(fit_X.astype(np.float32), model.classes_[model._y])
+            event_log.info('model_loaded', compacted='float64 -> float32', samples=len(fit_X))
+        return model
+
+    def predict(self, image, expected_length=None, budget=None):
         """
         识别验证码
         :param image: 图像
-        :return: 识别结果
+        :param expected_length: 已知的验证码长度（可选）
+        :param budget: 时间预算（秒或Deadline，可选）
+        :return: RecognitionResult
+        """
+        return self.predict_with_confidence(image, expected_length, budget)[0]
+
+    @staticmethod
+    def _file_version(model_path):
+        stat = os.stat(model_path)
+        return f"{os.path.abspath(model_path)}:{stat.st_mtime_ns}:{stat.st_size}"
+
+    def get_cache(self):
+        """获取识别结果缓存（未启用时返回None）"""
+        if not self.use_cache:
+            return None
+        return self.cache if self.cache is not None else get_recognition_cache()
+
+    def predict_with_confidence(self, image, expected_length=None, budget=None):
+        """
+        识别验证码，同时给出模型对各字符预测概率的平均值（同一张图像的结果会被缓存）
+        :param image: 图像
+        :param expected_length: 已知的验证码长度（可选）
+        :param budget: 时间预算（秒或Deadline），用完后剩余字符记为'?'，结果标记为超时
+        :return: (RecognitionResult, 置信度；模型不支持概率输出时为None)
         """
         if self.model is None:
-            print("模型未加载，请先训练或加载模型")
-            return ""
-
-        # 预处理图像
-        if isinstance(image, str):
-            img = cv2.imread(image)
-        elif isinstance(image, Image.Image):
-            # 如果是PIL图像，转换为numpy数组
-            import numpy as np
-            img = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-        else:
-            img = image
+            event_log.warning('ml_predict', error='模型未加载，请先训练或加载模型')
+            return RecognitionResult(""), None
+
+        deadline = Deadline.of(budget)
+        cache = self.get_cache()
+        if cache is None:
+            return self._predict_with_confidence(image, expected_length, deadline)
+        key = cache.make_key(image, 'ml', (self.model_type, self.model_version, expected_length))
+        # 超时得到的不完整结果和无法分割出字符时的空结果不缓存
+        text, confidence = cache.get_or_compute(
+            key, lambda: self._predict_with_confidence(image, expected_length, deadline),
+            should_cache=lambda r: bool(r[0]) and not r[0].timed_out)
+        return (text if isinstance(text, RecognitionResult) else RecognitionResult(text)), confidence
+
+    @property
+    def segmenter(self):
+        """字符分割流水线（只创建一次，避免每次识别都重新配置Tesseract路径）"""
+        if self._segmenter is None:
+            from captcha_recognizer.traditional_recognizer import TraditionalCaptchaRecognizer
+            self._segmenter = TraditionalCaptchaRecognizer(use_cache=False)
+        return self._segmenter
+
+    def segment(self, image, expected_length=None):
+        """
+        预处理并分割字符
+        :param image: 文件路径、PIL图像、数组或其他识别方法已用过的PreprocessPipeline
+        :param expected_length: 已知的验证码长度（可选）
+        :return: 字符图像列表
+        """
+        processed = self.segmenter.preprocess_image(PreprocessPipeline.of(image))
+        characters, _ = self.segmenter.segment_characters(processed, expected_length)
+        return characters
+
+    def _classify(self, features):
+        """
+        一次预测多个字符
+        :param features: (字符数, 特征数)的特征矩阵
+        :return: (预测的类别数组, 各预测类别的概率数组；模型不支持概率输出时为None)
+        """
+        if not hasattr(self.model, 'predict_proba'):
+            return self.model.predict(features), None
+
+        # KNN和随机森林的predict就是概率最大的类别，只需一次predict_proba；
+        # SVC的概率由Platt缩放单独估计，可能与predict不一致，仍以predict为准
+        proba = self.model.predict_proba(features)
+        rows = np.arange(len(features))
+        if isinstance(self.model, SVC):
+            predictions = self.model.predict(features)
+            return predictions, proba[rows, np.searchsorted(self.model.classes_, predictions)]
+        best = proba.argmax(axis=1)
+        return self.model.classes_[best], proba[rows, best]
+
+    def _predict_characters(self, captchas):
+        """
+        把多张验证码的所有字符拼成一个特征矩阵，只调用一次模型
+        :param captchas: 每张验证码分割出的字符图像列表
+        :return: [(识别结果, 置信度), ...]
+        """
+        texts = [["?"] * len(characters) for characters in captchas]
+        rows = []
+        positions = []
+        for i, characters in enumerate(captchas):
+            for j, char_img in enumerate(characters):
+                try:
+                    rows.append(self.extract_features(char_img))
+                    positions.append((i, j))
+                except Exception as e:
+                    event_log.warning('ml_predict', error=f"提取字符特征时出错: {e}")
+
+        probabilities = [[] for _ in captchas]
+        if rows:
+            try:
+                predictions, confidences = self._classify(np.vstack(rows))
+                for k, (i, j) in enumerate(positions):
+                    texts[i][j] = self.index_to_char[int(predictions[k])]
+                    if confidences is not None:
+                        probabilities[i].append(confidences[k])
+            except Exception as e:
+                event_log.warning('ml_predict', error=f"识别字符时出错: {e}")
+
+        return [(''.join(text), float(np.mean(proba)) if proba else None)
+                for text, proba in zip(texts, probabilities)]
+
+    def _predict_with_confidence(self, image, expected_length=None, deadline=None):
+        """机器学习识别（不经过缓存）"""
+        deadline = Deadline.of(deadline)
+        start = time.perf_counter()
 
         # 分割字符
-        from captcha_recognizer.traditional_recognizer import TraditionalCaptchaRecognizer
-        recognizer = TraditionalCaptchaRecognizer()
-        processed = recognizer.preprocess_image(img)
-        characters, _ = recognizer.segment_characters(processed)
+        characters = self.segment(image, expected_length)
 
         # 如果没有分割到字符，返回空字符串
         if not characters:
-            print("警告：无法分割字符")
-            return ""
+            event_log.warning('ml_predict', error='无法分割字符')
+            return RecognitionResult(""), None
 
-        # 识别每个字符
-        result = ""
-        for char_img in characters:
-            try:
-                # 提取特征
-                features = self.extract_features(char_img).reshape(1, -1)
+        if deadline.expired():
+            # 时间预算在分割阶段已经用完，字符不再识别
+            result, confidence, timed_out = "?" * len(characters), None, True
+        else:
+            # 所有字符一次预测
+            (result, confidence), = self._predict_characters([characters])
+            timed_out = False
 
-                # 预测
-                prediction = self.model.predict(features)[0]
-                char = self.index_to_char[prediction]
-                result += char
-            except Exception as e:
-                print(f"识别字符时出错: {e}")
-                result += "?"
+        if event_log.enabled_for(INFO):
+            event_log.info('ml_predict', result=result, confidence=confidence, characters=len(characters),
+                           timed_out=timed_out, duration_ms=(time.perf_counter() - start) * 1000)
+        return RecognitionResult(result, timed_out), confidence
 
-        return result
\ No newline at end of file
+    def predict_many(self, images, expected_length=None):
+        """
+        识别多张验证码，所有未命中缓存的验证码的字符合并后只调用一次模型
+        :param images: 图像的可迭代对象
+        :param expected_length: 已知的验证码长度（可选）
+        :return: [(RecognitionResult, 置信度), ...]，顺序与输入一致
+        """
+        images = list(images)
+        if self.model is None:
+            event_log.warning('ml_predict', error='模型未加载，请先训练或加载模型')
+            return [(RecognitionResult(""), None) for _ in images]
+
+        start = time.perf_counter()
+        cache = self.get_cache()
+        results = [None] * len(images)
+        keys = [None] * len(images)
+        pending = []
+        for i, image in enumerate(images):
+            if cache is not None:
+                keys[i] = cache.make_key(image, 'ml', (self.model_type, self.model_version, expected_length))
+                cached = cache.get(keys[i])
+                if cached is not None:
+                    results[i] = (RecognitionResult(cached[0]), cached[1])
+                    continue
+            pending.append(i)
+
+        captchas = [self.segment(images[i], expected_length) for i in pending]
+        for i, (text, confidence) in zip(pending, self._predict_characters(captchas)):
+            results[i] = (RecognitionResult(text), confidence)
+            # 与predict_with_confidence相同，无法分割出字符时的空结果不缓存
+            if cache is not None and text:
+                cache.put(keys[i], (text, confidence))
+
+        if event_log.enabled_for(INFO):
+            event_log.info('ml_predict_many', images=len(images), predicted=len(pending),
+                           characters=sum(len(characters) for characters in captchas),
+                           duration_ms=(time.perf_counter() - start) * 1000)
+        return results
+
+    def recognize_batch(self, source, workers=1, **options):
+        """
+        批量识别验证码（多进程时模型会复制到每个工作进程）
+        :param source: 图像文件夹、分片归档文件夹或图像/路径的可迭代对象
+        :param workers: 进程数（1为串行，None为CPU核心数）
+        :param options: 其他参数（chunk_size）
+        :return: 生成器，每次返回BatchResult(id, prediction, confidence, timings, label, error)
+        """
+        from captcha_recognizer.batch import recognize_batch
+        return recognize_batch(source, 'ml', self, workers, **options)
\ No newline at end of file
@@ -0,0 +1,166 @@
+import os
+import pickle
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+import numpy as np
+from captcha_recognizer.events import event_log
+
+try:
+    import fcntl
+    msvcrt = None
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+# 不小于该字节数的数组单独保存为.npy文件，加载时内存映射
+MIN_MAPPED_BYTES = 64 * 1024
+
+
+def arrays_folder(model_path):
+    """模型的数组文件夹（与模型文件放在一起）"""
+    return f"{model_path}.arrays"
+
+
+# 每个模型文件一个线程锁（同一进程内的保存和加载互斥）
+_path_locks = {}
+_path_locks_lock = threading.Lock()
+
+
+@contextmanager
+def model_lock(model_path):
+    """
+    对同一模型文件的保存和加载加锁：进程内使用线程锁，进程之间使用模型文件旁的.lock文件
+    避免两次保存交错时，先完成的一次在清理旧数组时删除后一次（当前生效的模型）的数组
+    :param model_path: 模型文件路径
+    """
+    path = os.path.abspath(model_path)
+    with _path_locks_lock:
+        lock = _path_locks.setdefault(path, threading.Lock())
+    with lock, open(f"{path}.lock", 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.01)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class _ArrayPickler(pickle.Pickler):
+    """把大数组写成.npy文件，pickle中只保留文件名"""
+
+    def __init__(self, file, folder, token):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.folder = folder
+        self.token = token
+        self.count = 0
+        # 同一个数组被多处引用时只保存一次（同时保留数组引用，保证id不会被复用）
+        self._saved = {}
+
+    def persistent_id(self, obj):
+        if type(obj) not in (np.ndarray, np.memmap) or obj.dtype.hasobject or obj.nbytes < MIN_MAPPED_BYTES:
+            return None
+        saved = self._saved.get(id(obj))
+        if saved is not None:
+            return saved[0]
+        name = f"{self.token}/{self.count}.npy"
+        self.count += 1
+        np.save(os.path.join(self.folder, name), np.ascontiguousarray(obj), allow_pickle=False)
+        self._saved[id(obj)] = (('npy', name), obj)
+        return ('npy', name)
+
+
+class _ArrayUnpickler(pickle.Unpickler):
+    """
+    按文件名内存映射.npy文件
+    使用写时复制映射：部分sklearn扩展（如libsvm）要求可写缓冲区，只读取的页面仍与页缓存共用，多个进程共用同一份物理内存
+    """
+
+    def __init__(self, file, folder):
+        super().__init__(file)
+        self.folder = folder
+
+    def persistent_load(self, pid):
+        kind, name = pid
+        if kind != 'npy':
+            raise pickle.UnpicklingError(f"未知的持久化对象: {kind}")
+        return np.load(os.path.join(self.folder, *name.split('/')), mmap_mode='c', allow_pickle=False)
+
+
+def save_model(model, model_path):
+    """
+    保存模型：大数组写入单独的.npy文件，其余部分用pickle保存
+    每次保存使用新的子文件夹，正在被其他进程内存映射的旧文件不会被覆盖
+    写入、替换和清理在模型锁内进行，同一路径的并发保存（多个用户、后台自动更新或多个进程）不会互相删除数组
+    :param model: 模型
+    :param model_path: 模型文件路径
+    """
+    folder = arrays_folder(model_path)
+    token = uuid.uuid4().hex
+    with model_lock(model_path):
+        os.makedirs(os.path.join(folder, token))
+
+        temp_path = f"{model_path}.{token}.tmp"
+        with open(temp_path, 'wb') as f:
+            pickler = _ArrayPickler(f, folder, token)
+            pickler.dump(model)
+        os.replace(temp_path, model_path)
+
+        # 清理旧版本的数组（仍被映射时删除可能失败，留到下次保存再清理）
+        for name in os.listdir(folder):
+            if name != token:
+                shutil.rmtree(os.path.join(folder, name), ignore_errors=True)
+    event_log.info('model_saved', path=model_path, mapped_arrays=pickler.count)
+
+
+def load_model(model_path):
+    """
+    加载模型（大数组以写时复制方式内存映射，旧格式的普通pickle同样可以加载）
+    加载时持有模型锁，读取到的pickle所引用的数组不会在映射之前被并发的保存清理掉
+    :param model_path: 模型文件路径
+    :return: 模型
+    """
+    with model_lock(model_path), open(model_path, 'rb') as f:
+        return _ArrayUnpickler(f, arrays_folder(model_path)).load()
+
+
+# 进程内共享的已加载模型（按路径、修改时间和大小，所有Web用户共用同一个模型对象）
+_models = {}
+_models_lock = threading.Lock()
+
+
+def load_shared_model(model_path, prepare=None):
+    """
+    加载进程内共享的模型，文件没有变化时直接返回已加载的模型
+    共享的模型不能被原地修改（训练和增量更新都会创建新的模型对象）
+    :param model_path: 模型文件路径
+    :param prepare: 第一次加载后对模型的处理函数（可选）
+    :return: 模型
+    """
+    path = os.path.abspath(model_path)
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    with _models_lock:
+        entry = _models.get(path)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+        model = load_model(path)
+        if prepare is not None:
+            model = prepare(model)
+        _models[path] = (version, model)
+    return model
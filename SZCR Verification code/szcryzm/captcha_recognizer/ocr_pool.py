@@ -0,0 +1,179 @@
+import io
+import os
+import queue
+import subprocess
+import threading
+import time
+import numpy as np
+import pytesseract
+from PIL import Image
+
+try:
+    import tesserocr
+    TESSEROCR_AVAILABLE = True
+except ImportError:
+    TESSEROCR_AVAILABLE = False
+
+
+class _TesserocrWorker:
+    """常驻的tesserocr引擎（语言数据只加载一次，识别时释放GIL）"""
+
+    def __init__(self, lang='eng'):
+        self.api = tesserocr.PyTessBaseAPI(lang=lang, oem=tesserocr.OEM.DEFAULT)
+
+    def image_to_string(self, image, psm, whitelist, timeout=None):
+        self.api.SetPageSegMode(int(psm))
+        self.api.SetVariable('tessedit_char_whitelist', whitelist)
+        self.api.SetImage(image)
+        if timeout is not None:
+            # Recognize的超时参数单位为毫秒，超时后引擎中止识别
+            if not self.api.Recognize(max(1, int(timeout * 1000))):
+                raise TimeoutError("Tesseract识别超时")
+        return self.api.GetUTF8Text()
+
+    def close(self):
+        self.api.End()
+
+
+class _CommandLineWorker:
+    """
+    tesseract命令行后备方案：图像通过stdin传入、结果从stdout读取，不写临时文件
+    每次识别都要启动一个tesseract进程并重新加载语言数据（通常为几十到上百毫秒），
+    比常驻的tesserocr引擎慢得多；需要吞吐量时应安装requirements-optional.txt中的tesserocr
+    """
+
+    def __init__(self, lang='eng'):
+        self.lang = lang
+
+    def image_to_string(self, image, psm, whitelist, timeout=None):
+        buffer = io.BytesIO()
+        image.save(buffer, format='PNG', compress_level=1)
+        command = [pytesseract.pytesseract.tesseract_cmd, 'stdin', 'stdout', '-l', self.lang,
+                   '--oem', '3', '--psm', str(psm), '-c', f'tessedit_char_whitelist={whitelist}']
+        try:
+            completed = subprocess.run(command, input=buffer.getvalue(), stdout=subprocess.PIPE,
+                                       stderr=subprocess.PIPE, timeout=timeout)
+        except FileNotFoundError:
+            raise pytesseract.TesseractNotFoundError()
+        except subprocess.TimeoutExpired:
+            # subprocess.run在超时后已经结束了子进程
+            raise TimeoutError("Tesseract识别超时")
+        if completed.returncode != 0:
+            raise pytesseract.TesseractError(completed.returncode,
+                                             completed.stderr.decode('utf-8', 'ignore').strip())
+        return completed.stdout.decode('utf-8', 'ignore')
+
+    def close(self):
+        pass
+
+
+class OCRWorkerPool:
+    """Tesseract工作池（固定数量的OCR引擎，调用时借出、用完归还）"""
+
+    def __init__(self, size=None, lang='eng', backend=None):
+        """
+        初始化工作池
+        :param size: 引擎数量（默认与CPU核数相同，最多4个）
+        :param lang: 识别语言
+        :param backend: 'tesserocr'（常驻引擎）或 'cli'（命令行，每次调用启动一个进程），默认有tesserocr时使用tesserocr
+        """
+        if backend is None:
+            backend = 'tesserocr' if TESSEROCR_AVAILABLE else 'cli'
+        if backend not in ('tesserocr', 'cli'):
+            raise ValueError(f"不支持的OCR后端: {backend}")
+        if backend == 'tesserocr' and not TESSEROCR_AVAILABLE:
+            raise ValueError("未安装tesserocr，无法使用常驻引擎")
+
+        self.size = size or min(4, os.cpu_count() or 1)
+        self.lang = lang
+        self.backend = backend
+
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._workers = []
+        self.calls = 0
+        self.seconds = 0.0
+
+    def _create_worker(self):
+        if self.backend == 'tesserocr':
+            return _TesserocrWorker(self.lang)
+        return _CommandLineWorker(self.lang)
+
+    def _acquire(self, timeout=None):
+        """借出一个空闲引擎，未达到数量上限时新建，否则等待归还"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._workers) < self.size:
+                worker = self._create_worker()
+                self._workers.append(worker)
+                return worker
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError("等待空闲的OCR引擎超时")
+
+    def image_to_string(self, image, psm, whitelist='', timeout=None):
+        """
+        识别图像中的文本
+        :param image: PIL图像对象或numpy数组
+        :param psm: 页面分割模式
+        :param whitelist: 字符白名单
+        :param timeout: 超时时间（秒，包括等待空闲引擎的时间），超时抛出TimeoutError
+        :return: 识别出的原始文本
+        """
+        if isinstance(image, np.ndarray):
+            image = Image.fromarray(image)
+
+        start = time.perf_counter()
+        worker = self._acquire(timeout)
+        if timeout is not None:
+            timeout = max(0.0, timeout - (time.perf_counter() - start))
+        start = time.perf_counter()
+        try:
+            return worker.image_to_string(image, psm, whitelist, timeout)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.calls += 1
+                self.seconds += elapsed
+            self._idle.put(worker)
+
+    def stats(self):
+        """
+        获取工作池统计
+        :return: 统计字典
+        """
+        with self._lock:
+            return {
+                'backend': self.backend,
+                'size': self.size,
+                'engines': len(self._workers),
+                'calls': self.calls,
+                'avg_ms': self.seconds * 1000 / self.calls if self.calls else 0
+            }
+
+    def close(self):
+        """释放所有引擎"""
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.close()
+        self._idle = queue.LifoQueue()
+
+
+# 进程内共享的工作池（所有识别器实例和Web用户共用）
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_ocr_pool():
+    """获取共享的OCR工作池"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = OCRWorkerPool()
+    return _pool
@@ -0,0 +1,136 @@
+import threading
+import cv2
+import numpy as np
+from PIL import Image
+
+
+# Tesseract前放大的倍数（Tesseract在小图像上表现不佳）
+UPSCALE_FACTOR = 3
+# 形态学操作的核（只创建一次）
+MORPH_KERNEL = np.ones((2, 2), np.uint8)
+
+# CLAHE对象不是线程安全的，每个线程按参数各保留一个
+_clahe_local = threading.local()
+
+
+def get_clahe(clip_limit=2.0, tile_grid_size=(8, 8)):
+    """
+    获取当前线程复用的CLAHE对象
+    :param clip_limit: 对比度限制
+    :param tile_grid_size: 网格大小
+    :return: cv2.CLAHE
+    """
+    cache = getattr(_clahe_local, 'cache', None)
+    if cache is None:
+        cache = _clahe_local.cache = {}
+    key = (clip_limit, tile_grid_size)
+    clahe = cache.get(key)
+    if clahe is None:
+        clahe = cache[key] = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=tile_grid_size)
+    return clahe
+
+
+def to_grayscale(image):
+    """
+    把文件路径、PIL图像或OpenCV数组转换为灰度数组
+    :param image: 文件路径、PIL图像对象或numpy数组（彩色为BGR顺序）
+    :return: 灰度uint8数组
+    """
+    if isinstance(image, str):
+        image = Image.open(image)
+
+    if isinstance(image, Image.Image):
+        if image.mode == 'L':
+            return np.array(image)
+        return cv2.cvtColor(np.array(image.convert('RGB')), cv2.COLOR_RGB2GRAY)
+
+    # 批量生成的灰度数组可直接使用
+    return image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+class PreprocessPipeline:
+    """
+    单张图像的预处理流水线
+    各阶段在第一次访问时计算并缓存，同一张图像被多种识别方法使用时不会重复预处理
+    阶段依赖关系: gray -> upscaled -> clahe -> tesseract（自适应二值化）；gray -> otsu
+    """
+
+    STAGES = ('gray', 'upscaled', 'clahe', 'tesseract', 'otsu')
+
+    def __init__(self, image):
+        """
+        :param image: 文件路径、PIL图像对象或numpy数组
+        """
+        self.image = image
+        self._stages = {}
+
+    @classmethod
+    def of(cls, image):
+        """
+        获取图像的流水线（已经是流水线时直接返回）
+        :param image: 图像或PreprocessPipeline
+        :return: PreprocessPipeline
+        """
+        return image if isinstance(image, cls) else cls(image)
+
+    def stage(self, name):
+        """
+        获取某个阶段的结果
+        :param name: 阶段名称，见STAGES
+        :return: uint8数组
+        """
+        result = self._stages.get(name)
+        if result is None:
+            if name not in self.STAGES:
+                raise ValueError(f"未知的预处理阶段: {name}")
+            result = getattr(self, f'_compute_{name}')()
+            self._stages[name] = result
+        return result
+
+    @property
+    def gray(self):
+        return self.stage('gray')
+
+    @property
+    def upscaled(self):
+        return self.stage('upscaled')
+
+    @property
+    def clahe(self):
+        return self.stage('clahe')
+
+    @property
+    def tesseract(self):
+        """针对Tesseract增强的二值图像"""
+        return self.stage('tesseract')
+
+    @property
+    def otsu(self):
+        """标准预处理（Otsu二值化，用于字符分割和模板匹配）"""
+        return self.stage('otsu')
+
+    def _compute_gray(self):
+        return to_grayscale(self.image)
+
+    def _compute_upscaled(self):
+        height, width = self.gray.shape
+        return cv2.resize(self.gray, (width * UPSCALE_FACTOR, height * UPSCALE_FACTOR),
+                          interpolation=cv2.INTER_CUBIC)
+
+    def _compute_clahe(self):
+        # 增强对比度
+        return get_clahe(2.0).apply(self.upscaled)
+
+    def _compute_tesseract(self):
+        # 去噪
+        denoised = cv2.medianBlur(self.clahe, 3)
+        # 自适应二值化（比全局二值化更好）
+        binary = cv2.adaptiveThreshold(denoised, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
+        # 形态学操作去除小噪点
+        binary = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, MORPH_KERNEL)
+        return cv2.morphologyEx(binary, cv2.MORPH_OPEN, MORPH_KERNEL)
+
+    def _compute_otsu(self):
+        _, binary = cv2.threshold(self.gray, 128, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+        # 去噪
+        return cv2.medianBlur(binary, 3)
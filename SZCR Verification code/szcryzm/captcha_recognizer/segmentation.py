@@ -0,0 +1,152 @@
+import cv2
+import numpy as np
+
+
+class CharacterSegmenter:
+    """基于连通域的字符分割（粘连字符按列投影拆分）"""
+
+    def __init__(self, min_height_ratio=0.25, min_area=20, char_aspect=0.75, split_ratio=1.75):
+        """
+        初始化分割器
+        :param min_height_ratio: 字符最小高度占图像高度的比例（更矮的连通域视为噪点）
+        :param min_area: 字符最小像素数
+        :param char_aspect: 单个字符的估计宽高比（用于判断连通域是否包含多个字符）
+        :param split_ratio: 连通域宽度超过估计字符宽度的该倍数时进行拆分
+        """
+        self.min_height_ratio = min_height_ratio
+        self.min_area = min_area
+        self.char_aspect = char_aspect
+        self.split_ratio = split_ratio
+
+    @staticmethod
+    def foreground(image):
+        """
+        获取前景掩码（浅色背景上的深色文字会被反转，保证文字为前景）
+        :param image: 二值图像
+        :return: 前景为1的uint8数组
+        """
+        mask = image > 127
+        if mask.mean() > 0.5:
+            mask = ~mask
+        return mask.astype(np.uint8)
+
+    def _components(self, mask):
+        """
+        查找并过滤连通域（一次性按数组过滤，按x坐标排序）
+        :return: (N, 4)的[x, y, w, h]数组
+        """
+        _, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        stats = stats[1:]
+        min_height = max(2, int(mask.shape[0] * self.min_height_ratio))
+        keep = ((stats[:, cv2.CC_STAT_HEIGHT] >= min_height) &
+                (stats[:, cv2.CC_STAT_AREA] >= self.min_area) &
+                (stats[:, cv2.CC_STAT_WIDTH] >= 2))
+        boxes = stats[keep, :4]
+        return boxes[np.argsort(boxes[:, 0], kind='stable')]
+
+    @staticmethod
+    def _tighten(mask, x0, x1, y0=0, y1=None):
+        """把列区间[x0, x1)的框收紧到其中前景所在的行"""
+        y1 = mask.shape[0] if y1 is None else y1
+        rows = np.flatnonzero(mask[y0:y1, x0:x1].any(axis=1))
+        if len(rows) == 0:
+            return x0, y0, x1 - x0, y1 - y0
+        return x0, y0 + rows[0], x1 - x0, rows[-1] - rows[0] + 1
+
+    def _split(self, mask, box, parts):
+        """
+        在列投影的低谷处把一个框拆分为若干个
+        :param box: (x, y, w, h)
+        :param parts: 拆分数量
+        :return: 拆分后的框列表
+        """
+        x, y, w, h = box
+        if parts < 2 or w < parts * 2:
+            return [tuple(box)]
+
+        profile = mask[y:y + h, x:x + w].sum(axis=0)
+        window = max(1, w // (parts * 4))
+        cuts = [0]
+        for j in range(1, parts):
+            ideal = j * w // parts
+            low = max(cuts[-1] + 1, ideal - window)
+            high = min(w - 1, ideal + window + 1)
+            cuts.append(low + int(np.argmin(profile[low:high])) if high > low else ideal)
+        cuts.append(w)
+
+        return [self._tighten(mask, x + start, x + stop, y, y + h)
+                for start, stop in zip(cuts[:-1], cuts[1:]) if stop > start]
+
+    def _box_area(self, mask, box):
+        x, y, w, h = box
+        return int(mask[y:y + h, x:x + w].sum())
+
+    def layout_boxes(self, mask, length):
+        """
+        按生成器的字符布局切分（困难验证码第i个字符的中心在 (i+1) * (宽度 // (长度+1)) 处）
+        :param mask: 前景掩码
+        :param length: 字符数量
+        :return: 框列表
+        """
+        width = mask.shape[1]
+        pitch = width // (length + 1)
+        boxes = []
+        for i in range(length):
+            center = (i + 1) * pitch
+            x0 = max(0, center - pitch // 2)
+            x1 = min(width, x0 + pitch)
+            boxes.append(self._tighten(mask, x0, x1))
+        return boxes
+
+    def segment_boxes(self, image, expected_length=None, layout_prior=False):
+        """
+        计算字符边界框
+        :param image: 预处理后的二值图像
+        :param expected_length: 已知的字符数量（可选，用于拆分粘连字符或去掉多余的噪点）
+        :param layout_prior: 是否直接使用生成器的字符间距布局（需要expected_length）
+        :return: 从左到右的(x, y, w, h)列表
+        """
+        mask = self.foreground(image)
+
+        if layout_prior:
+            if not expected_length:
+                raise ValueError("按布局分割需要提供字符数量")
+            return [tuple(int(v) for v in box) for box in self.layout_boxes(mask, expected_length)]
+
+        boxes = self._components(mask)
+        if len(boxes) == 0:
+            return []
+
+        # 明显过宽的连通域（粘连字符或穿过字符的干扰线）按估计字符宽度拆分
+        char_width = max(1.0, float(np.median(boxes[:, 3])) * self.char_aspect)
+        result = []
+        for box in boxes:
+            if box[2] > char_width * self.split_ratio:
+                result.extend(self._split(mask, box, int(round(box[2] / char_width))))
+            else:
+                result.append(tuple(box))
+
+        if expected_length:
+            # 数量不足时继续拆分最宽的框，多出来的去掉像素最少的框
+            while len(result) < expected_length:
+                widest = max(range(len(result)), key=lambda i: result[i][2])
+                pieces = self._split(mask, result[widest], 2)
+                if len(pieces) < 2:
+                    break
+                result[widest:widest + 1] = pieces
+            while len(result) > expected_length:
+                del result[min(range(len(result)), key=lambda i: self._box_area(mask, result[i]))]
+
+        return [tuple(int(v) for v in box) for box in result]
+
+    def segment(self, image, expected_length=None, layout_prior=False):
+        """
+        分割字符
+        :param image: 预处理后的二值图像
+        :param expected_length: 已知的字符数量（可选）
+        :param layout_prior: 是否使用生成器的字符间距布局
+        :return: (字符图像列表, 边界框列表)
+        """
+        boxes = self.segment_boxes(image, expected_length, layout_prior)
+        characters = [image[y:y + h, x:x + w] for x, y, w, h in boxes]
+        return characters, boxes
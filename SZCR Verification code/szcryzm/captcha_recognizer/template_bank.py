@@ -0,0 +1,156 @@
+import hashlib
+import os
+import threading
+import time
+import cv2
+import numpy as np
+
+
+TEMPLATE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+# 匹配前字符和模板统一缩放到的尺寸 (宽, 高)
+CANONICAL_SIZE = (24, 32)
+
+
+def normalize_patches(images, size=CANONICAL_SIZE):
+    """
+    把图像缩放到统一尺寸、去均值并归一化，结果按行堆叠
+    两个归一化向量的点积即为归一化相关系数（与TM_CCOEFF_NORMED相同）
+    :param images: 灰度图像列表
+    :param size: 统一尺寸 (宽, 高)
+    :return: (图像数, 宽*高)的float32矩阵
+    """
+    patches = np.empty((len(images), size[0] * size[1]), dtype=np.float32)
+    for i, image in enumerate(images):
+        patches[i] = cv2.resize(image, size, interpolation=cv2.INTER_AREA).ravel()
+    patches -= patches.mean(axis=1, keepdims=True)
+    norms = np.linalg.norm(patches, axis=1, keepdims=True)
+    # 纯色图像没有相关性可言，得分为0
+    np.divide(patches, norms, out=patches, where=norms > 0)
+    patches[norms[:, 0] == 0] = 0
+    return patches
+
+
+class TemplateBank:
+    """字符模板库（加载一次后常驻内存，模板文件变化时自动重新加载）"""
+
+    _banks = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, folder, check_interval=1.0):
+        """
+        初始化模板库
+        :param folder: 模板文件夹（文件名第一个字符为模板字符）
+        :param check_interval: 两次检查文件变化的最小间隔（秒）
+        """
+        self.folder = os.path.abspath(folder)
+        self.check_interval = check_interval
+        self.templates = {}
+        self.chars = []
+        self.matrix = None
+        self.loads = 0
+        # 模板文件签名的摘要（模板变化后改变，用作识别缓存的配置）
+        self.version = None
+
+        self._signature = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, folder):
+        """
+        获取进程内共享的模板库（所有识别器实例和Web用户共用）
+        :param folder: 模板文件夹
+        :return: TemplateBank
+        """
+        key = os.path.abspath(folder)
+        with cls._registry_lock:
+            bank = cls._banks.get(key)
+            if bank is None:
+                bank = cls(key)
+                cls._banks[key] = bank
+            return bank
+
+    def _list_files(self):
+        """列出模板文件"""
+        if not os.path.exists(self.folder):
+            raise Exception(f"模板文件夹不存在: {self.folder}。请先创建模板文件夹并添加字符模板文件。")
+        try:
+            return sorted(f for f in os.listdir(self.folder) if f.lower().endswith(TEMPLATE_EXTENSIONS))
+        except Exception as e:
+            raise Exception(f"无法读取模板文件夹: {self.folder}，错误: {str(e)}")
+
+    def _scan(self):
+        """
+        计算文件夹签名
+        :return: ((文件名, 修改时间, 大小), ...)
+        """
+        signature = []
+        for filename in self._list_files():
+            try:
+                stat = os.stat(os.path.join(self.folder, filename))
+            except OSError:
+                continue
+            signature.append((filename, stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    def _load(self, signature):
+        """按签名中的文件重新加载全部模板"""
+        if not signature:
+            raise Exception(f"模板文件夹为空: {self.folder}。请添加字符模板文件（文件名格式：A.png, B.png等）。")
+
+        templates = {}
+        for filename, _, _ in signature:
+            template = cv2.imread(os.path.join(self.folder, filename), cv2.IMREAD_GRAYSCALE)
+            if template is None:
+                continue
+            _, template = cv2.threshold(template, 128, 255, cv2.THRESH_BINARY)
+            templates[filename[0].upper()] = template
+
+        if not templates:
+            raise Exception(f"无法加载模板文件，请检查模板文件格式是否正确。已尝试加载 {len(signature)} 个文件，但都失败了。")
+
+        self.templates = templates
+        # 所有模板堆叠成一个矩阵，匹配时一次矩阵乘法算出全部得分
+        self.chars = sorted(templates)
+        self.matrix = normalize_patches([templates[char] for char in self.chars])
+        self.loads += 1
+
+    def get_templates(self):
+        """
+        获取模板（距上次检查超过check_interval时比较文件签名，有变化才重新加载）
+        :return: {字符: 二值化模板图像}
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._signature is None or now - self._checked_at >= self.check_interval:
+                signature = self._scan()
+                if signature != self._signature:
+                    self._load(signature)
+                    self._signature = signature
+                    self.version = hashlib.blake2b(repr(signature).encode(), digest_size=8).hexdigest()
+                self._checked_at = now
+            return self.templates
+
+    def match(self, characters):
+        """
+        把每个字符与全部模板进行归一化相关匹配
+        :param characters: 分割出的字符图像列表
+        :return: 每个字符一项 (最佳字符, 最佳得分, 次佳字符, 次佳得分)，没有次佳模板时为(None, -1.0)
+        """
+        self.get_templates()
+        with self._lock:
+            chars, matrix = self.chars, self.matrix
+        if not characters:
+            return []
+
+        scores = normalize_patches(characters) @ matrix.T
+        order = np.argsort(-scores, axis=1)[:, :2]
+        matches = []
+        for row, ranked in zip(scores, order):
+            best = ranked[0]
+            if len(ranked) > 1:
+                runner_up, runner_up_score = chars[ranked[1]], float(row[ranked[1]])
+            else:
+                runner_up, runner_up_score = None, -1.0
+            matches.append((chars[best], float(row[best]), runner_up, runner_up_score))
+        return matches
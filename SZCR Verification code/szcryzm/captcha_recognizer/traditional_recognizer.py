@@ -3,11 +3,66 @@ import numpy as np
 import pytesseract
 from PIL import Image
 import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from captcha_recognizer.ocr_pool import get_ocr_pool
+from captcha_recognizer.template_bank import TemplateBank
+from captcha_recognizer.preprocess import PreprocessPipeline, get_clahe
+from captcha_recognizer.segmentation import CharacterSegmenter
+from captcha_recognizer.cache import get_recognition_cache
+from captcha_recognizer.events import event_log, DEBUG, INFO, WARNING
+from captcha_recognizer.budget import Deadline, RecognitionResult
+
+
+TESSERACT_WHITELIST = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+
+# 整体识别的PSM策略（默认顺序）
+PSM_MODES = [
+    ('8', '单个单词'),  # 单个单词
+    ('7', '单行文本'),  # 单行文本
+    ('13', '原始行'),   # 原始行，不进行特殊处理
+    ('6', '统一文本块') # 统一文本块
+]
+
+# OCR线程池（线程数与OCR工作池的引擎数相同）
+_ocr_executor = None
+_ocr_executor_lock = threading.Lock()
+
+
+def get_ocr_executor():
+    """获取共享的OCR线程池"""
+    global _ocr_executor
+    if _ocr_executor is None:
+        with _ocr_executor_lock:
+            if _ocr_executor is None:
+                _ocr_executor = ThreadPoolExecutor(max_workers=get_ocr_pool().size,
+                                                   thread_name_prefix='tesseract')
+    return _ocr_executor
+
+
+def is_plausible_result(text):
+    """识别结果长度是否合理（3-6个字符），满足即可提前结束其他策略"""
+    return 3 <= len(text) <= 6
 
 
 class TraditionalCaptchaRecognizer:
-    def __init__(self):
-        """初始化传统识别器"""
+    # 各难度下每个PSM策略胜出的次数（所有识别器共享，用于调整尝试顺序）
+    _psm_wins = {}
+    _psm_lock = threading.Lock()
+
+    def __init__(self, cache=None, use_cache=True):
+        """
+        初始化传统识别器
+        :param cache: 识别结果缓存（None表示使用进程内共享的缓存）
+        :param use_cache: 是否缓存识别结果
+        """
+        self.segmenter = CharacterSegmenter()
+        self.cache = cache
+        self.use_cache = use_cache
+
         # 设置Tesseract路径（根据你的安装位置调整）
         import platform
         if platform.system() == 'Windows':
@@ -32,105 +87,169 @@ class TraditionalCaptchaRecognizer:
                 if os.path.exists(path):
                     pytesseract.pytesseract.tesseract_cmd = path
                     tesseract_found = True
-                    print(f"Tesseract路径已设置为: {path}")
+                    event_log.info('tesseract_path', path=path)
                     break
             
             # 如果都没找到，使用用户指定的路径
             if not tesseract_found:
                 default_path = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
                 pytesseract.pytesseract.tesseract_cmd = default_path
-                print(f"使用默认Tesseract路径: {default_path}")
+                event_log.info('tesseract_path', path=default_path, default=True)
                 if not os.path.exists(default_path):
-                    print(f"警告: Tesseract路径不存在: {default_path}")
+                    event_log.warning('tesseract_path', path=default_path, error='Tesseract路径不存在')
 
     def preprocess_image(self, image, enhance_for_tesseract=False):
         """
         预处理图像
-        :param image: PIL图像对象或文件路径
+        :param image: PIL图像对象、文件路径、numpy数组或PreprocessPipeline
         :param enhance_for_tesseract: 是否针对Tesseract进行增强处理
         :return: 处理后的图像
         """
-        # 如果输入是文件路径，加载图像
-        if isinstance(image, str):
-            image = Image.open(image)
+        # 同一张图像的各预处理阶段只计算一次（传入流水线时直接复用）
+        pipeline = PreprocessPipeline.of(image)
+        if enhance_for_tesseract:
+            # 放大 -> CLAHE增强对比度 -> 去噪 -> 自适应二值化 -> 形态学去噪
+            return pipeline.tesseract
+        # 标准预处理（Otsu二值化 + 去噪，用于模板匹配等）
+        return pipeline.otsu
 
-        # 转换为OpenCV格式
-        if isinstance(image, Image.Image):
-            image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+    def ordered_psm_modes(self, difficulty=None):
+        """
+        按历史胜出次数排列PSM策略（次数相同时保持默认顺序）
+        :param difficulty: 验证码难度（None表示未知）
+        :return: [(psm, 描述), ...]
+        """
+        with self._psm_lock:
+            wins = Counter(self._psm_wins.get(difficulty or 'default', {}))
+        return sorted(PSM_MODES, key=lambda mode: -wins[mode[0]])
 
-        # 转换为灰度图
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    def record_psm_win(self, difficulty, psm):
+        """记录某个PSM策略在该难度下胜出一次"""
+        with self._psm_lock:
+            self._psm_wins.setdefault(difficulty or 'default', Counter())[psm] += 1
 
-        if enhance_for_tesseract:
-            # 针对Tesseract的增强预处理
-            # 1. 放大图像（Tesseract在小图像上表现不佳）
-            scale_factor = 3
-            height, width = gray.shape
-            gray = cv2.resize(gray, (width * scale_factor, height * scale_factor), interpolation=cv2.INTER_CUBIC)
-            
-            # 2. 增强对比度
-            clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-            gray = clahe.apply(gray)
-            
-            # 3. 去噪
-            gray = cv2.medianBlur(gray, 3)
-            
-            # 4. 应用自适应二值化（比全局二值化更好）
-            binary = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
-            
-            # 5. 形态学操作去除小噪点
-            kernel = np.ones((2, 2), np.uint8)
-            binary = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
-            binary = cv2.morphologyEx(binary, cv2.MORPH_OPEN, kernel)
-            
-            return binary
-        else:
-            # 标准预处理（用于模板匹配等）
-            # 应用二值化
-            _, binary = cv2.threshold(gray, 128, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
-            
-            # 去噪
-            denoised = cv2.medianBlur(binary, 3)
-            
-            return denoised
+    def psm_stats(self):
+        """
+        获取各难度下PSM策略的胜出次数
+        :return: {难度: {psm: 次数}}
+        """
+        with self._psm_lock:
+            return {difficulty: dict(wins) for difficulty, wins in self._psm_wins.items()}
+
+    def _run_psm(self, processed, psm, deadline):
+        """用一种PSM模式识别整张图像，返回过滤后的文本（超过截止时间抛出TimeoutError）"""
+        if deadline.expired():
+            raise TimeoutError("超出时间预算，跳过该策略")
+        start = time.perf_counter()
+        text = get_ocr_pool().image_to_string(processed, psm, TESSERACT_WHITELIST, deadline.remaining())
+        # 去掉空白并过滤无效字符
+        text = ''.join(c for c in text.upper() if c in TESSERACT_WHITELIST)
+        # 事件不会被记录时不构造事件内容
+        if event_log.enabled_for(DEBUG):
+            event_log.debug('psm', psm=psm, result=text, duration_ms=(time.perf_counter() - start) * 1000)
+        return text
 
-    def recognize_with_tesseract(self, image):
+    def _run_psm_strategies(self, processed, psm_modes, deadline):
         """
-        使用Tesseract OCR识别验证码
-        使用多种策略提高识别准确率
-        :param image: 图像
-        :return: 识别结果
+        在线程池中并发运行各PSM策略，按优先级采纳结果：
+        只有优先级更高的策略都已结束且没有长度合理的结果时，才采纳某个策略的结果，采纳后取消其余策略
+        （低优先级策略先完成时不会抢先胜出，结果与串行按顺序尝试一致）
+        :param processed: 预处理后的图像
+        :param psm_modes: 按优先级排列的[(psm, 描述), ...]
+        :param deadline: 截止时间，到期后不再等待未完成的策略
+        :return: (按策略顺序排列的[(文本, 描述, psm), ...], 被采纳的结果或None, 是否超时)
         """
+        executor = get_ocr_executor()
+        futures = [(executor.submit(self._run_psm, processed, psm, deadline), psm, desc) for psm, desc in psm_modes]
+
+        results = {}
+        accepted = None
+        timed_out = False
         try:
-            # 策略1: 增强预处理 + 整体识别
-            processed = self.preprocess_image(image, enhance_for_tesseract=True)
-            
-            # 尝试多种PSM模式
-            psm_modes = [
-                ('8', '单个单词'),  # 单个单词
-                ('7', '单行文本'),  # 单行文本
-                ('13', '原始行'),   # 原始行，不进行特殊处理
-                ('6', '统一文本块') # 统一文本块
-            ]
-            
-            results = []
-            for psm, desc in psm_modes:
+            for future, psm, desc in futures:
+                # 等待优先级最高的未结束策略
+                if not wait([future], timeout=deadline.remaining()).done:
+                    timed_out = True
+                    break
                 try:
-                    config = f'--psm {psm} --oem 3 -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
-                    text = pytesseract.image_to_string(processed, config=config)
-                    text = text.strip().replace(' ', '').replace('\n', '').replace('\t', '').upper()
-                    # 过滤无效字符
-                    text = ''.join(c for c in text if c in 'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789')
-                    if text:
-                        results.append((text, desc))
-                        print(f"PSM {psm} ({desc}) 识别结果: {text}")
+                    text = future.result()
+                except pytesseract.TesseractNotFoundError:
+                    raise
+                except TimeoutError as e:
+                    timed_out = True
+                    event_log.warning('psm', psm=psm, error=str(e))
+                    continue
                 except Exception as e:
-                    print(f"PSM {psm} 识别失败: {str(e)}")
+                    event_log.warning('psm', psm=psm, error=str(e))
                     continue
+                if text:
+                    results[psm] = (text, desc, psm)
+                    if is_plausible_result(text):
+                        accepted = results[psm]
+                        break
+        finally:
+            # 取消还在排队的策略；已经开始的策略会在截止时间到达时被中止，结果被丢弃
+            for future, _, _ in futures:
+                future.cancel()
+
+        if timed_out:
+            # 超时时保留已经成功完成的低优先级策略的结果，供调用方选出已有的最佳结果
+            for future, psm, desc in futures:
+                if (psm not in results and future.done() and not future.cancelled()
+                        and future.exception() is None and future.result()):
+                    results[psm] = (future.result(), desc, psm)
+        return [results[psm] for psm, _ in psm_modes if psm in results], accepted, timed_out
+
+    def get_cache(self):
+        """获取识别结果缓存（未启用时返回None）"""
+        if not self.use_cache:
+            return None
+        return self.cache if self.cache is not None else get_recognition_cache()
+
+    def recognize_with_tesseract(self, image, difficulty=None, budget=None):
+        """
+        使用Tesseract OCR识别验证码
+        使用多种策略提高识别准确率，各策略并发运行，得到长度合理的结果后立即返回
+        同一张图像的识别结果会被缓存
+        :param image: 图像或PreprocessPipeline
+        :param difficulty: 验证码难度（可选，用于按历史胜出情况调整策略顺序）
+        :param budget: 时间预算（秒或Deadline），用完后跳过剩余策略，返回已有的最佳结果
+        :return: RecognitionResult（timed_out表示是否因超出预算提前结束）
+        """
+        deadline = Deadline.of(budget)
+        cache = self.get_cache()
+        if cache is None:
+            return self._recognize_with_tesseract(image, difficulty, deadline)
+        key = cache.make_key(image, 'tesseract', (difficulty, TESSERACT_WHITELIST))
+        # 超时得到的不完整结果不缓存
+        result = cache.get_or_compute(key, lambda: self._recognize_with_tesseract(image, difficulty, deadline),
+                                      should_cache=lambda r: bool(r) and not r.timed_out)
+        return result if isinstance(result, RecognitionResult) else RecognitionResult(result)
+
+    def _recognize_with_tesseract(self, image, difficulty=None, deadline=None):
+        """Tesseract识别（不经过缓存）"""
+        deadline = Deadline.of(deadline)
+        try:
+            # 策略1: 增强预处理 + 整体识别（多种PSM模式并发）
+            # 整体识别和字符分割共用一条流水线，灰度转换只做一次
+            image = PreprocessPipeline.of(image)
+            processed = self.preprocess_image(image, enhance_for_tesseract=True)
+            psm_results, accepted, timed_out = self._run_psm_strategies(
+                processed, self.ordered_psm_modes(difficulty), deadline)
+
+            if accepted:
+                text, desc, psm = accepted
+                self.record_psm_win(difficulty, psm)
+                event_log.info('tesseract_result', result=text, source=desc)
+                return RecognitionResult(text)
+
+            results = [(text, desc) for text, desc, _ in psm_results]
             
-            # 策略2: 如果整体识别效果不好，尝试字符分割后逐个识别
-            if not results or len(results[0][0]) < 3:
-                print("尝试字符分割识别...")
+            # 策略2: 如果整体识别效果不好，尝试字符分割后逐个识别（时间预算已用完时跳过）
+            if deadline.expired():
+                timed_out = True
+            elif not results or len(results[0][0]) < 3:
+                segment_start = time.perf_counter()
                 try:
                     # 使用标准预处理进行字符分割
                     processed_seg = self.preprocess_image(image, enhance_for_tesseract=False)
@@ -139,20 +258,25 @@ class TraditionalCaptchaRecognizer:
                     if characters and len(characters) >= 3:
                         char_results = []
                         for i, char_img in enumerate(characters):
+                            if deadline.expired():
+                                timed_out = True
+                                break
                             # 放大单个字符
                             h, w = char_img.shape
                             if h > 0 and w > 0:
                                 char_img_large = cv2.resize(char_img, (w * 4, h * 4), interpolation=cv2.INTER_CUBIC)
                                 
                                 # 增强对比度
-                                clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
-                                char_img_large = clahe.apply(char_img_large)
+                                char_img_large = get_clahe(3.0).apply(char_img_large)
                                 
                                 # 识别单个字符
-                                config = '--psm 10 --oem 3 -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
-                                char_text = pytesseract.image_to_string(char_img_large, config=config)
-                                char_text = char_text.strip().replace(' ', '').replace('\n', '').upper()
-                                char_text = ''.join(c for c in char_text if c in 'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789')
+                                try:
+                                    char_text = get_ocr_pool().image_to_string(char_img_large, 10, TESSERACT_WHITELIST,
+                                                                               deadline.remaining())
+                                except TimeoutError:
+                                    timed_out = True
+                                    break
+                                char_text = ''.join(c for c in char_text.upper() if c in TESSERACT_WHITELIST)
                                 
                                 if char_text:
                                     char_results.append(char_text[0])  # 只取第一个字符
@@ -162,11 +286,13 @@ class TraditionalCaptchaRecognizer:
                                 char_results.append('?')
                         
                         segmented_result = ''.join(char_results)
-                        if segmented_result and '?' not in segmented_result:
+                        if len(char_results) == len(characters) and '?' not in segmented_result:
                             results.append((segmented_result, '字符分割识别'))
-                            print(f"字符分割识别结果: {segmented_result}")
+                        if event_log.enabled_for(DEBUG):
+                            event_log.debug('segment_fallback', result=segmented_result, characters=len(characters),
+                                            duration_ms=(time.perf_counter() - segment_start) * 1000)
                 except Exception as e:
-                    print(f"字符分割识别失败: {str(e)}")
+                    event_log.warning('segment_fallback', error=str(e))
             
             # 选择最佳结果
             if results:
@@ -175,15 +301,19 @@ class TraditionalCaptchaRecognizer:
                 for text, desc in results:
                     if 3 <= len(text) <= 6:
                         best_result = text
-                        print(f"选择结果: {text} (来源: {desc})")
+                        event_log.info('tesseract_result', result=text, source=desc)
                         break
                 
                 # 如果没有长度合理的，选择最长的
                 if not best_result:
                     best_result = max(results, key=lambda x: len(x[0]))[0]
-                    print(f"选择最长结果: {best_result}")
+                    event_log.info('tesseract_result', result=best_result, source='最长结果')
                 
-                return best_result
+                return RecognitionResult(best_result, timed_out)
+            elif timed_out:
+                # 预算内没有得到任何结果
+                event_log.warning('tesseract_result', error='超出时间预算', budget=deadline.budget)
+                return RecognitionResult('', timed_out=True)
             else:
                 raise Exception("所有识别策略都失败了，无法识别验证码")
                 
@@ -192,123 +322,109 @@ class TraditionalCaptchaRecognizer:
         except Exception as e:
             raise Exception(f"Tesseract识别时出错: {str(e)}")
 
-    def segment_characters(self, image):
+    def segment_characters(self, image, expected_length=None, layout_prior=False):
         """
-        分割验证码中的字符
+        分割验证码中的字符（连通域分割，粘连字符按列投影拆分）
         :param image: 预处理后的图像
-        :return: 字符列表
+        :param expected_length: 已知的验证码长度（可选，分割数量会调整为该长度）
+        :param layout_prior: 是否按生成器的字符间距布局分割（适合困难验证码，需要expected_length）
+        :return: (字符列表, 边界框列表)
         """
-        # 查找轮廓（兼容不同版本的OpenCV）
-        contours_result = cv2.findContours(image, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        # OpenCV 3.x 返回 (image, contours, hierarchy)
-        # OpenCV 4.x 返回 (contours, hierarchy)
-        contours = contours_result[0] if len(contours_result) == 2 else contours_result[1]
-
-        characters = []
-        bounding_boxes = []
-
-        for contour in contours:
-            # 获取边界框
-            x, y, w, h = cv2.boundingRect(contour)
-
-            # 过滤太小的区域（可能是噪点）
-            if w > 10 and h > 20:
-                bounding_boxes.append((x, y, w, h))
-
-        # 按x坐标排序（从左到右）
-        bounding_boxes.sort(key=lambda box: box[0])
-
-        # 提取每个字符
-        for x, y, w, h in bounding_boxes:
-            char_image = image[y:y + h, x:x + w]
-            characters.append(char_image)
+        return self.segmenter.segment(image, expected_length, layout_prior)
 
-        return characters, bounding_boxes
-
-    def recognize_with_template_matching(self, image, template_folder='data/templates'):
+    def recognize_with_template_matching(self, image, template_folder='data/templates', expected_length=None,
+                                         budget=None):
         """
         使用模板匹配识别验证码
         :param image: 图像
         :param template_folder: 模板文件夹
-        :return: 识别结果
+        :param expected_length: 已知的验证码长度（可选）
+        :param budget: 时间预算（秒或Deadline，可选）
+        :return: RecognitionResult
         """
-        # 预处理图像
-        processed = self.preprocess_image(image)
-
-        # 分割字符
-        characters, _ = self.segment_characters(processed)
-        
-        if not characters:
-            raise Exception("无法分割字符，请检查验证码图像")
+        return self.match_templates(image, template_folder, expected_length, budget)[0]
 
+    def match_templates(self, image, template_folder='data/templates', expected_length=None, budget=None):
+        """
+        使用模板匹配识别验证码，同时返回每个字符的匹配得分
+        :param image: 图像或PreprocessPipeline
+        :param template_folder: 模板文件夹
+        :param expected_length: 已知的验证码长度（可选）
+        :param budget: 时间预算（秒或Deadline），在阶段之间检查，用完时返回空的超时结果
+        :return: (RecognitionResult, 每个字符的最佳得分列表)
+        """
+        deadline = Deadline.of(budget)
+        if deadline.expired():
+            # 预算已经用完时直接返回，不读取模板，也不处理图像
+            event_log.warning('template_match', error='超出时间预算', budget=deadline.budget)
+            return RecognitionResult('', timed_out=True), []
         # 转换为绝对路径
         if not os.path.isabs(template_folder):
             # 如果是相对路径，尝试从当前工作目录和脚本目录查找
             base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
             template_folder = os.path.join(base_dir, template_folder)
-        
-        # 检查模板文件夹
-        if not os.path.exists(template_folder):
-            raise Exception(f"模板文件夹不存在: {template_folder}。请先创建模板文件夹并添加字符模板文件。")
-
-        # 加载模板
-        templates = {}
-        try:
-            template_files = [f for f in os.listdir(template_folder) if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
-        except Exception as e:
-            raise Exception(f"无法读取模板文件夹: {template_folder}，错误: {str(e)}")
-        
-        if not template_files:
-            raise Exception(f"模板文件夹为空: {template_folder}。请添加字符模板文件（文件名格式：A.png, B.png等）。")
-        
-        print(f"找到 {len(template_files)} 个模板文件: {', '.join(template_files[:10])}")
-        
-        for filename in template_files:
-            char = filename[0].upper()  # 假设文件名第一个字符是模板字符
-            template_path = os.path.join(template_folder, filename)
-            template = cv2.imread(template_path, cv2.IMREAD_GRAYSCALE)
-            if template is None:
-                print(f"警告: 无法加载模板文件 {template_path}")
-                continue
-            _, template = cv2.threshold(template, 128, 255, cv2.THRESH_BINARY)
-            templates[char] = template
-            print(f"加载模板: {char} <- {filename}")
-
-        if not templates:
-            raise Exception(f"无法加载模板文件，请检查模板文件格式是否正确。已尝试加载 {len(template_files)} 个文件，但都失败了。")
-        
-        print(f"成功加载 {len(templates)} 个模板: {', '.join(sorted(templates.keys()))}")
 
-        recognized_text = ""
+        cache = self.get_cache()
+        if cache is None:
+            return self._match_templates(image, template_folder, expected_length, deadline)
+        # 模板文件变化后版本号改变，旧的缓存结果不再命中
+        bank = TemplateBank.shared(template_folder)
+        bank.get_templates()
+        key = cache.make_key(image, 'template', (bank.version, expected_length))
+        text, scores = cache.get_or_compute(
+            key, lambda: self._match_templates(image, template_folder, expected_length, deadline),
+            should_cache=lambda r: not r[0].timed_out)
+        return (text if isinstance(text, RecognitionResult) else RecognitionResult(text)), list(scores)
 
-        # 对每个字符进行模板匹配
-        for char_img in characters:
-            best_match = None
-            best_score = -1
+    def _match_templates(self, image, template_folder, expected_length=None, deadline=None):
+        """模板匹配（不经过缓存）"""
+        deadline = Deadline.of(deadline)
+        start = time.perf_counter()
+        # 预处理图像
+        processed = self.preprocess_image(image)
 
-            for char, template in templates.items():
-                # 调整模板大小以匹配字符
-                if char_img.shape[0] > 0 and char_img.shape[1] > 0:
-                    try:
-                        resized_template = cv2.resize(template, (char_img.shape[1], char_img.shape[0]))
+        # 分割字符
+        characters, _ = self.segment_characters(processed, expected_length)
+        
+        if not characters:
+            raise Exception("无法分割字符，请检查验证码图像")
 
-                        # 模板匹配
-                        result = cv2.matchTemplate(char_img, resized_template, cv2.TM_CCOEFF_NORMED)
-                        score = cv2.minMaxLoc(result)[1]
+        if deadline.expired():
+            event_log.warning('template_match', error='超出时间预算', budget=deadline.budget)
+            return RecognitionResult('', timed_out=True), []
 
-                        if score > best_score:
-                            best_score = score
-                            best_match = char
-                    except Exception:
-                        continue
+        # 从共享模板库获取模板（只在模板文件变化时重新加载），所有字符与全部模板一次完成匹配
+        matches = TemplateBank.shared(template_folder).match(characters)
 
+        recognized_text = ""
+        for best_match, best_score, _, _ in matches:
             # 如果找到匹配，添加到结果
-            if best_match and best_score > 0.5:
+            if best_score > 0.5:
                 recognized_text += best_match
             else:
                 recognized_text += "?"
 
         if not recognized_text or recognized_text == "?" * len(characters):
+            if event_log.enabled_for(WARNING):
+                event_log.warning('template_match', error='没有得分超过阈值的模板',
+                                  scores=[round(best_score, 3) for _, best_score, _, _ in matches])
             raise Exception("模板匹配失败，未找到合适的匹配。请检查模板文件是否与验证码字符样式匹配。")
 
-        return recognized_text
\ No newline at end of file
+        scores = [best_score for _, best_score, _, _ in matches]
+        if event_log.enabled_for(INFO):
+            event_log.info('template_match', result=recognized_text, scores=[round(s, 3) for s in scores],
+                           runner_up=[runner_up for _, _, runner_up, _ in matches],
+                           duration_ms=(time.perf_counter() - start) * 1000)
+        return RecognitionResult(recognized_text), scores
+
+    def recognize_batch(self, source, method='tesseract', workers=1, **options):
+        """
+        批量识别验证码（文件名或归档中带标签时可用summarize_batch计算准确率）
+        :param source: 图像文件夹、分片归档文件夹或图像/路径的可迭代对象
+        :param method: 识别方法 ('tesseract', 'template')
+        :param workers: 进程数（1为串行，None为CPU核心数）
+        :param options: 其他参数（template_folder, difficulty, chunk_size）
+        :return: 生成器，每次返回BatchResult(id, prediction, confidence, timings, label, error)
+        """
+        from captcha_recognizer.batch import recognize_batch
+        return recognize_batch(source, method, self, workers, **options)
\ No newline at end of file
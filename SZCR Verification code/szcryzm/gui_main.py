@@ -14,6 +14,7 @@ from captcha_generator.generator import CaptchaGenerator
 from captcha_recognizer.traditional_recognizer import TraditionalCaptchaRecognizer
 from captcha_recognizer.ml_recognizer import MLCaptchaRecognizer
 from utils.utils import HistoryManager, validate_captcha
+from utils.archive import open_batch_writer
 
 
 class ModernCaptchaGUI:
@@ -505,7 +506,7 @@ class ModernCaptchaGUI:
         """批量生成对话框"""
         dialog = Toplevel(self.root)
         dialog.title("批量生成验证码")
-        dialog.geometry("400x300")
+        dialog.geometry("400x380")
         dialog.configure(bg='white')
         dialog.transient(self.root)
         dialog.grab_set()
@@ -540,14 +541,23 @@ class ModernCaptchaGUI:
         Radiobutton(difficulty_frame, text="中等", variable=difficulty_var, value="medium", bg='white').pack(side=LEFT, padx=5)
         Radiobutton(difficulty_frame, text="困难", variable=difficulty_var, value="hard", bg='white').pack(side=LEFT, padx=5)
         
+        # 输出格式选择
+        Label(frame, text="输出格式:", font=('Microsoft YaHei UI', 10), bg='white').pack(anchor=W, pady=5)
+        output_var = StringVar(value="png")
+        output_frame = Frame(frame, bg='white')
+        output_frame.pack(pady=5)
+        for text, value in (("PNG", "png"), ("tar", "tar"), ("zip", "zip"), ("npy", "npy")):
+            Radiobutton(output_frame, text=text, variable=output_var, value=value, bg='white').pack(side=LEFT, padx=5)
+        
         def start_batch():
             try:
                 count = int(count_var.get())
                 length = int(length_var.get())
                 difficulty = difficulty_var.get()
+                output = output_var.get()
                 
                 dialog.destroy()
-                self.batch_generate(count, difficulty, length)
+                self.batch_generate(count, difficulty, length, output)
             except ValueError:
                 messagebox.showerror("错误", "请输入有效的数字")
         
@@ -555,11 +565,10 @@ class ModernCaptchaGUI:
                bg='#28a745', fg='white', relief=FLAT, padx=20, pady=8,
                command=start_batch).pack(pady=20)
     
-    def batch_generate(self, count, difficulty, length):
+    def batch_generate(self, count, difficulty, length, output='png'):
         """批量生成验证码"""
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         folder = f"data/batch_{difficulty}_{timestamp}"
-        os.makedirs(folder, exist_ok=True)
         
         progress = Toplevel(self.root)
         progress.title("批量生成中...")
@@ -575,15 +584,15 @@ class ModernCaptchaGUI:
         
         def generate_thread():
             success_count = 0
-            batch_gen = self.generator.batch_generate(count, difficulty, length)
+            # 数量较多时使用多进程并行生成
+            batch_gen = self.generator.batch_generate(count, difficulty, length, workers=None)
             
-            for i, (text, image) in enumerate(batch_gen, 1):
-                filename = f"captcha_{i:03d}_{text}.png"
-                filepath = os.path.join(folder, filename)
-                image.save(filepath)
-                success_count += 1
-                
-                self.root.after(0, lambda i=i: progress_var.set(f"{i}/{count}"))
+            with open_batch_writer(folder, output) as writer:
+                for i, (text, image) in enumerate(batch_gen, 1):
+                    writer.add(text, image)
+                    success_count += 1
+                    
+                    self.root.after(0, lambda i=i: progress_var.set(f"{i}/{count}"))
             
             self.root.after(0, lambda: progress.destroy())
             self.root.after(0, lambda: messagebox.showinfo("完成", f"成功生成 {success_count} 个验证码\n保存位置: {folder}"))
@@ -5,10 +5,12 @@ from datetime import datetime
 # 添加项目根目录到路径
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from captcha_generator.generator import CaptchaGenerator
+from captcha_generator.generator import CaptchaGenerator, check_seed
 from captcha_recognizer.traditional_recognizer import TraditionalCaptchaRecognizer
 from captcha_recognizer.ml_recognizer import MLCaptchaRecognizer
+from captcha_recognizer.events import event_log, print_event
 from utils.utils import HistoryManager, display_image, validate_captcha
+from utils.archive import open_batch_writer
 
 
 class CaptchaSystem:
@@ -156,6 +158,14 @@ class CaptchaSystem:
             count = 10
             length = 5
 
+        try:
+            seed_input = input("请输入随机种子 (可选，相同种子结果可复现): ").strip()
+            seed = int(seed_input) if seed_input else None
+            check_seed(seed)
+        except ValueError:
+            print("种子无效（需为非负整数），使用随机种子")
+            seed = None
+
         print("\n选择难度:")
         print("1. 简单")
         print("2. 中等")
@@ -172,26 +182,33 @@ class CaptchaSystem:
             print("无效选择，使用中等难度")
             difficulty = 'medium'
 
+        print("\n选择输出格式:")
+        print("1. PNG文件 (每个验证码一个文件)")
+        print("2. tar分片归档")
+        print("3. zip分片归档")
+        print("4. npy数组分片")
+        output_choice = input("请选择 (默认1): ").strip()
+        output = {'2': 'tar', '3': 'zip', '4': 'npy'}.get(output_choice, 'png')
+
         # 创建保存文件夹
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         folder = f"data/batch_{difficulty}_{timestamp}"
-        os.makedirs(folder, exist_ok=True)
 
         # 批量生成
         print(f"\n开始批量生成 {count} 个验证码...")
-        batch_gen = self.generator.batch_generate(count, difficulty, length)
+        # 数量较多时使用多进程并行生成
+        batch_gen = self.generator.batch_generate(count, difficulty, length, seed=seed, workers=None)
 
         success_count = 0
-        for i, (text, image) in enumerate(batch_gen, 1):
-            # 保存验证码
-            filename = f"captcha_{i:03d}_{text}.png"
-            filepath = os.path.join(folder, filename)
-            image.save(filepath)
-            success_count += 1
+        with open_batch_writer(folder, output) as writer:
+            for i, (text, image) in enumerate(batch_gen, 1):
+                # 保存验证码（PNG文件或写入归档分片）
+                writer.add(text, image)
+                success_count += 1
 
-            # 显示进度
-            if i % 10 == 0 or i == count:
-                print(f"已生成 {i}/{count} 个验证码")
+                # 显示进度
+                if i % 10 == 0 or i == count:
+                    print(f"已生成 {i}/{count} 个验证码")
 
         print(f"\n批量生成完成!")
         print(f"成功生成: {success_count} 个验证码")
@@ -339,6 +356,11 @@ if __name__ == "__main__":
     os.makedirs('data/models', exist_ok=True)
     os.makedirs('data/templates', exist_ok=True)
 
+    # --verbose: 打印识别过程中的事件（各策略的结果、得分和耗时）
+    if '--verbose' in sys.argv:
+        event_log.enable('debug')
+        event_log.add_sink(print_event)
+
     # 检查是否使用命令行模式
     if len(sys.argv) > 1 and sys.argv[1] == '--cli':
         # 命令行模式
@@ -0,0 +1,269 @@
+import sys
+import os
+import argparse
+import json
+import platform
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+import numpy as np
+import PIL
+
+try:
+    import resource
+except ImportError:  # Windows没有resource模块，此时不测内存
+    resource = None
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from captcha_generator.generator import CaptchaGenerator
+
+
+DIFFICULTIES = ['simple', 'medium', 'hard']
+LENGTHS = [4, 5, 6, 7, 8]
+SIZES = [(200, 80), (160, 60), (300, 100)]
+
+
+def percentile_summary(latencies):
+    """计算延迟分位数（毫秒）"""
+    values = np.asarray(latencies) * 1000
+    return {
+        'mean_ms': round(float(values.mean()), 4),
+        'p50_ms': round(float(np.percentile(values, 50)), 4),
+        'p95_ms': round(float(np.percentile(values, 95)), 4),
+        'p99_ms': round(float(np.percentile(values, 99)), 4),
+        'max_ms': round(float(values.max()), 4)
+    }
+
+
+def _max_rss_kb():
+    """当前进程的峰值常驻内存（KB，macOS上ru_maxrss的单位是字节）"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 if sys.platform == 'darwin' else peak
+
+
+def _memory_case(mode, difficulty, length, size, count):
+    """在子进程中运行一个测试项（mode为'baseline'时只创建生成器），返回峰值RSS（KB）"""
+    generator = CaptchaGenerator(*size, seed=0)
+    if mode == 'array_batch':
+        generator.generate_array_batch(count, difficulty, length, seed=1)
+    elif mode != 'baseline':
+        generator.generate(difficulty, length)
+    return _max_rss_kb()
+
+
+def _peak_rss_in_child(mode, difficulty=None, length=None, size=None, count=1):
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(_memory_case, mode, difficulty, length, size, count).result()
+
+
+# 各尺寸的基线峰值RSS（子进程完成导入并创建生成器、但不生成验证码时的峰值）
+_baseline_rss = {}
+
+
+def measure_peak_memory(mode, difficulty, length, size, count=1):
+    """
+    在全新的子进程中运行一次并读取峰值RSS（包含Pillow在C层分配的图像缓冲区，tracemalloc看不到这部分）
+    ru_maxrss是峰值，导入模块时就已经抬高，因此增量与另一个只做导入和初始化的子进程的峰值比较，
+    而不是与同一进程内生成前的读数比较
+    :return: (峰值RSS, 相对基线进程的增量)，单位KB；不支持resource模块的平台返回(None, None)
+    """
+    if resource is None:
+        return None, None
+    if size not in _baseline_rss:
+        _baseline_rss[size] = _peak_rss_in_child('baseline', size=size)
+    peak = _peak_rss_in_child(mode, difficulty, length, size, count)
+    return round(peak, 1), round(peak - _baseline_rss[size], 1)
+
+
+def repeat_summary(run_means):
+    """各次重复的平均延迟及其中位数（比较报告时使用中位数，减少单次运行的噪声）"""
+    return {
+        'repeat_mean_ms': [round(value * 1000, 4) for value in run_means],
+        'median_ms': round(float(np.median(run_means)) * 1000, 4)
+    }
+
+
+def bench_single(difficulty, length, size, iterations, warmup, repeats=3):
+    """单线程逐张生成"""
+    generator = CaptchaGenerator(*size, seed=0)
+    for _ in range(warmup):
+        generator.generate(difficulty, length)
+
+    latencies = []
+    run_means = []
+    start = time.perf_counter()
+    for _ in range(repeats):
+        run_start = time.perf_counter()
+        for _ in range(iterations):
+            t0 = time.perf_counter()
+            generator.generate(difficulty, length)
+            latencies.append(time.perf_counter() - t0)
+        run_means.append((time.perf_counter() - run_start) / iterations)
+    elapsed = time.perf_counter() - start
+
+    peak_kb, delta_kb = measure_peak_memory('single', difficulty, length, size)
+    result = {
+        'mode': 'single',
+        'difficulty': difficulty,
+        'length': length,
+        'size': f"{size[0]}x{size[1]}",
+        'iterations': iterations * repeats,
+        'throughput_per_s': round(iterations * repeats / elapsed, 1),
+        'peak_rss_kb': peak_kb,
+        'rss_delta_kb': delta_kb
+    }
+    result.update(percentile_summary(latencies))
+    result.update(repeat_summary(run_means))
+    return result
+
+
+def bench_batch(difficulty, length, size, count, workers, repeats=3):
+    """批量生成（batch_generate，workers>1时使用进程池）"""
+    generator = CaptchaGenerator(*size, seed=0)
+
+    run_means = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in generator.batch_generate(count, difficulty, length, seed=1, workers=workers):
+            pass
+        run_means.append((time.perf_counter() - start) / count)
+
+    result = {
+        'mode': f'batch_w{workers}',
+        'difficulty': difficulty,
+        'length': length,
+        'size': f"{size[0]}x{size[1]}",
+        'iterations': count * repeats,
+        'throughput_per_s': round(1 / float(np.median(run_means)), 1),
+        'mean_ms': round(float(np.mean(run_means)) * 1000, 4)
+    }
+    result.update(repeat_summary(run_means))
+    return result
+
+
+def bench_array_batch(difficulty, length, size, count, repeats=3):
+    """数组输出的批量生成"""
+    generator = CaptchaGenerator(*size, seed=0)
+
+    run_means = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        generator.generate_array_batch(count, difficulty, length, seed=1)
+        run_means.append((time.perf_counter() - start) / count)
+
+    peak_kb, delta_kb = measure_peak_memory('array_batch', difficulty, length, size, count)
+    result = {
+        'mode': 'array_batch',
+        'difficulty': difficulty,
+        'length': length,
+        'size': f"{size[0]}x{size[1]}",
+        'iterations': count * repeats,
+        'throughput_per_s': round(1 / float(np.median(run_means)), 1),
+        'mean_ms': round(float(np.mean(run_means)) * 1000, 4),
+        'peak_rss_kb': peak_kb,
+        'rss_delta_kb': delta_kb
+    }
+    result.update(repeat_summary(run_means))
+    return result
+
+
+def environment_info():
+    """记录运行环境，便于比较不同提交的报告"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pillow': PIL.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count()
+    }
+
+
+def result_key(result):
+    return f"{result['mode']}/{result['difficulty']}/{result['length']}/{result['size']}"
+
+
+def compare_reports(old_report, new_report, threshold=0.10):
+    """
+    比较两份报告中各次重复平均延迟的中位数，打印变化超过阈值的项目
+    只有新旧两份报告的重复结果范围也不重叠时才算作变化，避免把单次波动当成退化
+    :return: 是否存在性能退化
+    """
+    old_results = {result_key(r): r for r in old_report['results']}
+    regressed = False
+    print(f"\n=== 与 {old_report['environment'].get('commit', '?')} 比较 (阈值 {threshold:.0%}) ===")
+    for result in new_report['results']:
+        old = old_results.get(result_key(result))
+        if not old or 'median_ms' not in old:
+            continue
+        change = (result['median_ms'] - old['median_ms']) / old['median_ms']
+        if abs(change) < threshold:
+            continue
+        if change > 0 and min(result['repeat_mean_ms']) <= max(old['repeat_mean_ms']):
+            continue
+        if change < 0 and max(result['repeat_mean_ms']) >= min(old['repeat_mean_ms']):
+            continue
+        status = "退化" if change > 0 else "提升"
+        regressed = regressed or change > 0
+        print(f"  {status} {result_key(result)}: {old['median_ms']:.3f}ms -> {result['median_ms']:.3f}ms "
+              f"({change:+.1%}, {len(result['repeat_mean_ms'])}次重复的中位数)")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="验证码生成器性能基准测试")
+    parser.add_argument('--iterations', type=int, default=200, help="单线程模式每组的生成次数")
+    parser.add_argument('--batch-count', type=int, default=500, help="批量模式每组的生成数量")
+    parser.add_argument('--repeats', type=int, default=3, help="每组重复运行的次数（比较报告时使用中位数）")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="并行批量模式的进程数")
+    parser.add_argument('--quick', action='store_true', help="只测默认尺寸和长度5")
+    parser.add_argument('--output', default='bench_generator.json', help="JSON报告路径")
+    parser.add_argument('--compare', help="与之前的JSON报告比较")
+    args = parser.parse_args()
+
+    lengths = [5] if args.quick else LENGTHS
+    sizes = SIZES[:1] if args.quick else SIZES
+
+    results = []
+    for difficulty in DIFFICULTIES:
+        for size in sizes:
+            for length in lengths:
+                result = bench_single(difficulty, length, size, args.iterations, warmup=10, repeats=args.repeats)
+                results.append(result)
+                print(f"{result_key(result):32s} p50={result['p50_ms']:.3f}ms p99={result['p99_ms']:.3f}ms "
+                      f"{result['throughput_per_s']:.0f}张/秒 峰值RSS{result['peak_rss_kb']}KB "
+                      f"(+{result['rss_delta_kb']}KB)")
+
+        # 批量模式只测默认尺寸和长度
+        for workers in sorted({1, args.workers}):
+            result = bench_batch(difficulty, 5, SIZES[0], args.batch_count, workers, args.repeats)
+            results.append(result)
+            print(f"{result_key(result):32s} {result['throughput_per_s']:.0f}张/秒")
+        result = bench_array_batch(difficulty, 5, SIZES[0], args.batch_count, args.repeats)
+        results.append(result)
+        print(f"{result_key(result):32s} {result['throughput_per_s']:.0f}张/秒 "
+              f"峰值RSS{result['peak_rss_kb']}KB (+{result['rss_delta_kb']}KB)")
+
+    report = {'environment': environment_info(), 'results': results}
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False, sort_keys=True)
+    print(f"\n报告已保存到: {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            old_report = json.load(f)
+        if compare_reports(old_report, report):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,38 @@
 import sys
 import os
+import io
+import tempfile
+import random
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import cv2
+from PIL import Image
 
 # 添加项目根目录到路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from captcha_generator.generator import CaptchaGenerator
+from captcha_generator.pool import CaptchaPool
+from captcha_generator import distortion
+from captcha_generator import noise
+from captcha_generator.distortion import WaveDistortion
 from captcha_recognizer.traditional_recognizer import TraditionalCaptchaRecognizer
+from captcha_recognizer import traditional_recognizer
+from captcha_recognizer.ocr_pool import OCRWorkerPool
+from captcha_recognizer.ml_recognizer import MLCaptchaRecognizer
+from captcha_recognizer.dataset import DatasetWatcher, FEATURE_CACHE_NAME
+from captcha_recognizer import model_store
 from utils.utils import validate_captcha
+from captcha_recognizer.template_bank import TemplateBank
+from captcha_recognizer.batch import summarize_batch
+from captcha_recognizer.preprocess import PreprocessPipeline
+from captcha_recognizer.cache import RecognitionCache
+from captcha_recognizer.events import EventLog, DEBUG
+from captcha_recognizer.budget import Deadline, RecognitionResult
+from utils.archive import open_batch_writer, iter_archive, load_index
+from utils.encoder import ImageEncoder, encoder_stats
 
 
 def test_generator():
@@ -33,6 +59,96 @@ def test_generator():
     print("验证码图片已保存到当前目录")
 
 
+def test_glyph_cache():
+    """测试字形缓存"""
+    print("\n=== 测试字形缓存 ===")
+
+    generator = CaptchaGenerator()
+    other = CaptchaGenerator()
+
+    # 同一字体的生成器共享缓存，且36个字符全部预渲染
+    assert generator.glyph_cache is other.glyph_cache
+    glyphs = generator.glyph_cache.get_glyphs(generator.font_size)
+    assert len(glyphs) == 36
+    print(f"已缓存字形: {len(glyphs)} 个")
+
+
+def test_rotated_glyph_atlas():
+    """测试预旋转字形图集（按(字符, 字号, 角度, 画布)缓存，困难验证码尺寸和模式不变）"""
+    print("\n=== 测试预旋转字形图集 ===")
+
+    glyph_cache = CaptchaGenerator().glyph_cache
+    mask = glyph_cache.get_rotated_mask('A', 40, 15, (50, 60))
+    assert glyph_cache.get_rotated_mask('A', 40, 15, (50, 60)) is mask
+    assert glyph_cache.get_rotated_mask('A', 40, -15, (50, 60)) is not mask
+    assert mask.mode == 'L' and mask.size[0] > 50 and mask.size[1] > 60
+
+    # 同一种子再次生成时所有旋转字形都命中缓存
+    generator = CaptchaGenerator(seed=21)
+    text, image = generator.generate_hard_captcha(6)
+    entries = len(glyph_cache._rotated)
+    assert entries > 0
+    again_text, again_image = CaptchaGenerator(seed=21).generate_hard_captcha(6)
+    assert len(glyph_cache._rotated) == entries
+    assert again_text == text and np.array_equal(np.asarray(again_image), np.asarray(image))
+    assert image.size == (generator.width, generator.height)
+    assert image.mode == 'RGB'
+    print(f"已缓存旋转字形: {entries} 个")
+
+
+def test_wave_distortion():
+    """测试波浪扭曲（网格按参数缓存复用，无OpenCV时的NumPy双线性插值与cv2.remap结果一致）"""
+    print("\n=== 测试波浪扭曲 ===")
+
+    engine = WaveDistortion(2.0, 10.0, 1.5, 13.0)
+    assert engine.get_grid(160, 60) is engine.get_grid(160, 60)
+    assert WaveDistortion(2.0, 10.0, 1.5, 13.0).get_grid(160, 60) is engine.get_grid(160, 60)
+    assert engine.get_grid(120, 60) is not engine.get_grid(160, 60)
+
+    image = np.random.default_rng(0).integers(0, 256, (60, 160, 3), dtype=np.uint8)
+    # 用另一组参数构建无OpenCV时的网格（包含插值索引和权重），再与cv2.remap的结果比较
+    fallback_engine = WaveDistortion(2.5, 11.0, 1.25, 14.0)
+    cv2_module = distortion.cv2
+    distortion.cv2 = None
+    try:
+        fallback = fallback_engine.apply(image)
+    finally:
+        distortion.cv2 = cv2_module
+    reference = fallback_engine.apply(image)
+    difference = np.abs(fallback.astype(np.int16) - reference)
+    assert fallback.shape == reference.shape and fallback.dtype == np.uint8
+    assert difference.max() <= 1
+    print(f"NumPy与OpenCV结果最大差值: {difference.max()}")
+
+
+def test_noise():
+    """测试向量化噪点、干扰线和实心圆（相同种子结果相同，不会画到画布以外）"""
+    print("\n=== 测试噪点和干扰线 ===")
+
+    def render(seed):
+        # 画布是更大缓冲区中间的一块，边框保持为0说明没有写到画布以外
+        buffer = np.zeros((80, 180, 3), dtype=np.uint8)
+        canvas = buffer[10:-10, 10:-10]
+        rng = np.random.default_rng(seed)
+        noise.add_points(canvas, rng, 300, rng.integers(1, 256, (300, 3)))
+        noise.add_lines(canvas, rng, 8, (200, 30, 30))
+        noise.add_ellipses(canvas, rng, 10, 2, 6, rng.integers(1, 256, (10, 3)))
+        return buffer
+
+    first = render(42)
+    assert np.array_equal(first, render(42))
+    assert not np.array_equal(first, render(43))
+    inner = np.zeros(first.shape[:2], dtype=bool)
+    inner[10:-10, 10:-10] = True
+    assert not first[~inner].any() and first[inner].any()
+
+    # 超出画布的坐标（包括负数）被丢弃，而不是从另一侧绕回
+    pixels = np.zeros((5, 5), dtype=np.uint8)
+    noise.scatter(pixels, np.array([-1, 5, 2, 0]), np.array([0, 0, -1, 5]), 255)
+    assert not pixels.any()
+    print(f"画布内被绘制的像素: {int(first[inner].any(axis=-1).sum())}")
+
+
 def test_recognizer():
     """测试验证码识别器"""
     print("\n=== 测试验证码识别器 ===")
@@ -77,13 +193,679 @@ def test_batch_generation():
     count = 5
 
     print(f"批量生成 {count} 个中等难度验证码:")
-    batch = generator.batch_generate(count, 'medium', 5)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        batch = generator.batch_generate(count, 'medium', 5)
+
+        for i, (text, image) in enumerate(batch, 1):
+            print(f"  {i:2d}. {text}")
+            image.save(os.path.join(temp_dir, f'batch_{i:02d}.png'))
+
+        print(f"已保存 {count} 个验证码图片")
+
+    # 无效的种子在开始生成之前就被拒绝
+    for seed in (-5, 1.5, '3'):
+        try:
+            generator.batch_generate(count, 'medium', 5, seed=seed)
+            assert False, "应该拒绝无效的种子"
+        except ValueError:
+            pass
+    try:
+        generator.generate_seeded(-1, 0)
+        assert False, "应该拒绝负数种子"
+    except ValueError:
+        pass
+
+
+def test_parallel_batch_generation():
+    """测试并行批量生成的可复现性"""
+    print("\n=== 测试并行批量生成 ===")
+
+    generator = CaptchaGenerator()
+    count = 64
+
+    serial = [(text, image.tobytes()) for text, image in generator.batch_generate(count, 'hard', 5, seed=2024)]
+    parallel = [(text, image.tobytes()) for text, image in generator.batch_generate(count, 'hard', 5, seed=2024, workers=2)]
+
+    # 相同种子的结果与进程数无关，逐字节一致
+    assert serial == parallel
+    print(f"串行与并行生成的 {count} 个验证码完全一致")
+
+
+def test_captcha_pool():
+    """测试验证码池（后台补充到高水位，取出到低水位以下时自动补充，停止时等待线程结束）"""
+    print("\n=== 测试验证码池 ===")
+
+    def wait_until(condition, timeout=30):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            assert time.monotonic() < deadline, "等待超时"
+            time.sleep(0.01)
+
+    pool = CaptchaPool(low_water=2, high_water=5, workers=2, presets=[('simple', 4)])
+    pool.start()
+    threads = list(pool._threads)
+    wait_until(lambda: pool.stats()['sizes']['simple_4'] == 5)
+    assert pool.stats()['generated'] == 5
+
+    # 取出4个后低于低水位，后台线程补充回高水位
+    for _ in range(4):
+        text, data = pool.get('simple', 4)
+        assert len(text) == 4 and data[:8] == b'\x89PNG\r\n\x1a\n'
+    wait_until(lambda: pool.stats()['sizes']['simple_4'] == 5)
+    # 超出入池范围的请求现场生成，计为未命中
+    assert len(pool.get('simple', 20)[0]) == 20
+
+    stats = pool.stats()
+    assert stats['hits'] == 4 and stats['misses'] == 1
+    assert stats['generated'] == 9 and stats['hit_rate'] == 0.8
+
+    pool.stop()
+    assert pool._threads == [] and not any(thread.is_alive() for thread in threads)
+    print(f"池统计: {stats}")
+
+
+def test_array_batch_generation():
+    """测试数组输出的批量生成"""
+    print("\n=== 测试数组批量生成 ===")
+
+    generator = CaptchaGenerator()
+
+    images, labels = generator.generate_array_batch(8, 'medium', 5, seed=7)
+    assert images.shape == (8, generator.height, generator.width)
+    assert images.dtype.name == 'uint8' and len(labels) == 8
+
+    color_images, color_labels = generator.generate_array_batch(8, 'medium', 5, color=True, seed=7)
+    assert color_images.shape == (8, generator.height, generator.width, 3)
+    assert list(labels) == list(color_labels)
+    print(f"灰度数组: {images.shape}, 彩色数组: {color_images.shape}, 标签: {', '.join(labels)}")
+
+
+def test_archive_output():
+    """测试分片归档输出"""
+    print("\n=== 测试分片归档输出 ===")
+
+    generator = CaptchaGenerator()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for output in ('tar', 'zip', 'npy'):
+            folder = os.path.join(temp_dir, output)
+            texts = []
+            with open_batch_writer(folder, output, shard_size=3) as writer:
+                for text, image in generator.batch_generate(7, 'medium', 5):
+                    writer.add(text, image)
+                    texts.append(text)
+
+            # 流式读取归档，标签与写入顺序一致
+            items = list(iter_archive(folder))
+            labels = [label for _, label, _ in items]
+            assert labels == texts
+
+            # 按索引中的分片、偏移和大小随机读取，图像与流式读取的结果一致
+            index = load_index(folder)
+            for entry, (_, _, image) in zip(index['entries'], items):
+                shard_path = os.path.join(folder, index['shards'][entry['shard']])
+                if output == 'npy':
+                    array = np.load(shard_path, mmap_mode='r')[entry['offset']]
+                    assert array.nbytes == entry['size']
+                else:
+                    with open(shard_path, 'rb') as f:
+                        f.seek(entry['offset'])
+                        data = f.read(entry['size'])
+                    array = np.asarray(Image.open(io.BytesIO(data)))
+                assert np.array_equal(array, np.asarray(image))
+            print(f"{output}: {len(labels)} 个验证码，{len(os.listdir(folder)) - 1} 个分片")
+
+
+def test_image_encoder():
+    """测试图像编码器（各格式编码后能解码回原图，统计按格式汇总，无效格式抛出ValueError）"""
+    print("\n=== 测试图像编码器 ===")
+
+    import io
+
+    _, image = CaptchaGenerator(seed=3).generate('medium', 5)
+    original = np.asarray(image.convert('RGB'), dtype=np.int16)
+    encoder_stats.reset()
+
+    for spec in ('png', 'png:1', 'webp:lossless', 'webp:80', 'jpeg', 'jpeg:90'):
+        encoder = ImageEncoder.from_spec(spec)
+        assert encoder.spec == spec
+        data = encoder.submit(image).result()
+        decoded = np.asarray(Image.open(io.BytesIO(data)).convert('RGB'), dtype=np.int16)
+        assert decoded.shape == original.shape
+        difference = np.abs(decoded - original).mean()
+        if spec.startswith('png') or spec == 'webp:lossless':
+            assert difference == 0, spec
+        else:
+            assert difference < 12, spec
+
+    # raw为灰度原始字节，按尺寸可以直接还原
+    raw = ImageEncoder.from_spec('raw').encode(image)
+    restored = Image.frombytes('L', image.size, raw)
+    assert np.array_equal(np.asarray(restored), np.asarray(image.convert('L')))
+    assert ImageEncoder.from_spec('jpg').spec == 'jpeg'
+
+    stats = encoder_stats.snapshot()
+    assert set(stats) == {'png', 'png:1', 'webp:lossless', 'webp:80', 'jpeg', 'jpeg:90', 'raw'}
+    assert all(entry['count'] == 1 and entry['bytes'] > 0 for entry in stats.values())
+
+    for spec in ('gif', 'png:x', 'png:12', 'webp:101', 'jpeg:-1', 'raw:1'):
+        try:
+            ImageEncoder.from_spec(spec)
+        except ValueError:
+            continue
+        raise AssertionError(f"无效格式没有被拒绝: {spec}")
+    print(f"编码统计: {dict((spec, entry['avg_bytes']) for spec, entry in stats.items())}")
+
+
+def test_template_bank():
+    """测试模板库的缓存和变化检测"""
+    print("\n=== 测试模板库 ===")
+
+    generator = CaptchaGenerator()
+    with tempfile.TemporaryDirectory() as folder:
+        for char in 'ABC':
+            generator.glyph_cache.get_glyph(char, 40).mask.save(os.path.join(folder, f'{char}.png'))
+
+        bank = TemplateBank(folder, check_interval=0)
+        assert sorted(bank.get_templates()) == ['A', 'B', 'C']
+        bank.get_templates()
+        assert bank.loads == 1
+
+        # 新增模板文件后自动重新加载
+        generator.glyph_cache.get_glyph('D', 40).mask.save(os.path.join(folder, 'D.png'))
+        assert sorted(bank.get_templates()) == ['A', 'B', 'C', 'D']
+        assert bank.loads == 2
+        assert TemplateBank.shared(folder) is TemplateBank.shared(os.path.abspath(folder))
+
+        # 字符与自身模板（二值化后）高度相关，次佳模板得分更低
+        glyphs = [np.array(generator.glyph_cache.get_glyph(char, 40).mask) for char in 'DAB']
+        matches = bank.match(glyphs)
+        assert [best for best, _, _, _ in matches] == ['D', 'A', 'B']
+        assert all(score > 0.9 and score > runner_up_score for _, score, _, runner_up_score in matches)
+        print(f"模板: {', '.join(sorted(bank.templates))}, 加载次数: {bank.loads}")
+
+
+def test_preprocess_pipeline():
+    """测试预处理流水线（各阶段只计算一次，灰度与彩色输入结果一致）"""
+    print("\n=== 测试预处理流水线 ===")
+
+    generator = CaptchaGenerator(seed=5)
+    _, image = generator.generate('medium', 5)
+    recognizer = TraditionalCaptchaRecognizer()
+
+    pipeline = PreprocessPipeline(image)
+    binary = recognizer.preprocess_image(pipeline, enhance_for_tesseract=True)
+    assert recognizer.preprocess_image(pipeline, enhance_for_tesseract=True) is binary
+    assert binary.shape == (generator.height * 3, generator.width * 3)
+    assert np.array_equal(recognizer.preprocess_image(image), pipeline.otsu)
+    assert np.array_equal(PreprocessPipeline(image.convert('L')).otsu, pipeline.otsu)
+    print(f"已计算的阶段: {', '.join(pipeline._stages)}")
+
+
+def test_segmentation():
+    """测试字符分割（白底黑字不再被当成一整块，已知长度时拆分粘连字符）"""
+    print("\n=== 测试字符分割 ===")
+
+    generator = CaptchaGenerator(seed=9)
+    recognizer = TraditionalCaptchaRecognizer()
+
+    for difficulty in ('simple', 'medium', 'hard'):
+        text, image = generator.generate(difficulty, 5)
+        processed = recognizer.preprocess_image(image)
+        characters, boxes = recognizer.segment_characters(processed, expected_length=len(text))
+        assert len(characters) == len(boxes) == len(text)
+        assert all(w < generator.width // 2 for _, _, w, _ in boxes)
+        assert [x for x, _, _, _ in boxes] == sorted(x for x, _, _, _ in boxes)
+        print(f"{difficulty}: {text} -> {boxes}")
+
+    # 困难验证码按生成器的字符间距布局分割
+    text, image = generator.generate_hard_captcha(6)
+    _, boxes = recognizer.segment_characters(recognizer.preprocess_image(image), len(text), layout_prior=True)
+    pitch = generator.width // (len(text) + 1)
+    assert [x + w // 2 for x, _, w, _ in boxes] == [(i + 1) * pitch for i in range(len(text))]
+
+
+def test_batch_recognition():
+    """测试批量识别（文件夹和归档，串行与多进程）"""
+    print("\n=== 测试批量识别 ===")
+
+    generator = CaptchaGenerator(seed=7)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        template_folder = os.path.join(temp_dir, 'templates')
+        os.makedirs(template_folder)
+        # 不含容易混淆的字符，模板就是拼成验证码的字形本身，识别结果应该全部正确
+        characters = 'ABCDEFGHJKLMNPRSTUVWXYZ2345678'
+        for char in characters:
+            mask = generator.glyph_cache.get_glyph(char, 40).mask
+            mask.crop(mask.getbbox()).save(os.path.join(template_folder, f'{char}.png'))
+
+        texts = []
+        for output in ('png', 'tar'):
+            rng = random.Random(11)
+            with open_batch_writer(os.path.join(temp_dir, output), output) as writer:
+                for _ in range(6):
+                    # 用字形直接拼成没有干扰的验证码
+                    text = ''.join(rng.choice(characters) for _ in range(4))
+                    canvas = Image.new('L', (180, 60), 0)
+                    for i, char in enumerate(text):
+                        canvas.paste(generator.glyph_cache.get_glyph(char, 40).mask, (10 + i * 42, 8))
+                    writer.add(text, canvas.convert('RGB'))
+                    if output == 'png':
+                        texts.append(text)
+
+        recognizer = TraditionalCaptchaRecognizer()
+        serial = list(recognizer.recognize_batch(os.path.join(temp_dir, 'png'), 'template',
+                                                 template_folder=template_folder))
+        parallel = list(recognizer.recognize_batch(os.path.join(temp_dir, 'tar'), 'template', workers=2, chunk_size=2,
+                                                   template_folder=template_folder))
+
+    # 文件名和归档索引中的标签都能自动识别出来
+    assert [result.label for result in serial] == texts
+    assert [result.label for result in parallel] == texts
+    assert [result.prediction for result in serial] == texts
+    assert [result.prediction for result in parallel] == texts
+    assert all(0.5 < result.confidence <= 1 for result in serial)
+
+    summary = summarize_batch(serial)
+    assert summary['total'] == summary['labelled'] == summary['correct'] == 6
+    assert summary['accuracy'] == 1.0 and summary['errors'] == 0
+    print(f"准确率: {summary['accuracy']:.2%}, 错误: {summary['errors']}, "
+          f"平均耗时: {summary['avg_recognize_ms']:.2f}ms")
+
+
+def test_recognition_cache():
+    """测试识别缓存（同一像素不同编码命中同一条目，LRU淘汰，磁盘层）"""
+    print("\n=== 测试识别缓存 ===")
+
+    generator = CaptchaGenerator(seed=13)
+    _, image = generator.generate('simple', 4)
+    # 磁盘层使用临时文件夹，上次运行留下的条目不会影响本次测试
+    with tempfile.TemporaryDirectory() as folder:
+        cache = RecognitionCache(max_entries=2, disk_folder=folder)
+
+        key = cache.make_key(image, 'template', ('v1', None))
+        assert cache.make_key(np.array(image), 'template', ('v1', None)) != key
+        assert cache.make_key(image.copy(), 'template', ('v1', None)) == key
+        assert cache.make_key(image, 'template', ('v2', None)) != key
+
+        calls = []
+        compute = lambda: calls.append(1) or 'ABCD'
+        assert cache.get_or_compute(key, compute) == 'ABCD'
+        assert cache.get_or_compute(key, compute) == 'ABCD'
+        assert len(calls) == 1
+
+        # 超出容量后最久未使用的条目被淘汰，但仍能从磁盘层读回
+        for i in range(2):
+            cache.put(cache.make_key(image, 'tesseract', (i,)), f'X{i}')
+        assert cache.stats()['evictions'] == 1
+        assert cache.get(key) == 'ABCD'
+        stats = cache.stats()
+        assert stats['hits'] == 1 and stats['disk_hits'] == 1
+    print(f"缓存统计: {stats}")
+
+
+def test_event_log():
+    """测试识别事件记录（默认关闭，开启后按级别过滤并保存在环形缓冲区中）"""
+    print("\n=== 测试事件记录 ===")
+
+    log = EventLog(capacity=3)
+    log.info('psm', psm='8')
+    assert log.events() == []
+
+    log.enable('info')
+    log.debug('psm', psm='7')
+    for i in range(5):
+        log.info('template_match', result=f'R{i}', duration_ms=1.0)
+    events = log.events()
+    assert [event['result'] for event in events] == ['R2', 'R3', 'R4']
+    assert log.enabled_for(DEBUG) is False
+    assert log.events('template_match', limit=1)[0]['result'] == 'R4'
+    print(f"最近事件: {events[-1]}")
+
+
+def test_recognition_budget():
+    """测试时间预算（预算用完时返回带超时标记的结果，且不写入缓存）"""
+    print("\n=== 测试时间预算 ===")
+
+    assert Deadline().remaining() is None and not Deadline().expired()
+    assert Deadline(0).expired() and Deadline(60).remaining() > 59
+    result = RecognitionResult('AB12', timed_out=True)
+    assert result == 'AB12' and result.timed_out and not RecognitionResult('AB12').timed_out
+
+    generator = CaptchaGenerator(seed=17)
+    _, image = generator.generate('simple', 4)
+    cache = RecognitionCache()
+    recognizer = TraditionalCaptchaRecognizer(cache=cache)
+    with tempfile.TemporaryDirectory() as folder:
+        for char in 'ABC':
+            generator.glyph_cache.get_glyph(char, 40).mask.save(os.path.join(folder, f'{char}.png'))
+        text, scores = recognizer.match_templates(image, folder, budget=0)
+        # 预算用完时不加载模板
+        assert TemplateBank.shared(folder).loads == 0
+    assert text == '' and text.timed_out and scores == []
+    assert cache.stats()['entries'] == 0
+    print(f"超时结果: {text!r}, timed_out={text.timed_out}")
+
+
+def test_psm_priority():
+    """测试PSM策略按优先级采纳（低优先级策略先完成时不能抢先胜出）"""
+    print("\n=== 测试PSM策略优先级 ===")
+
+    class FakeOCRPool:
+        """按PSM返回固定文本，并按PSM延迟返回"""
+        size = 4
+
+        def __init__(self, outputs):
+            self.outputs = outputs
+
+        def image_to_string(self, image, psm, whitelist='', timeout=None):
+            text, delay = self.outputs[psm]
+            time.sleep(delay)
+            return text
+
+    modes = [('8', '单个单词'), ('7', '单行文本'), ('13', '原始行')]
+    processed = np.zeros((20, 60), dtype=np.uint8)
+    recognizer = TraditionalCaptchaRecognizer(use_cache=False)
+    # 使用单独的线程池，保证各策略真正并发（共享线程池的大小取决于CPU核数）
+    original_pool, original_executor = traditional_recognizer.get_ocr_pool, traditional_recognizer._ocr_executor
+    traditional_recognizer._ocr_executor = ThreadPoolExecutor(max_workers=len(modes))
+    try:
+        # 优先级最高的策略最慢，但结果合理时仍然胜出
+        traditional_recognizer.get_ocr_pool = lambda: FakeOCRPool(
+            {'8': ('ABCD', 0.3), '7': ('WXYZ', 0.0), '13': ('QRST', 0.05)})
+        results, accepted, timed_out = recognizer._run_psm_strategies(processed, modes, Deadline())
+        assert accepted == ('ABCD', '单个单词', '8') and not timed_out
+        print(f"采纳: {accepted}")
+
+        # 高优先级结果长度不合理时，采纳下一个优先级的结果，而不是最快完成的结果
+        traditional_recognizer.get_ocr_pool = lambda: FakeOCRPool(
+            {'8': ('A', 0.2), '7': ('WXYZ', 0.3), '13': ('QRST', 0.0)})
+        results, accepted, timed_out = recognizer._run_psm_strategies(processed, modes, Deadline())
+        assert accepted == ('WXYZ', '单行文本', '7') and results[0] == ('A', '单个单词', '8')
+
+        # 高优先级策略超出预算时不采纳任何结果，保留已完成的结果
+        traditional_recognizer.get_ocr_pool = lambda: FakeOCRPool(
+            {'8': ('ABCD', 1.0), '7': ('WXYZ', 0.0), '13': ('QRST', 0.0)})
+        results, accepted, timed_out = recognizer._run_psm_strategies(processed, modes, Deadline(0.2))
+        assert accepted is None and timed_out
+        assert [psm for _, _, psm in results] == ['7', '13']
+    finally:
+        traditional_recognizer._ocr_executor.shutdown()
+        traditional_recognizer.get_ocr_pool, traditional_recognizer._ocr_executor = original_pool, original_executor
+
+
+def test_ocr_pool():
+    """测试OCR工作池（引擎数量上限、等待空闲引擎、超时以及异常后归还引擎）"""
+    print("\n=== 测试OCR工作池 ===")
+
+    class StubWorker:
+        """记录同时在用的引擎数量，psm为'error'时抛出异常"""
+        active = 0
+        peak = 0
+        lock = threading.Lock()
+
+        def image_to_string(self, image, psm, whitelist, timeout=None):
+            with StubWorker.lock:
+                StubWorker.active += 1
+                StubWorker.peak = max(StubWorker.peak, StubWorker.active)
+            try:
+                time.sleep(0.05)
+                if psm == 'error':
+                    raise RuntimeError("识别失败")
+                return f"psm{psm}"
+            finally:
+                with StubWorker.lock:
+                    StubWorker.active -= 1
+
+        def close(self):
+            pass
+
+    pool = OCRWorkerPool(size=2, backend='cli')
+    pool._create_worker = StubWorker
+    image = np.zeros((20, 60), dtype=np.uint8)
+
+    # 并发调用数超过引擎数时，最多只创建size个引擎，其余调用等待归还
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        texts = list(executor.map(lambda psm: pool.image_to_string(image, psm), range(6)))
+    assert texts == [f"psm{psm}" for psm in range(6)]
+    assert StubWorker.peak == 2 and pool.stats()['engines'] == 2 and pool.stats()['calls'] == 6
+
+    # 所有引擎都被借出时，_acquire会阻塞到有引擎归还或超时
+    first, second = pool._acquire(), pool._acquire()
+    start = time.perf_counter()
+    try:
+        pool._acquire(timeout=0.1)
+        assert False, "应该超时"
+    except TimeoutError:
+        assert time.perf_counter() - start >= 0.09
+    try:
+        pool.image_to_string(image, '7', timeout=0.05)
+        assert False, "应该超时"
+    except TimeoutError:
+        pass
+    threading.Timer(0.05, pool._idle.put, args=(first,)).start()
+    assert pool._acquire(timeout=2) is first
+    pool._idle.put(first)
+    pool._idle.put(second)
+
+    # 识别抛出异常时引擎仍然归还给工作池
+    try:
+        pool.image_to_string(image, 'error')
+        assert False, "应该抛出异常"
+    except RuntimeError:
+        pass
+    assert pool._idle.qsize() == 2 and pool.stats()['engines'] == 2
+    print(f"工作池统计: {pool.stats()}")
+
+    try:
+        OCRWorkerPool(backend='unknown')
+        assert False, "应该拒绝未知的后端"
+    except ValueError:
+        pass
+
+
+def test_ml_predict_many():
+    """测试机器学习识别的批量预测（多张验证码的字符只调用一次模型，结果与逐张识别一致）"""
+    print("\n=== 测试机器学习批量预测 ===")
+
+    generator = CaptchaGenerator(seed=23)
+    recognizer = MLCaptchaRecognizer('knn', use_cache=False)
+    with tempfile.TemporaryDirectory() as folder:
+        for n in range(40):
+            text, image = generator.generate('simple', 4)
+            for i, (char, char_img) in enumerate(zip(text, recognizer.segment(image, 4))):
+                os.makedirs(os.path.join(folder, char), exist_ok=True)
+                cv2.imwrite(os.path.join(folder, char, f'{n}_{i}.png'), char_img)
+        recognizer.train(folder, save_model=False)
+
+    images = [generator.generate('simple', 4)[1] for _ in range(5)]
+    single = [recognizer.predict_with_confidence(image) for image in images]
+
+    calls = []
+    predict_proba = recognizer.model.predict_proba
+    recognizer.model.predict_proba = lambda features: calls.append(len(features)) or predict_proba(features)
+    many = recognizer.predict_many(images)
+    assert many == single
+    assert len(calls) == 1
+    print(f"批量预测: {[text for text, _ in many]}, 一次预测的字符数: {calls[0]}")
+
+    # 无法分割出字符的图像得到空结果，空结果不缓存
+    recognizer.model.predict_proba = predict_proba
+    recognizer.cache, recognizer.use_cache = RecognitionCache(), True
+    blank = np.full((60, 160, 3), 255, dtype=np.uint8)
+    text, confidence = recognizer.predict_with_confidence(blank)
+    assert text == '' and confidence is None
+    assert recognizer.cache.stats()['entries'] == 0
+    assert recognizer.predict_with_confidence(images[0]) == single[0]
+    assert recognizer.cache.stats()['entries'] == 1
+
+    # 批量预测同样不缓存空结果
+    recognizer.cache = RecognitionCache()
+    assert recognizer.predict_many([blank, images[1]]) == [(RecognitionResult(''), None), single[1]]
+    assert recognizer.cache.stats()['entries'] == 1
+    assert recognizer.predict_many([blank])[0][0] == ''
+
+
+def test_dataset_cache():
+    """测试数据集特征缓存（再次加载时只解码新增或修改过的样本）"""
+    print("\n=== 测试数据集特征缓存 ===")
+
+    generator = CaptchaGenerator()
+    with tempfile.TemporaryDirectory() as folder:
+        for char in 'AB7':
+            os.makedirs(os.path.join(folder, char))
+            for size in (30, 40):
+                generator.glyph_cache.get_glyph(char, size).mask.save(os.path.join(folder, char, f'{size}.png'))
+
+        recognizer = MLCaptchaRecognizer()
+        X, y = recognizer.load_dataset(folder, workers=2)
+        assert X.shape == (6, 400) and X.dtype == np.float32 and recognizer.dataset_stats['decoded'] == 6
+        assert list(y) == [recognizer.char_to_index[char] for char in 'AABB77']
+
+        X2, y2 = recognizer.load_dataset(folder)
+        assert recognizer.dataset_stats['decoded'] == 0 and recognizer.dataset_stats['reused'] == 6
+        assert np.array_equal(X, X2) and np.array_equal(y, y2)
+
+        # 新增一个样本、删除一个样本后只解码新样本
+        generator.glyph_cache.get_glyph('B', 50).mask.save(os.path.join(folder, 'B', '50.png'))
+        os.remove(os.path.join(folder, 'A', '30.png'))
+        X3, y3 = recognizer.load_dataset(folder)
+        assert recognizer.dataset_stats['decoded'] == 1 and len(X3) == 6
+        X4, _ = recognizer.load_dataset(folder, use_cache=False)
+        assert np.array_equal(X3, X4)
+
+        # 无法解码的文件只尝试一次，文件不变时之后的加载不再解码，也不重写缓存
+        with open(os.path.join(folder, 'A', 'broken.png'), 'wb') as f:
+            f.write(b'not an image')
+        recognizer.load_dataset(folder)
+        assert recognizer.dataset_stats['decoded'] == 1 and recognizer.dataset_stats['unreadable'] == 1
+        cache_path = os.path.join(folder, FEATURE_CACHE_NAME)
+        cache_mtime = os.stat(cache_path).st_mtime_ns
+        X5, _ = recognizer.load_dataset(folder)
+        assert recognizer.dataset_stats['decoded'] == 0 and recognizer.dataset_stats['unreadable'] == 1
+        assert os.stat(cache_path).st_mtime_ns == cache_mtime and np.array_equal(X3, X5)
+        print(f"加载统计: {recognizer.dataset_stats}")
+
+
+def test_incremental_update():
+    """测试增量更新（KNN追加样本，SGD用partial_fit，其他模型完整重新训练）"""
+    print("\n=== 测试增量更新 ===")
+
+    generator = CaptchaGenerator()
+    with tempfile.TemporaryDirectory() as folder:
+        def add_samples(sizes):
+            for char in 'ABC':
+                os.makedirs(os.path.join(folder, char), exist_ok=True)
+                for size in sizes:
+                    generator.glyph_cache.get_glyph(char, size).mask.save(os.path.join(folder, char, f'{size}.png'))
+
+        add_samples(range(30, 42, 2))
+        recognizers = {model_type: MLCaptchaRecognizer(model_type, use_cache=False)
+                       for model_type in ('knn', 'sgd', 'random_forest')}
+        for recognizer in recognizers.values():
+            recognizer.train(folder, save_model=False)
+        assert recognizers['knn'].update(folder, save_model=False)['mode'] == 'none'
+
+        triggered = []
+        watcher = DatasetWatcher(folder, 'ABC', triggered.append)
+        watcher.start()
+        watcher.stop()
+        add_samples((44, 46))
+        assert watcher.check() and triggered == [folder]
+        assert not watcher.check()
+
+        knn = recognizers['knn']
+        fitted = knn.model.n_samples_fit_
+        assert knn.update(folder, save_model=False) == {'mode': 'append', 'new_samples': 6}
+        assert knn.model.n_samples_fit_ == len(knn.train_features) == fitted + 6
+        assert recognizers['sgd'].update(folder, save_model=False)['mode'] == 'partial_fit'
+        assert recognizers['random_forest'].update(folder, save_model=False)['mode'] == 'full'
+        print(f"KNN样本数: {fitted} -> {knn.model.n_samples_fit_}")
+
+        # 训练状态与模型一起保存，重新加载后的第一次更新仍然是增量的
+        with tempfile.TemporaryDirectory() as model_dir:
+            model_path = os.path.join(model_dir, 'knn_model.pkl')
+            knn._save_model(model_path)
+            loaded = MLCaptchaRecognizer('knn', use_cache=False)
+            assert loaded.load_model(model_path)
+            assert loaded.trained_samples == knn.trained_samples
+            add_samples((48,))
+            assert loaded.update(folder, save_model=False) == {'mode': 'append', 'new_samples': 3}
+            assert loaded.model.n_samples_fit_ == fitted + 9
+
+            # 模型文件被替换（状态中的版本不一致）时不使用旧状态
+            model_store.save_model(knn.model, model_path)
+            stale = MLCaptchaRecognizer('knn', use_cache=False)
+            assert stale.load_model(model_path) and stale.trained_samples is None
+
+
+def test_float32_model():
+    """测试旧版本保存的float64 KNN模型加载后转换为float32，预测结果不变"""
+    print("\n=== 测试float32模型 ===")
+
+    import pickle
+    from sklearn.neighbors import KNeighborsClassifier
+
+    rng = np.random.default_rng(0)
+    X = rng.random((60, 400))
+    y = rng.integers(0, 4, 60)
+    original = KNeighborsClassifier(n_neighbors=3).fit(X, y)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, 'knn_float64.pkl')
+        with open(path, 'wb') as f:
+            pickle.dump(original, f)
+
+        recognizer = MLCaptchaRecognizer('knn')
+        assert recognizer.load_model(path)
+        assert recognizer.model._fit_X.dtype == np.float32
+        queries = rng.random((20, 400))
+        assert list(recognizer.model.predict(queries.astype(np.float32))) == list(original.predict(queries))
+        size = os.path.getsize(path)
+        compact = len(pickle.dumps(recognizer.model))
+        assert compact < size * 0.6
+        print(f"模型大小: {size} -> {compact} 字节")
+
+
+def test_model_store():
+    """测试内存映射模型格式（大数组单独保存并映射，同一文件的模型在进程内共用）"""
+    print("\n=== 测试内存映射模型 ===")
+
+    import pickle
+    from sklearn.neighbors import KNeighborsClassifier
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'knn_model.pkl')
+
+        rng = np.random.default_rng(1)
+        X = rng.random((200, 400)).astype(np.float32)
+        model = KNeighborsClassifier(n_neighbors=3).fit(X, rng.integers(0, 4, 200))
+        model_store.save_model(model, path)
+        model_store.save_model(model, path)
+        assert len(os.listdir(model_store.arrays_folder(path))) == 1
+        assert os.path.getsize(path) < X.nbytes // 10
+
+        recognizer = MLCaptchaRecognizer('knn')
+        assert recognizer.load_model(path)
+        assert isinstance(recognizer.model._fit_X, np.memmap)
+        queries = rng.random((20, 400)).astype(np.float32)
+        assert list(recognizer.model.predict(queries)) == list(model.predict(queries))
+        other = MLCaptchaRecognizer('knn')
+        other.load_model(path)
+        assert other.model is recognizer.model
 
-    for i, (text, image) in enumerate(batch, 1):
-        print(f"  {i:2d}. {text}")
-        image.save(f'batch_{i:02d}.png')
+        # 旧格式（普通pickle）仍然可以加载
+        with open(os.path.join(folder, 'old.pkl'), 'wb') as f:
+            pickle.dump(model, f)
+        assert list(model_store.load_model(os.path.join(folder, 'old.pkl')).predict(queries)) == list(model.predict(queries))
 
-    print(f"已保存 {count} 个验证码图片")
+        # 同一路径并发保存：数组不会被另一次保存的清理删除，最终的模型总能加载
+        race_path = os.path.join(folder, 'race_model.pkl')
+        for _ in range(5):
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                list(executor.map(lambda _: model_store.save_model(model, race_path), range(4)))
+            assert len(os.listdir(model_store.arrays_folder(race_path))) == 1
+            assert list(model_store.load_model(race_path).predict(queries)) == list(model.predict(queries))
+        print(f"模型文件: {os.path.getsize(path)} 字节, 映射数组: {X.nbytes} 字节")
 
 
 if __name__ == "__main__":
@@ -91,8 +873,31 @@ if __name__ == "__main__":
 
     # 运行所有测试
     test_generator()
+    test_glyph_cache()
+    test_rotated_glyph_atlas()
+    test_wave_distortion()
+    test_noise()
     test_recognizer()
     test_validation()
     test_batch_generation()
+    test_parallel_batch_generation()
+    test_captcha_pool()
+    test_array_batch_generation()
+    test_archive_output()
+    test_image_encoder()
+    test_template_bank()
+    test_preprocess_pipeline()
+    test_segmentation()
+    test_batch_recognition()
+    test_recognition_cache()
+    test_event_log()
+    test_recognition_budget()
+    test_psm_priority()
+    test_ocr_pool()
+    test_ml_predict_many()
+    test_dataset_cache()
+    test_incremental_update()
+    test_float32_model()
+    test_model_store()
 
     print("\n所有测试完成!")
\ No newline at end of file
@@ -0,0 +1,318 @@
+import io
+import json
+import os
+import tarfile
+import zipfile
+from abc import ABC, abstractmethod
+from collections import deque
+import numpy as np
+from PIL import Image
+
+from utils.encoder import ImageEncoder
+
+
+INDEX_FILE = 'index.json'
+ARCHIVE_FORMATS = ('tar', 'zip', 'npy')
+
+
+class _EncodingWriter(ABC):
+    """写入器基类：渲染线程只提交图像，编码在线程池中进行，按提交顺序落盘"""
+
+    def __init__(self, encoder=None, max_pending=64):
+        """
+        :param encoder: 图像编码器（默认PNG）
+        :param max_pending: 最多同时等待编码的图像数（限制内存占用）
+        """
+        self.encoder = encoder or ImageEncoder()
+        self.max_pending = max_pending
+        self.count = 0
+        self._pending = deque()
+
+    def add(self, text, image):
+        """
+        追加一张验证码（编码在后台线程进行）
+        :param text: 验证码文本
+        :param image: PIL图像对象
+        :return: 文件名/条目名
+        """
+        self.count += 1
+        name = self._entry_name(self.count, text)
+        self._pending.append((name, text, self.encoder.submit(image)))
+        while len(self._pending) > self.max_pending:
+            self._flush_one()
+        return name
+
+    def _flush_one(self):
+        name, text, future = self._pending.popleft()
+        self._write(name, text, future.result())
+
+    def _flush(self):
+        while self._pending:
+            self._flush_one()
+
+    @abstractmethod
+    def _entry_name(self, number, text):
+        """
+        生成第number张验证码的文件名/条目名
+        :param number: 序号（从1开始）
+        :param text: 验证码文本
+        :return: 文件名/条目名
+        """
+
+    @abstractmethod
+    def _write(self, name, text, data):
+        """
+        按提交顺序写入一张已编码的验证码
+        :param name: 文件名/条目名
+        :param text: 验证码文本
+        :param data: 编码后的字节
+        """
+
+    def close(self):
+        self._flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class ImageFolderWriter(_EncodingWriter):
+    """逐个图像文件写入文件夹（原有的批量保存方式，标签编码在文件名中）"""
+
+    def __init__(self, folder, encoder=None):
+        """
+        初始化写入器
+        :param folder: 保存文件夹
+        :param encoder: 图像编码器（默认PNG）
+        """
+        super().__init__(encoder)
+        if self.encoder.fmt == 'raw':
+            raise ValueError("原始字节格式缺少尺寸信息，只能写入归档")
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+    def _entry_name(self, number, text):
+        return f"captcha_{number:03d}_{text}{self.encoder.extension}"
+
+    def _write(self, name, text, data):
+        with open(os.path.join(self.folder, name), 'wb') as f:
+            f.write(data)
+
+
+class ShardedArchiveWriter(_EncodingWriter):
+    """分片归档写入器（tar/zip分片或打包的npy数组，附带标签和偏移索引）"""
+
+    def __init__(self, folder, fmt='tar', shard_size=None, encoder=None):
+        """
+        初始化归档写入器
+        :param folder: 归档文件夹（分片和index.json都保存在这里）
+        :param fmt: 归档格式 ('tar', 'zip', 'npy')
+        :param shard_size: 每个分片的验证码数量（npy默认1000，其余默认10000）
+        :param encoder: tar/zip内图像的编码器（默认PNG）
+        """
+        if fmt not in ARCHIVE_FORMATS:
+            raise ValueError(f"不支持的归档格式: {fmt}")
+        super().__init__(encoder)
+
+        self.folder = folder
+        self.fmt = fmt
+        self.shard_size = shard_size or (1000 if fmt == 'npy' else 10000)
+        self.shards = []
+        self.entries = []
+
+        self._archive = None
+        self._buffer = None
+        self._buffer_count = 0
+        self._image_shape = None
+        self._image_size = None
+
+        os.makedirs(folder, exist_ok=True)
+
+    def _shard_name(self):
+        return f"shard_{len(self.shards):05d}.{self.fmt}"
+
+    def _open_shard(self):
+        """开始一个新分片"""
+        name = self._shard_name()
+        path = os.path.join(self.folder, name)
+        if self.fmt == 'tar':
+            self._archive = tarfile.open(path, 'w')
+        elif self.fmt == 'zip':
+            # 图像已压缩，归档内只存储不再压缩
+            self._archive = zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_STORED)
+        else:
+            self._buffer = np.empty((self.shard_size,) + self._image_shape, dtype=np.uint8)
+            self._buffer_count = 0
+        self.shards.append(name)
+
+    def _close_shard(self):
+        """写完当前分片"""
+        if self.fmt == 'npy':
+            if self._buffer is not None and self._buffer_count > 0:
+                np.save(os.path.join(self.folder, self.shards[-1]), self._buffer[:self._buffer_count])
+            self._buffer = None
+        elif self._archive is not None:
+            self._archive.close()
+            self._archive = None
+
+    def _next_shard(self):
+        """按已写入数量切换分片，返回当前分片序号"""
+        if len(self.entries) % self.shard_size == 0:
+            self._close_shard()
+            self._open_shard()
+        return len(self.shards) - 1
+
+    def add(self, text, image):
+        """
+        追加一张验证码
+        :param text: 验证码文本
+        :param image: PIL图像对象
+        :return: 归档内的条目名
+        """
+        if self._image_size is None:
+            self._image_size = image.size
+            self._image_shape = np.asarray(image).shape
+
+        if self.fmt != 'npy':
+            return super().add(text, image)
+
+        # npy分片直接拷贝像素，无需编码
+        self.count += 1
+        name = self._entry_name(self.count, text)
+        shard = self._next_shard()
+        offset = self._buffer_count
+        self._buffer[offset] = image
+        self._buffer_count += 1
+        self.entries.append({'name': name, 'label': text, 'shard': shard, 'offset': offset,
+                             'size': self._buffer[offset].nbytes})
+        return name
+
+    def _entry_name(self, number, text):
+        extension = '.npy' if self.fmt == 'npy' else self.encoder.extension
+        return f"captcha_{number:06d}_{text}{extension}"
+
+    def _write(self, name, text, data):
+        """把编码好的图像写入当前tar/zip分片（索引中的偏移为图像数据在分片文件中的起始位置）"""
+        shard = self._next_shard()
+        if self.fmt == 'tar':
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            # 写入模式下addfile不会设置offset_data：数据紧跟在成员头之后，按写入前的位置和头的长度计算
+            header = info.tobuf(self._archive.format, self._archive.encoding, self._archive.errors)
+            offset = self._archive.offset + len(header)
+            self._archive.addfile(info, io.BytesIO(data))
+        else:
+            # 分片不压缩，数据紧跟在本地文件头之后写入，写完时文件位置就是数据的结尾
+            self._archive.writestr(name, data)
+            offset = self._archive.fp.tell() - len(data)
+        self.entries.append({'name': name, 'label': text, 'shard': shard, 'offset': offset, 'size': len(data)})
+
+    def close(self):
+        """写完最后一个分片并保存索引"""
+        super().close()
+        self._close_shard()
+        index = {
+            'format': self.fmt,
+            'encoding': None if self.fmt == 'npy' else self.encoder.spec,
+            'count': self.count,
+            'shard_size': self.shard_size,
+            'shards': self.shards,
+            'image_size': list(self._image_size) if self._image_size else None,
+            'image_shape': list(self._image_shape) if self._image_shape else None,
+            'entries': self.entries
+        }
+        with open(os.path.join(self.folder, INDEX_FILE), 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False)
+
+
+def open_batch_writer(folder, output='png', shard_size=None, image_format=None):
+    """
+    按输出格式创建批量写入器
+    :param folder: 保存文件夹
+    :param output: 'png'（逐个图像文件）或归档格式 'tar'/'zip'/'npy'
+    :param shard_size: 归档分片大小
+    :param image_format: 图像编码格式描述（如'png:1'、'webp:80'，默认PNG）
+    :return: 写入器（支持add/close和with语句）
+    """
+    encoder = ImageEncoder.from_spec(image_format)
+    if output == 'png':
+        return ImageFolderWriter(folder, encoder)
+    return ShardedArchiveWriter(folder, output, shard_size, encoder)
+
+
+def is_archive(path):
+    """判断路径是否为分片归档文件夹"""
+    return os.path.isfile(os.path.join(path, INDEX_FILE))
+
+
+def load_index(path):
+    """读取归档索引"""
+    with open(os.path.join(path, INDEX_FILE), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def iter_archive(path):
+    """
+    流式遍历分片归档（逐个分片顺序读取，不解包到磁盘）
+    :param path: 归档文件夹
+    :return: 生成器，每次返回(条目名, 标签, PIL图像)
+    """
+    index = load_index(path)
+    fmt = index['format']
+
+    if fmt == 'npy':
+        entries = iter(index['entries'])
+        for images, _ in iter_array_shards(path, index):
+            for image in images:
+                entry = next(entries)
+                yield entry['name'], entry['label'], Image.fromarray(np.asarray(image))
+        return
+
+    labels = {entry['name']: entry['label'] for entry in index['entries']}
+    raw_size = tuple(index['image_size']) if index.get('encoding') == 'raw' else None
+
+    def decode(data):
+        if raw_size:
+            return Image.frombytes('L', raw_size, data)
+        image = Image.open(io.BytesIO(data))
+        image.load()
+        return image
+
+    for shard in index['shards']:
+        shard_path = os.path.join(path, shard)
+        if fmt == 'tar':
+            # 流式模式：按顺序读取成员，无需随机访问
+            with tarfile.open(shard_path, 'r|') as archive:
+                for member in archive:
+                    if not member.isfile():
+                        continue
+                    data = archive.extractfile(member).read()
+                    yield member.name, labels.get(member.name), decode(data)
+        else:
+            with zipfile.ZipFile(shard_path, 'r') as archive:
+                for info in archive.infolist():
+                    with archive.open(info) as member:
+                        data = member.read()
+                    yield info.filename, labels.get(info.filename), decode(data)
+
+
+def iter_array_shards(path, index=None):
+    """
+    以内存映射方式逐个读取npy分片（训练时可直接使用整块数组）
+    :param path: 归档文件夹
+    :param index: 已读取的索引（可选）
+    :return: 生成器，每次返回(图像数组, 标签列表)
+    """
+    index = index or load_index(path)
+    if index['format'] != 'npy':
+        raise ValueError(f"归档格式不是npy: {index['format']}")
+
+    entries = index['entries']
+    start = 0
+    for shard in index['shards']:
+        images = np.load(os.path.join(path, shard), mmap_mode='r')
+        labels = [entry['label'] for entry in entries[start:start + len(images)]]
+        start += len(images)
+        yield images, labels
@@ -0,0 +1,166 @@
+import io
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class EncoderStats:
+    """按格式汇总编码字节数和耗时（用于在延迟和体积之间做取舍）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, spec, size, seconds):
+        with self._lock:
+            entry = self._stats.setdefault(spec, {'count': 0, 'bytes': 0, 'seconds': 0.0})
+            entry['count'] += 1
+            entry['bytes'] += size
+            entry['seconds'] += seconds
+
+    def snapshot(self):
+        """
+        获取统计快照
+        :return: {格式: {count, bytes, avg_bytes, avg_ms}}
+        """
+        with self._lock:
+            return {
+                spec: {
+                    'count': entry['count'],
+                    'bytes': entry['bytes'],
+                    'avg_bytes': entry['bytes'] / entry['count'],
+                    'avg_ms': entry['seconds'] * 1000 / entry['count']
+                }
+                for spec, entry in self._stats.items() if entry['count'] > 0
+            }
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+# 进程内所有编码器共享的统计
+encoder_stats = EncoderStats()
+
+# 编码线程池（Pillow编码时释放GIL，与渲染线程并行）
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """获取共享的编码线程池"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1),
+                                               thread_name_prefix='image-encoder')
+    return _executor
+
+
+class ImageEncoder:
+    """可选格式的图像编码器"""
+
+    FORMATS = ('png', 'webp', 'jpeg', 'raw')
+    EXTENSIONS = {'png': '.png', 'webp': '.webp', 'jpeg': '.jpg', 'raw': '.raw'}
+    MIME_TYPES = {'png': 'image/png', 'webp': 'image/webp', 'jpeg': 'image/jpeg',
+                  'raw': 'application/octet-stream'}
+
+    def __init__(self, fmt='png', compress_level=None, quality=None, lossless=False):
+        """
+        初始化编码器
+        :param fmt: 格式 ('png', 'webp', 'jpeg', 'raw'灰度原始字节)
+        :param compress_level: PNG压缩级别0-9（None为Pillow默认值6）
+        :param quality: WebP/JPEG质量
+        :param lossless: WebP是否无损
+        """
+        if fmt not in self.FORMATS:
+            raise ValueError(f"不支持的图像格式: {fmt}")
+        self.fmt = fmt
+        self.compress_level = compress_level
+        self.quality = quality
+        self.lossless = lossless
+
+    @classmethod
+    def from_spec(cls, spec):
+        """
+        从格式描述创建编码器，例如 'png', 'png:1', 'webp:80', 'webp:lossless', 'jpeg:90', 'raw'
+        :param spec: 格式描述字符串
+        :return: ImageEncoder
+        """
+        fmt, _, option = (spec or 'png').lower().partition(':')
+        if fmt == 'jpg':
+            fmt = 'jpeg'
+        if fmt == 'png':
+            return cls(fmt, compress_level=cls._parse_option(spec, option, 0, 9))
+        if fmt == 'webp' and option == 'lossless':
+            return cls(fmt, lossless=True)
+        if fmt in ('webp', 'jpeg'):
+            return cls(fmt, quality=cls._parse_option(spec, option, 0, 100))
+        if option:
+            raise ValueError(f"图像格式不支持参数: {spec}")
+        return cls(fmt)
+
+    @staticmethod
+    def _parse_option(spec, option, low, high):
+        """解析压缩级别/质量参数（没有参数时返回None）"""
+        if not option:
+            return None
+        try:
+            value = int(option)
+        except ValueError:
+            raise ValueError(f"无效的图像格式参数: {spec}") from None
+        if not low <= value <= high:
+            raise ValueError(f"图像格式参数超出范围({low}-{high}): {spec}")
+        return value
+
+    @property
+    def spec(self):
+        """格式描述（统计时的键）"""
+        if self.fmt == 'png' and self.compress_level is not None:
+            return f"png:{self.compress_level}"
+        if self.fmt == 'webp' and self.lossless:
+            return 'webp:lossless'
+        if self.fmt in ('webp', 'jpeg') and self.quality is not None:
+            return f"{self.fmt}:{self.quality}"
+        return self.fmt
+
+    @property
+    def extension(self):
+        return self.EXTENSIONS[self.fmt]
+
+    @property
+    def mime_type(self):
+        return self.MIME_TYPES[self.fmt]
+
+    def encode(self, image):
+        """
+        编码图像并记录字节数和耗时
+        :param image: PIL图像对象
+        :return: 编码后的字节
+        """
+        start = time.perf_counter()
+        if self.fmt == 'raw':
+            data = (image if image.mode == 'L' else image.convert('L')).tobytes()
+        else:
+            options = {}
+            if self.compress_level is not None:
+                options['compress_level'] = self.compress_level
+            if self.quality is not None:
+                options['quality'] = self.quality
+            if self.lossless:
+                options['lossless'] = True
+            buffer = io.BytesIO()
+            image.save(buffer, format=self.fmt.upper(), **options)
+            data = buffer.getvalue()
+        encoder_stats.record(self.spec, len(data), time.perf_counter() - start)
+        return data
+
+    def submit(self, image):
+        """
+        在编码线程池中异步编码
+        :param image: PIL图像对象
+        :return: Future，结果为编码后的字节
+        """
+        return get_executor().submit(self.encode, image)
@@ -3,6 +3,7 @@ import sys
 import json
 import base64
 import io
+import math
 import threading
 from datetime import datetime
 from functools import wraps
@@ -15,14 +16,34 @@ from PIL import Image
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from captcha_generator.generator import CaptchaGenerator
+from captcha_generator.pool import CaptchaPool
 from captcha_recognizer.traditional_recognizer import TraditionalCaptchaRecognizer
 from captcha_recognizer.ml_recognizer import MLCaptchaRecognizer
+from captcha_recognizer.dataset import DatasetWatcher
 from utils.utils import HistoryManager, validate_captcha
+from utils.archive import ARCHIVE_FORMATS, INDEX_FILE, open_batch_writer
+from captcha_recognizer.cache import configure_recognition_cache, get_recognition_cache
+from captcha_recognizer.events import event_log, LEVELS
+from utils.encoder import ImageEncoder, encoder_stats
 
 app = Flask(__name__)
 app.secret_key = os.urandom(24)  # 用于session加密
 app.config['UPLOAD_FOLDER'] = 'data/uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+# 验证码池配置（低于低水位时后台补充到高水位）
+app.config['CAPTCHA_POOL_LOW_WATER'] = 20
+app.config['CAPTCHA_POOL_HIGH_WATER'] = 100
+app.config['CAPTCHA_POOL_WORKERS'] = 2
+# 图像编码格式（如 'png', 'png:1', 'webp:80', 'jpeg:90'），/api/generate的图片只展示一次，使用低压缩级别
+app.config['GENERATE_IMAGE_FORMAT'] = 'png:1'
+app.config['BATCH_IMAGE_FORMAT'] = 'png'
+# 识别结果缓存（按像素哈希，所有用户共享；RECOGNITION_CACHE_DIR为None时只缓存在内存中）
+app.config['RECOGNITION_CACHE_SIZE'] = 1024
+app.config['RECOGNITION_CACHE_DIR'] = None
+# 单次识别的时间预算（秒），请求中的budget不能超过该值；用完后返回已有的最佳结果并标记timed_out
+app.config['RECOGNITION_BUDGET'] = 5.0
+# 开启自动更新后检查数据集新样本的间隔（秒）
+app.config['DATASET_WATCH_INTERVAL'] = 30.0
 
 # 创建必要的目录
 os.makedirs('data/captchas', exist_ok=True)
@@ -38,6 +59,17 @@ for char in characters:
     char_folder = os.path.join('data/dataset', char)
     os.makedirs(char_folder, exist_ok=True)
 
+# 预生成验证码池（所有用户共享，/api/generate只需出队）
+captcha_pool = CaptchaPool(
+    low_water=app.config['CAPTCHA_POOL_LOW_WATER'],
+    high_water=app.config['CAPTCHA_POOL_HIGH_WATER'],
+    workers=app.config['CAPTCHA_POOL_WORKERS'],
+    presets=[('simple', 4), ('medium', 5), ('hard', 5)],
+    encoder=ImageEncoder.from_spec(app.config['GENERATE_IMAGE_FORMAT'])
+)
+
+configure_recognition_cache(app.config['RECOGNITION_CACHE_SIZE'], app.config['RECOGNITION_CACHE_DIR'])
+
 # 用户系统实例存储（使用字典存储，因为session不能存储对象）
 user_systems = {}
 
@@ -62,6 +94,22 @@ def init_user_system():
     """初始化用户系统组件（兼容性函数）"""
     return get_user_system()
 
+def set_dataset_watcher(system, dataset_path):
+    """
+    开启或关闭数据集自动更新（出现新样本时在后台增量更新该用户当前的模型）
+    :param system: 用户系统实例
+    :param dataset_path: 数据集路径，None表示关闭
+    """
+    watcher = system.pop('dataset_watcher', None)
+    if watcher is not None:
+        watcher.stop()
+    if dataset_path:
+        watcher = DatasetWatcher(dataset_path, system['ml_recognizer'].characters,
+                                 lambda path: system['ml_recognizer'].update(path),
+                                 app.config['DATASET_WATCH_INTERVAL'])
+        watcher.start()
+        system['dataset_watcher'] = watcher
+
 # 用户管理
 USERS_FILE = 'data/users.json'
 
@@ -249,7 +297,8 @@ def logout():
     """登出"""
     user_id = session.get('user_id')
     if user_id and user_id in user_systems:
-        # 清理用户系统实例
+        # 停止该用户的数据集自动更新（后台线程），再清理用户系统实例
+        set_dataset_watcher(user_systems[user_id], None)
         del user_systems[user_id]
     session.clear()
     return redirect(url_for('login'))
@@ -277,30 +326,24 @@ def api_generate():
         difficulty = data.get('difficulty', 'medium')
         length = int(data.get('length', 5))
         
+        if difficulty not in CaptchaPool.DIFFICULTIES:
+            return jsonify({'error': '无效的难度级别'}), 400
+        
         system = init_user_system()
-        generator = system['generator']
         
-        if difficulty == 'simple':
-            text, image = generator.generate_simple_captcha(length)
-        elif difficulty == 'medium':
-            text, image = generator.generate_medium_captcha(length)
-        elif difficulty == 'hard':
-            text, image = generator.generate_hard_captcha(length)
-        else:
-            return jsonify({'error': '无效的难度级别'}), 400
+        # 从验证码池取出已生成并编码好的验证码
+        text, image_bytes = captcha_pool.get(difficulty, length)
         
         # 保存到session
         system['current_captcha_text'] = text
         
         # 将图像转换为base64
-        img_buffer = io.BytesIO()
-        image.save(img_buffer, format='PNG')
-        img_str = base64.b64encode(img_buffer.getvalue()).decode()
+        img_str = base64.b64encode(image_bytes).decode()
         
         return jsonify({
             'success': True,
             'text': text,
-            'image': f'data:image/png;base64,{img_str}'
+            'image': f'data:{captcha_pool.encoder.mime_type};base64,{img_str}'
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -317,6 +360,20 @@ def api_recognize():
     try:
         data = request.get_json()
         method = data.get('method', 'tesseract')
+        # 可选：验证码难度（用于调整Tesseract策略顺序）
+        difficulty = data.get('difficulty')
+        if difficulty not in CaptchaPool.DIFFICULTIES:
+            difficulty = None
+        # 可选：时间预算（秒），不超过服务器配置的上限
+        budget = app.config['RECOGNITION_BUDGET']
+        try:
+            if data.get('budget') is not None:
+                requested = float(data['budget'])
+                if not math.isfinite(requested) or requested <= 0:
+                    return jsonify({'error': 'budget必须是正数（秒）'}), 400
+                budget = requested if budget is None else min(requested, budget)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'budget必须是数字（秒）'}), 400
         
         system = init_user_system()
         
@@ -341,7 +398,7 @@ def api_recognize():
         error_msg = None
         try:
             if method == 'tesseract':
-                result = system['traditional_recognizer'].recognize_with_tesseract(image)
+                result = system['traditional_recognizer'].recognize_with_tesseract(image, difficulty, budget)
                 if not result:
                     error_msg = 'Tesseract识别失败，可能未安装Tesseract OCR或路径未配置'
             elif method == 'template':
@@ -349,13 +406,14 @@ def api_recognize():
                 # web_app.py 在 szcryzm/ 目录下，模板文件夹在 szcryzm/data/templates
                 base_dir = os.path.dirname(os.path.abspath(__file__))
                 template_folder = os.path.join(base_dir, 'data', 'templates')
-                result = system['traditional_recognizer'].recognize_with_template_matching(image, template_folder)
+                result = system['traditional_recognizer'].recognize_with_template_matching(
+                    image, template_folder, budget=budget)
                 if not result:
                     error_msg = '模板匹配失败，可能模板文件夹不存在或未找到匹配模板'
             elif method == 'ml':
                 if system['ml_recognizer'].model is None:
                     return jsonify({'error': '模型未加载，请先训练模型'}), 400
-                result = system['ml_recognizer'].predict(image)
+                result = system['ml_recognizer'].predict(image, budget=budget)
                 if not result:
                     error_msg = '机器学习识别失败，可能无法分割字符或模型预测出错'
             else:
@@ -365,9 +423,13 @@ def api_recognize():
             error_msg = f'识别过程出错: {str(e)}'
             print(f"识别错误: {traceback.format_exc()}")
         
+        timed_out = bool(getattr(result, 'timed_out', False))
+        if not result and timed_out:
+            error_msg = f'识别超时（时间预算{budget}秒内没有得到结果）'
+        
         # 如果识别失败，返回错误
         if not result and error_msg:
-            return jsonify({'error': error_msg, 'result': ''}), 400
+            return jsonify({'error': error_msg, 'result': '', 'timed_out': timed_out}), 400
         
         # 验证结果
         correct_text = system.get('current_captcha_text', '')
@@ -377,7 +439,7 @@ def api_recognize():
         system['history_manager'].add_record(
             correct_text or 'unknown',
             result,
-            'unknown',
+            difficulty or 'unknown',
             method,
             success
         )
@@ -386,7 +448,8 @@ def api_recognize():
             'success': True,
             'result': result,
             'correct': correct_text,
-            'match': success
+            'match': success,
+            'timed_out': timed_out
         })
     except Exception as e:
         import traceback
@@ -433,31 +496,52 @@ def api_batch_generate():
         count = int(data.get('count', 10))
         difficulty = data.get('difficulty', 'medium')
         length = int(data.get('length', 5))
+        seed = data.get('seed')
+        try:
+            seed = int(seed) if seed not in (None, '') else None
+        except (TypeError, ValueError):
+            return jsonify({'error': 'seed必须是非负整数'}), 400
+        if seed is not None and seed < 0:
+            return jsonify({'error': 'seed必须是非负整数'}), 400
+        # 输出格式：png（逐个文件）或分片归档 tar/zip/npy
+        output = data.get('output', 'png')
+        if output != 'png' and output not in ARCHIVE_FORMATS:
+            return jsonify({'error': f'无效的输出格式: {output}'}), 400
+        # 图像编码格式，例如 'png:1'、'webp:80'、'raw'（raw仅限归档）
+        image_format = data.get('image_format') or app.config['BATCH_IMAGE_FORMAT']
+        try:
+            encoder = ImageEncoder.from_spec(image_format)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if encoder.fmt == 'raw' and output == 'png':
+            return jsonify({'error': 'raw格式缺少尺寸信息，只能用于tar/zip归档'}), 400
         
         system = init_user_system()
         generator = system['generator']
         
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         folder = f"data/captchas/batch_{session.get('user_id', 'default')}_{timestamp}"
-        os.makedirs(folder, exist_ok=True)
         
         results = []
-        batch_gen = generator.batch_generate(count, difficulty, length)
-        
-        for i, (text, image) in enumerate(batch_gen, 1):
-            filename = f"captcha_{i:03d}_{text}.png"
-            filepath = os.path.join(folder, filename)
-            image.save(filepath)
-            results.append({
-                'index': i,
-                'text': text,
-                'filename': filename
-            })
+        # 数量较多时使用多进程并行生成，指定seed时结果可复现
+        batch_gen = generator.batch_generate(count, difficulty, length, seed=seed, workers=None)
+        
+        with open_batch_writer(folder, output, image_format=image_format) as writer:
+            for i, (text, image) in enumerate(batch_gen, 1):
+                filename = writer.add(text, image)
+                results.append({
+                    'index': i,
+                    'text': text,
+                    'filename': filename
+                })
         
         return jsonify({
             'success': True,
             'count': len(results),
             'folder': folder,
+            'output': output,
+            'image_format': image_format,
+            'seed': seed,
             'results': results
         })
     except Exception as e:
@@ -504,6 +588,9 @@ def api_train():
         data = request.get_json()
         dataset_path = data.get('dataset_path', 'data/dataset')
         model_type = data.get('model_type', 'knn')
+        # 可选：增量更新（只把新样本加入当前模型）；自动更新（后台监视数据集，出现新样本时增量更新）
+        incremental = bool(data.get('incremental', False))
+        auto_update = data.get('auto_update')
         
         # 检查数据集路径
         if not dataset_path:
@@ -541,15 +628,37 @@ def api_train():
             dataset_info += f" 等共{len(folders_with_data)}个文件夹"
         
         system = init_user_system()
-        system['ml_recognizer'] = MLCaptchaRecognizer(model_type)
+        # 增量更新沿用当前的同类型模型，否则重新创建
+        if not (incremental and system['ml_recognizer'].model_type == model_type):
+            system['ml_recognizer'] = MLCaptchaRecognizer(model_type)
         
         try:
-            accuracy = system['ml_recognizer'].train(dataset_path)
+            if incremental:
+                update = system['ml_recognizer'].update(dataset_path)
+                accuracy = update.get('accuracy')
+            else:
+                update = {'mode': 'full'}
+                accuracy = system['ml_recognizer'].train(dataset_path)
+            
+            if auto_update is not None:
+                set_dataset_watcher(system, dataset_path if auto_update else None)
             
-            if accuracy > 0:
+            if accuracy is None:
+                # 增量更新没有重新划分测试集，不计算准确率
+                return jsonify({
+                    'success': True,
+                    'mode': update['mode'],
+                    'new_samples': update['new_samples'],
+                    'auto_update': 'dataset_watcher' in system,
+                    'message': f"增量更新完成，新增样本{update['new_samples']}个",
+                    'dataset_info': dataset_info
+                })
+            elif accuracy > 0:
                 return jsonify({
                     'success': True,
                     'accuracy': accuracy,
+                    'mode': update['mode'],
+                    'auto_update': 'dataset_watcher' in system,
                     'message': f'训练完成，准确率: {accuracy:.2%}',
                     'dataset_info': dataset_info if 'dataset_info' in locals() else ''
                 })
@@ -633,6 +742,7 @@ def api_admin_delete_user(username):
         
         # 删除用户系统实例
         if username in user_systems:
+            set_dataset_watcher(user_systems[username], None)
             del user_systems[username]
         
         # 从用户列表中删除
@@ -697,12 +807,12 @@ def api_admin_statistics():
                 except:
                     pass
         
-        # 统计文件大小
+        # 统计文件大小（归档批次只统计分片文件和索引）
         captcha_files = 0
         captcha_size = 0
         for root, dirs, files in os.walk('data/captchas'):
             for file in files:
-                if file.endswith(('.png', '.jpg')):
+                if file.endswith(('.png', '.jpg', '.webp', '.tar', '.zip', '.npy')) or file == INDEX_FILE:
                     captcha_files += 1
                     filepath = os.path.join(root, file)
                     captcha_size += os.path.getsize(filepath)
@@ -744,6 +854,58 @@ def api_admin_statistics():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/admin/pool', methods=['GET'])
+@admin_required
+def api_admin_pool():
+    """获取验证码池统计信息（命中率、各分组库存）"""
+    try:
+        return jsonify({'success': True, 'pool': captcha_pool.stats()})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/encoding', methods=['GET'])
+@admin_required
+def api_admin_encoding():
+    """获取各图像格式的编码字节数和耗时统计"""
+    try:
+        return jsonify({'success': True, 'encoding': encoder_stats.snapshot()})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/recognition-cache', methods=['GET', 'DELETE'])
+@admin_required
+def api_admin_recognition_cache():
+    """获取识别缓存统计（命中率、条目数），DELETE清空内存中的缓存"""
+    try:
+        cache = get_recognition_cache()
+        if request.method == 'DELETE':
+            cache.clear()
+        return jsonify({'success': True, 'cache': cache.stats()})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/events', methods=['GET', 'POST'])
+@admin_required
+def api_admin_events():
+    """查看识别事件（GET参数stage、limit），POST {"level": "debug"/"info"/"warning"/null} 开启或关闭记录"""
+    try:
+        if request.method == 'POST':
+            level = (request.get_json() or {}).get('level')
+            if level is None:
+                event_log.disable()
+            elif level in LEVELS:
+                event_log.enable(level)
+            else:
+                return jsonify({'error': f'无效的级别: {level}'}), 400
+        limit = request.args.get('limit', 200, type=int)
+        return jsonify({
+            'success': True,
+            'enabled': event_log.level is not None,
+            'events': event_log.events(request.args.get('stage'), limit)
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/admin/cleanup', methods=['POST'])
 @admin_required
 def api_admin_cleanup():
@@ -759,7 +921,7 @@ def api_admin_cleanup():
             count = 0
             for root, dirs, files in os.walk('data/captchas'):
                 for file in files:
-                    if file.endswith(('.png', '.jpg')):
+                    if file.endswith(('.png', '.jpg', '.webp', '.tar', '.zip', '.npy')) or file == INDEX_FILE:
                         filepath = os.path.join(root, file)
                         os.remove(filepath)
                         count += 1